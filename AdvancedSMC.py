@@ -1,124 +1,205 @@
 # --- Imports ---
 import numpy as np
-import pandas as pd
 from datetime import datetime
 import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from functools import reduce
-from craw_data import fetch_ohlcv, calculate_indicators
+from numpy.lib.stride_tricks import sliding_window_view
+from craw_data import fetch_candles, calculate_indicators, timeframe_to_ms
+from htf_cache import HTFFeatureCache
+from liquidity import detect_liquidity_pools
+from structure import compute_structure
+from ohlcv import OHLCV
+from shared_candles import SharedCandleStore
 
 logger = logging.getLogger(__name__)
 
-def analyze_smc_features(df: pd.DataFrame, swing_lookback: int = 20) -> pd.DataFrame:
+# Các cột do analyze_smc_features thêm vào (theo đúng thứ tự cũ)
+SMC_FEATURE_COLUMNS = (
+    'swing_high', 'swing_low', 'bos_choch_signal', 'BOS', 'CHOCH',
+    'OB', 'Top_OB', 'Bottom_OB', 'FVG', 'Top_FVG', 'Bottom_FVG', 'Swept'
+)
+# Các cột tín hiệu do populate_entry/exit ghi vào
+SMC_SIGNAL_COLUMNS = ('enter_long', 'enter_short', 'enter_tag', 'exit_long', 'exit_short')
+
+_INT_COLUMNS = ('bos_choch_signal', 'BOS', 'CHOCH', 'OB', 'FVG', 'Swept')
+_FLOAT_COLUMNS = ('Top_OB', 'Bottom_OB', 'Top_FVG', 'Bottom_FVG')
+_BOOL_COLUMNS = ('swing_high', 'swing_low')
+
+
+class SMCFeatures:
     """
-    Hàm này phân tích và thêm các cột SMC vào DataFrame.
-    
+    Kết quả phân tích SMC dạng mảng numpy, cấp phát sẵn một lần theo số nến.
+    Nến gốc (OHLCV) được giữ theo tham chiếu, không sao chép.
+    Truy cập theo tên cột giống DataFrame: features['BOS'], features['close']...
+    """
+
+    def __init__(self, candles, columns=None):
+        self.candles = candles
+        n = len(candles)
+        if columns is None:
+            int_block = np.zeros((len(_INT_COLUMNS), n), dtype=np.int8)
+            float_block = np.full((len(_FLOAT_COLUMNS), n), np.nan)
+            bool_block = np.zeros((len(_BOOL_COLUMNS), n), dtype=bool)
+            columns = {}
+            columns.update(zip(_INT_COLUMNS, int_block))
+            columns.update(zip(_FLOAT_COLUMNS, float_block))
+            columns.update(zip(_BOOL_COLUMNS, bool_block))
+        self._columns = columns
+        self._allocate_signals()
+
+    def _allocate_signals(self):
+        n = len(self.candles)
+        signal_block = np.zeros((4, n), dtype=np.int8)
+        self._columns.update(zip(('enter_long', 'enter_short', 'exit_long', 'exit_short'), signal_block))
+        self._columns['enter_tag'] = np.full(n, '', dtype=object)
+
+    def derive(self):
+        """Bản dùng chung các mảng phân tích nhưng có cột tín hiệu riêng (để merge HTF)"""
+        return SMCFeatures(self.candles, dict(self._columns))
+
+    def __len__(self):
+        return len(self.candles)
+
+    def __contains__(self, name):
+        return name in self._columns or name in ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            return self.candles[name]
+        return column
+
+    def __setitem__(self, name, values):
+        self._columns[name] = values
+
+    @property
+    def columns(self):
+        return ['timestamp', 'open', 'high', 'low', 'close', 'volume'] + list(self._columns)
+
+    def to_frame(self):
+        """DataFrame gồm nến và tất cả các cột phân tích"""
+        df = self.candles.to_frame()
+        for name, values in self._columns.items():
+            df[name] = values
+        return df
+
+
+def _shift(values):
+    """Giống Series.shift(1): phần tử đầu là NaN"""
+    shifted = np.empty(len(values), dtype=np.float64)
+    shifted[:1] = np.nan
+    shifted[1:] = values[:-1]
+    return shifted
+
+
+def compute_smc_features(candles, swing_lookback: int = 20, out=None, structure_lookbacks=()):
+    """
+    Phân tích SMC trên mảng nến và ghi kết quả vào các mảng cấp phát sẵn.
+
     Args:
-        df (DataFrame): Bảng dữ liệu OHLCV.
+        candles (OHLCV): Dữ liệu nến (không bị sửa đổi).
         swing_lookback (int): Số nến để xác định đỉnh/đáy.
+        out (SMCFeatures): Vùng kết quả dùng lại (tùy chọn).
+        structure_lookbacks: Các lookback cấu trúc bổ sung (ví dụ 5 cho internal structure),
+            tính cùng lượt với swing_lookback; kết quả ở các cột swing_high_<n>, swing_low_<n>,
+            bos_choch_signal_<n>, BOS_<n>, CHOCH_<n>.
 
     Returns:
-        DataFrame: Bảng dữ liệu đã được thêm các cột phân tích SMC.
+        SMCFeatures: Các cột phân tích SMC.
     """
-    
-    # --- 1. Xác định Swing Highs & Swing Lows ---
-    df['swing_high'] = df['high'].rolling(window=swing_lookback*2+1, center=True).max() == df['high']
-    df['swing_low'] = df['low'].rolling(window=swing_lookback*2+1, center=True).min() == df['low']
-    
-    # --- 2. Xác định Break of Structure (BOS) và Change of Character (CHoCH) ---
-    last_swing_high = np.nan
-    last_swing_low = np.nan
-    trend = 0  # 1 for bullish, -1 for bearish
-    
-    bos_choch = []
-    
-    for i in range(len(df)):
-        is_swing_high = df['swing_high'].iloc[i]
-        is_swing_low = df['swing_low'].iloc[i]
-        current_high = df['high'].iloc[i]
-        current_low = df['low'].iloc[i]
-        
-        signal = 0 # 1: Bullish BOS, -1: Bearish BOS, 2: Bullish CHoCH, -2: Bearish CHoCH
-        
-        if is_swing_high:
-            last_swing_high = current_high
-        if is_swing_low:
-            last_swing_low = current_low
-
-        if trend == 1 and not np.isnan(last_swing_low) and current_low < last_swing_low:
-            signal = -2 # Bearish CHoCH
-            trend = -1
-            last_swing_high = np.nan # Reset
-        elif trend == -1 and not np.isnan(last_swing_high) and current_high > last_swing_high:
-            signal = 2 # Bullish CHoCH
-            trend = 1
-            last_swing_low = np.nan # Reset
-        elif not np.isnan(last_swing_high) and current_high > last_swing_high:
-            signal = 1 # Bullish BOS
-            trend = 1
-            last_swing_low = np.nan # Reset
-        elif not np.isnan(last_swing_low) and current_low < last_swing_low:
-            signal = -1 # Bearish BOS
-            trend = -1
-            last_swing_high = np.nan # Reset
-            
-        bos_choch.append(signal)
+    features = out if out is not None else SMCFeatures(candles)
+    n = len(candles)
+    open_, high, low, close = candles.open, candles.high, candles.low, candles.close
+
+    # --- 1 + 2. Swing Highs/Lows và BOS/CHoCH cho mọi scale (xem structure.py) ---
+    structure = compute_structure(high, low, (swing_lookback, *structure_lookbacks))
+    base = structure[swing_lookback]
+    features['swing_high'][:] = base['swing_high']
+    features['swing_low'][:] = base['swing_low']
+    bos_choch = features['bos_choch_signal']
+    bos_choch[:] = base['bos_choch_signal']
+    for lookback, scale in structure.items():
+        if lookback == swing_lookback:
+            continue
+        features[f'swing_high_{lookback}'] = scale['swing_high']
+        features[f'swing_low_{lookback}'] = scale['swing_low']
+        features[f'bos_choch_signal_{lookback}'] = scale['bos_choch_signal']
+        features[f'BOS_{lookback}'] = np.where(np.abs(scale['bos_choch_signal']) == 1,
+                                               scale['bos_choch_signal'], 0).astype(np.int8)
+        features[f'CHOCH_{lookback}'] = np.where(np.abs(scale['bos_choch_signal']) == 2,
+                                                 scale['bos_choch_signal'] // 2, 0).astype(np.int8)
 
-    df['bos_choch_signal'] = bos_choch
-    df['BOS'] = df['bos_choch_signal'].apply(lambda x: 1 if x == 1 else (-1 if x == -1 else 0))
-    df['CHOCH'] = df['bos_choch_signal'].apply(lambda x: 1 if x == 2 else (-1 if x == -2 else 0))
+    features['BOS'][bos_choch == 1] = 1
+    features['BOS'][bos_choch == -1] = -1
+    features['CHOCH'][bos_choch == 2] = 1
+    features['CHOCH'][bos_choch == -2] = -1
 
     # --- 3. Xác định Order Blocks (OB) ---
-    df['OB'] = 0
-    df['Top_OB'] = np.nan
-    df['Bottom_OB'] = np.nan
-
-    for i in range(1, len(df)):
-        # Nếu có tín hiệu tăng giá mạnh
-        if df['bos_choch_signal'].iloc[i] in [1, 2]:
-            # Tìm nến giảm gần nhất
-            for j in range(i - 1, max(0, i - 10), -1):
-                if df['close'].iloc[j] < df['open'].iloc[j]: # Nến giảm
-                    df.loc[df.index[j], 'OB'] = 1 # Bullish OB
-                    df.loc[df.index[j], 'Top_OB'] = df['high'].iloc[j]
-                    df.loc[df.index[j], 'Bottom_OB'] = df['low'].iloc[j]
-                    break
-        # Nếu có tín hiệu giảm giá mạnh
-        elif df['bos_choch_signal'].iloc[i] in [-1, -2]:
-            # Tìm nến tăng gần nhất
-            for j in range(i - 1, max(0, i - 10), -1):
-                if df['close'].iloc[j] > df['open'].iloc[j]: # Nến tăng
-                    df.loc[df.index[j], 'OB'] = -1 # Bearish OB
-                    df.loc[df.index[j], 'Top_OB'] = df['high'].iloc[j]
-                    df.loc[df.index[j], 'Bottom_OB'] = df['low'].iloc[j]
-                    break
-    
-    # --- 4. Xác định Fair Value Gaps (FVG) ---
-    df['FVG'] = 0
-    df['Top_FVG'] = np.nan
-    df['Bottom_FVG'] = np.nan
+    # Nến giảm/tăng gần nhất tính đến mỗi vị trí (-1 nếu chưa có)
+    positions = np.arange(n)
+    last_bearish = np.maximum.accumulate(np.where(close < open_, positions, -1)) if n else positions
+    last_bullish = np.maximum.accumulate(np.where(close > open_, positions, -1)) if n else positions
 
-    for i in range(2, len(df)):
+    ob, top_ob, bottom_ob = features['OB'], features['Top_OB'], features['Bottom_OB']
+    for i in np.flatnonzero(bos_choch).tolist():
+        if i == 0:
+            continue
+        # Tìm trong 9 nến trước tín hiệu (không tính nến max(0, i - 10))
+        if bos_choch[i] > 0:
+            j, direction = last_bearish[i - 1], 1  # Bullish OB
+        else:
+            j, direction = last_bullish[i - 1], -1  # Bearish OB
+        if j > max(0, i - 10):
+            ob[j] = direction
+            top_ob[j] = high[j]
+            bottom_ob[j] = low[j]
+
+    # --- 4. Xác định Fair Value Gaps (FVG) ---
+    if n > 2:
         # Bullish FVG: Đáy nến 1 > Đỉnh nến 3
-        if df['low'].iloc[i-2] > df['high'].iloc[i]:
-            df.loc[df.index[i-1], 'FVG'] = 1
-            df.loc[df.index[i-1], 'Top_FVG'] = df['low'].iloc[i-2]
-            df.loc[df.index[i-1], 'Bottom_FVG'] = df['high'].iloc[i]
+        bullish = low[:-2] > high[2:]
         # Bearish FVG: Đỉnh nến 1 < Đáy nến 3
-        elif df['high'].iloc[i-2] < df['low'].iloc[i]:
-            df.loc[df.index[i-1], 'FVG'] = -1
-            df.loc[df.index[i-1], 'Top_FVG'] = df['high'].iloc[i-2]
-            df.loc[df.index[i-1], 'Bottom_FVG'] = df['low'].iloc[i]
+        bearish = high[:-2] < low[2:]
+        fvg, top_fvg, bottom_fvg = features['FVG'][1:-1], features['Top_FVG'][1:-1], features['Bottom_FVG'][1:-1]
+        fvg[bullish] = 1
+        top_fvg[bullish] = low[:-2][bullish]
+        bottom_fvg[bullish] = high[2:][bullish]
+        fvg[bearish] = -1
+        top_fvg[bearish] = high[:-2][bearish]
+        bottom_fvg[bearish] = low[2:][bearish]
 
     # --- 5. Xác định Liquidity Sweeps ---
-    df['Swept'] = 0
-    recent_high = df['high'].rolling(5).max().shift(1)
-    recent_low = df['low'].rolling(5).min().shift(1)
-    
-    # Bearish sweep (quét đỉnh)
-    df.loc[(df['high'] > recent_high) & (df['close'] < recent_high), 'Swept'] = -1
-    # Bullish sweep (quét đáy)
-    df.loc[(df['low'] < recent_low) & (df['close'] > recent_low), 'Swept'] = 1
+    if n > 5:
+        swept = features['Swept'][5:]
+        recent_high = sliding_window_view(high[:-1], 5).max(axis=1)
+        recent_low = sliding_window_view(low[:-1], 5).min(axis=1)
+        # Bearish sweep (quét đỉnh)
+        swept[(high[5:] > recent_high) & (close[5:] < recent_high)] = -1
+        # Bullish sweep (quét đáy)
+        swept[(low[5:] < recent_low) & (close[5:] > recent_low)] = 1
 
+    return features
+
+
+def analyze_smc_features(df, swing_lookback: int = 20):
+    """
+    Hàm này phân tích và thêm các cột SMC vào DataFrame.
+    Giữ cho code cũ dùng DataFrame; luồng chính dùng compute_smc_features.
+
+    Args:
+        df (DataFrame): Bảng dữ liệu OHLCV.
+        swing_lookback (int): Số nến để xác định đỉnh/đáy.
+
+    Returns:
+        DataFrame: Bảng dữ liệu đã được thêm các cột phân tích SMC.
+    """
+    features = compute_smc_features(OHLCV.from_frame(df), swing_lookback)
+    for column in SMC_FEATURE_COLUMNS:
+        df[column] = features[column]
     return df
 
 
@@ -131,25 +212,104 @@ class AdvancedSMC:
         self.exchange_name = exchange_name
         self.informative_timeframes = ['15m', '1h', '4h', '1d']
         
+        # Nến nhận từ CandleFeed (nếu có), thay cho việc poll REST
+        self._live_candles = {}
+        self._live_partial = {}
+        self._live_lock = threading.Lock()
+        
+        # Vùng nến dùng chung giữa các process (nếu có writer, xem shared_candles.py)
+        self.shared_candles = SharedCandleStore.attach_from_env()
+        self.shared_max_age = float(os.getenv('SMC_SHARED_MAX_AGE', '60'))
+        
+        # Pool lấy dữ liệu + phân tích song song các timeframe của MTF; quá mtf_timeout thì trả kết quả một phần
+        self.mtf_timeout = float(os.getenv('SMC_MTF_TIMEOUT', '10'))
+        self._mtf_executor = ThreadPoolExecutor(max_workers=int(os.getenv('SMC_MTF_WORKERS', '8')),
+                                                thread_name_prefix='smc-mtf')
+        # Sai số gom equal highs/lows: atr_mult * ATR, hoặc pct * giá nếu đặt SMC_LIQUIDITY_PCT
+        self.liquidity_atr_mult = float(os.getenv('SMC_LIQUIDITY_ATR_MULT', '0.1'))
+        self.liquidity_pct = float(os.environ['SMC_LIQUIDITY_PCT']) if os.getenv('SMC_LIQUIDITY_PCT') else None
+        # HTF đã phân tích, dùng lại cho tới khi nến HTF đóng
+        self.htf_cache = HTFFeatureCache(max_entries=int(os.getenv('SMC_HTF_CACHE_SIZE', '2000')))
+        # Internal structure (lookback nhỏ) tính cùng lượt với external structure (lookback 20); 0 để tắt
+        internal_lookback = int(os.getenv('SMC_INTERNAL_LOOKBACK', '5'))
+        self.structure_lookbacks = (internal_lookback,) if 0 < internal_lookback < 20 else ()
+        
+    def attach_feed(self, feed, symbol, timeframe, on_result=None, include_partial=False, window=200):
+        """
+        Nhận nến của symbol/timeframe từ CandleFeed thay vì gọi fetch_ohlcv.
+        Mỗi khi có nến đóng, phân tích lại và gọi on_result(result) nếu được truyền vào.
+        """
+        key = (symbol, timeframe)
+        with self._live_lock:
+            self._live_candles[key] = deque(maxlen=window)
+        
+        def on_candles(event):
+            with self._live_lock:
+                if event.closed:
+                    self._live_candles[key].extend(event.candles)
+                    self._live_partial.pop(key, None)
+                else:
+                    self._live_partial[key] = event.candles[-1]
+            
+            if event.closed and on_result is not None:
+                on_result(self.get_trading_signals(symbol, timeframe))
+        
+        return feed.subscribe(symbol, timeframe, on_candles, include_partial=include_partial)
+    
+    def get_live_data(self, symbol, timeframe, limit=200):
+        """Lấy dữ liệu từ nến đã nhận qua feed (None nếu chưa attach feed)"""
+        key = (symbol, timeframe)
+        with self._live_lock:
+            if key not in self._live_candles or not self._live_candles[key]:
+                return None
+            rows = list(self._live_candles[key])
+            partial = self._live_partial.get(key)
+        
+        if partial is not None and partial[0] > rows[-1][0]:
+            rows.append(partial)
+        
+        return OHLCV.from_rows(rows[-limit:])
+        
+    def get_shared_data(self, symbol, timeframe, limit=200):
+        """
+        Đọc nến từ vùng nhớ dùng chung; None nếu thiếu hoặc đã cũ.
+        Sao chép `limit` nến cuối: nến và kết quả tính từ nó nằm lại trong chart_cache/htf_cache,
+        còn view thì bị writer ghi đè tại chỗ.
+        """
+        if self.shared_candles is None:
+            return None
+        candles = self.shared_candles.read(self.exchange_name, symbol, timeframe, max_age=self.shared_max_age,
+                                           limit=limit, copy=True)
+        if candles is None or len(candles) < limit:
+            return None
+        return candles
+        
     def get_market_data(self, symbol, timeframe='4h', limit=200):
-        """Lấy dữ liệu thị trường từ craw_data"""
+        """Lấy dữ liệu thị trường (OHLCV) từ feed (nếu có) hoặc craw_data"""
         try:
-            df = fetch_ohlcv(self.exchange_name, symbol, timeframe, limit)
-            if df is None:
+            candles = self.get_live_data(symbol, timeframe, limit)
+            if candles is not None:
+                return candles
+            candles = self.get_shared_data(symbol, timeframe, limit)
+            if candles is not None:
+                return candles
+            candles = fetch_candles(self.exchange_name, symbol, timeframe, limit)
+            if candles is None:
                 return None
-            return df
+            return candles
         except Exception as e:
             print(f"Lỗi khi lấy dữ liệu: {e}")
             return None
-    
-    def analyze_smc_structure(self, df):
+
+    def analyze_smc_structure(self, candles):
         """Phân tích cấu trúc thị trường SMC"""
-        if df is None or len(df) < 50:
+        if candles is None or len(candles) < 50:
             return {
                 'order_blocks': [],
                 'liquidity_zones': [],
                 'fair_value_gaps': [],
                 'break_of_structure': [],
+                'internal_structure': [],
                 'trading_signals': {
                     'entry_long': [],
                     'entry_short': [],
@@ -157,167 +317,184 @@ class AdvancedSMC:
                     'exit_short': []
                 }
             }
-            
+
+        if not isinstance(candles, OHLCV):
+            candles = OHLCV.from_frame(candles)  # DataFrame từ code cũ
+
         # Áp dụng phân tích SMC
-        df_analyzed = analyze_smc_features(df.copy())
-        
+        features = compute_smc_features(candles, structure_lookbacks=self.structure_lookbacks)
+
         # Áp dụng entry/exit logic (simplified version)
-        df_analyzed = self.populate_entry_trend_simple(df_analyzed)
-        df_analyzed = self.populate_exit_trend(df_analyzed)
-        
+        features = self.populate_entry_trend_simple(features)
+        features = self.populate_exit_trend(features)
+
         return {
-            'order_blocks': self.extract_order_blocks(df_analyzed),
-            'liquidity_zones': self.extract_liquidity_zones(df_analyzed),
-            'fair_value_gaps': self.extract_fair_value_gaps(df_analyzed),
-            'break_of_structure': self.extract_break_of_structure(df_analyzed),
-            'trading_signals': self.extract_recent_signals(df_analyzed)
+            'order_blocks': self.extract_order_blocks(features),
+            'liquidity_zones': self.extract_liquidity_zones(features),
+            'fair_value_gaps': self.extract_fair_value_gaps(features),
+            'break_of_structure': self.extract_break_of_structure(features),
+            'internal_structure': self.extract_internal_structure(features),
+            'trading_signals': self.extract_recent_signals(features)
         }
-    
-    def populate_entry_trend_simple(self, dataframe):
+
+    def populate_entry_trend_simple(self, features):
         """Version đơn giản của populate_entry_trend cho single timeframe"""
         try:
-            # Khởi tạo cột entry signals
-            dataframe['enter_long'] = 0
-            dataframe['enter_short'] = 0
-            dataframe['enter_tag'] = ''
-            
             # Điều kiện Long đơn giản
             long_conditions = (
-                (dataframe['BOS'] == 1) &  # Bullish BOS
-                (dataframe['Swept'] == 1) &  # Quét thanh khoản đáy
+                (features['BOS'] == 1) &  # Bullish BOS
+                (features['Swept'] == 1) &  # Quét thanh khoản đáy
                 (
                     # Trong Bullish Order Block
-                    ((dataframe['low'] <= dataframe['Top_OB']) & 
-                     (dataframe['high'] >= dataframe['Bottom_OB']) & 
-                     (dataframe['OB'] == 1)) |
+                    ((features['low'] <= features['Top_OB']) &
+                     (features['high'] >= features['Bottom_OB']) &
+                     (features['OB'] == 1)) |
                     # Hoặc trong Bullish FVG
-                    ((dataframe['low'] <= dataframe['Top_FVG']) & 
-                     (dataframe['high'] >= dataframe['Bottom_FVG']) & 
-                     (dataframe['FVG'] == 1))
+                    ((features['low'] <= features['Top_FVG']) &
+                     (features['high'] >= features['Bottom_FVG']) &
+                     (features['FVG'] == 1))
                 )
             )
-            
+
             # Điều kiện Short đơn giản
             short_conditions = (
-                (dataframe['BOS'] == -1) &  # Bearish BOS
-                (dataframe['Swept'] == -1) &  # Quét thanh khoản đỉnh
+                (features['BOS'] == -1) &  # Bearish BOS
+                (features['Swept'] == -1) &  # Quét thanh khoản đỉnh
                 (
                     # Trong Bearish Order Block
-                    ((dataframe['low'] <= dataframe['Top_OB']) & 
-                     (dataframe['high'] >= dataframe['Bottom_OB']) & 
-                     (dataframe['OB'] == -1)) |
+                    ((features['low'] <= features['Top_OB']) &
+                     (features['high'] >= features['Bottom_OB']) &
+                     (features['OB'] == -1)) |
                     # Hoặc trong Bearish FVG
-                    ((dataframe['low'] <= dataframe['Top_FVG']) & 
-                     (dataframe['high'] >= dataframe['Bottom_FVG']) & 
-                     (dataframe['FVG'] == -1))
+                    ((features['low'] <= features['Top_FVG']) &
+                     (features['high'] >= features['Bottom_FVG']) &
+                     (features['FVG'] == -1))
                 )
             )
-            
-            # Gán signals
-            dataframe.loc[long_conditions, 'enter_long'] = 1
-            dataframe.loc[long_conditions, 'enter_tag'] = 'long_smc_simple'
-            
-            dataframe.loc[short_conditions, 'enter_short'] = 1
-            dataframe.loc[short_conditions, 'enter_tag'] = 'short_smc_simple'
-            
-            return dataframe
-            
+
+            # Gán signals vào các cột đã cấp phát sẵn
+            features['enter_long'][long_conditions] = 1
+            features['enter_tag'][long_conditions] = 'long_smc_simple'
+
+            features['enter_short'][short_conditions] = 1
+            features['enter_tag'][short_conditions] = 'short_smc_simple'
+
+            return features
+
         except Exception as e:
             logger.error(f"Error in populate_entry_trend_simple: {e}")
-            return dataframe
-    
-    def get_multi_timeframe_data(self, symbol):
-        """Lấy dữ liệu từ nhiều timeframe"""
+            return features
+
+    def get_timeframe_features(self, symbol, tf):
+        """Lấy dữ liệu và phân tích SMC cho một timeframe (None nếu không lấy được dữ liệu)"""
+        candles = self.get_market_data(symbol, tf, 200)
+        if candles is None:
+            print(f"Không thể lấy dữ liệu cho {tf}")
+            return None
+        features = compute_smc_features(candles, structure_lookbacks=self.structure_lookbacks)
+        print(f"Đã lấy dữ liệu {tf}: {len(candles)} nến")
+        return features
+
+    def get_multi_timeframe_data(self, symbol, timeout=None, base_timeframe=None):
+        """
+        Lấy dữ liệu từ nhiều timeframe: các timeframe chạy song song trên pool MTF,
+        nên tổng thời gian xấp xỉ timeframe chậm nhất thay vì tổng các timeframe.
+        Timeframe cao hơn base_timeframe lấy từ htf_cache nếu nến HTF chưa đóng.
+        Timeframe chưa xong sau timeout giây bị bỏ qua (kết quả một phần).
+        """
+        timeout = self.mtf_timeout if timeout is None else timeout
+        base_ms = timeframe_to_ms(base_timeframe) if base_timeframe else 0
+        cached = {}
+        futures = {}
+        for tf in self.informative_timeframes:
+            is_htf = timeframe_to_ms(tf) > base_ms
+            features = self.htf_cache.get(symbol, tf) if is_htf else None
+            if features is not None:
+                cached[tf] = features
+            else:
+                futures[tf] = self._mtf_executor.submit(self._timeframe_features, symbol, tf, is_htf)
+        wait(futures.values(), timeout=timeout)
+
         mtf_data = {}
-        
         for tf in self.informative_timeframes:
+            if tf in cached:
+                mtf_data[tf] = cached[tf]
+                continue
+            future = futures[tf]
+            if not future.done():
+                future.cancel()
+                print(f"Quá thời gian lấy dữ liệu {tf} ({timeout}s), bỏ qua")
+                continue
             try:
-                df = self.get_market_data(symbol, tf, 200)
-                if df is not None:
-                    # Phân tích SMC cho timeframe này
-                    df_analyzed = analyze_smc_features(df.copy())
-                    mtf_data[tf] = df_analyzed
-                    print(f"Đã lấy dữ liệu {tf}: {len(df_analyzed)} nến")
-                else:
-                    print(f"Không thể lấy dữ liệu cho {tf}")
+                features = future.result()
             except Exception as e:
                 print(f"Lỗi khi lấy dữ liệu {tf}: {e}")
-        
+                continue
+            if features is not None:
+                mtf_data[tf] = features
+
         return mtf_data
-    
-    def merge_htf_data(self, base_df, mtf_data):
-        """Gộp dữ liệu từ các timeframe cao hơn vào base dataframe"""
-        merged_df = base_df.copy()
-        
+
+    def _timeframe_features(self, symbol, tf, cache):
+        features = self.get_timeframe_features(symbol, tf)
+        if cache and features is not None:
+            self.htf_cache.put(symbol, tf, features)
+        return features
+
+    def merge_htf_data(self, base_features, mtf_data):
+        """Gộp dữ liệu từ các timeframe cao hơn vào base (dùng chung mảng, không sao chép)"""
+        merged = base_features.derive()
+
+        # Các cột HTF hiện được gán 0 (chưa merge theo timestamp), dùng chung một mảng chỉ đọc
+        htf_zeros = np.zeros(len(merged), dtype=np.int8)
+        htf_zeros.flags.writeable = False
+
         for htf in self.informative_timeframes:
             if htf in mtf_data:
-                htf_df = mtf_data[htf].copy()
-                
-                # Rename columns với prefix htf_
-                htf_df = htf_df.rename(columns={
-                    'BOS': f'htf_bos_{htf}',
-                    'CHOCH': f'htf_choch_{htf}',
-                    'OB': f'htf_ob_{htf}',
-                    'Top_OB': f'htf_ob_top_{htf}',
-                    'Bottom_OB': f'htf_ob_bottom_{htf}',
-                    'FVG': f'htf_fvg_{htf}',
-                    'Top_FVG': f'htf_fvg_top_{htf}',
-                    'Bottom_FVG': f'htf_fvg_bottom_{htf}'
-                })
-                
-                # Merge dữ liệu (simplified merge based on timestamp)
-                htf_cols = [col for col in htf_df.columns if col.startswith('htf_')]
-                
-                # Forward fill cho các giá trị HTF
-                for col in htf_cols:
-                    merged_df[col] = 0
-                    merged_df[col] = merged_df[col].fillna(method='ffill')
-        
-        return merged_df
-    
-    def populate_entry_trend(self, dataframe):
+                for col in (f'htf_bos_{htf}', f'htf_choch_{htf}', f'htf_ob_{htf}', f'htf_ob_top_{htf}',
+                            f'htf_ob_bottom_{htf}', f'htf_fvg_{htf}', f'htf_fvg_top_{htf}', f'htf_fvg_bottom_{htf}'):
+                    merged[col] = htf_zeros
+
+        return merged
+
+    def populate_entry_trend(self, features):
         """
         Logic entry trend từ SMC Original - multi-timeframe
         """
         try:
-            # Khởi tạo cột entry signals
-            dataframe['enter_long'] = 0
-            dataframe['enter_short'] = 0
-            dataframe['enter_tag'] = ''
-            
             # Lấy higher timeframes (loại bỏ 15m)
             higher_timeframes = [tf for tf in self.informative_timeframes if tf != '15m']
-            
+
             # --- Điều kiện chung cho Lệnh Mua (Long) ---
             htf_bullish_bos = []
             htf_bullish_poi = []
-            
+
             for htf in higher_timeframes:
                 # Kiểm tra xem cột có tồn tại không
                 bos_col = f'htf_bos_{htf}'
-                if bos_col in dataframe.columns:
-                    htf_bullish_bos.append(dataframe[bos_col] == 1)
-                
+                if bos_col in features:
+                    htf_bullish_bos.append(features[bos_col] == 1)
+
                 # Points of Interest (POI) - Order Blocks và FVG
                 ob_conditions = []
                 fvg_conditions = []
-                
-                if all(col in dataframe.columns for col in [f'htf_ob_top_{htf}', f'htf_ob_bottom_{htf}', f'htf_ob_{htf}']):
+
+                if all(col in features for col in [f'htf_ob_top_{htf}', f'htf_ob_bottom_{htf}', f'htf_ob_{htf}']):
                     in_ob = (
-                        (dataframe['low'] <= dataframe[f'htf_ob_top_{htf}']) & 
-                        (dataframe['high'] >= dataframe[f'htf_ob_bottom_{htf}']) & 
-                        (dataframe[f'htf_ob_{htf}'] == 1)
+                        (features['low'] <= features[f'htf_ob_top_{htf}']) &
+                        (features['high'] >= features[f'htf_ob_bottom_{htf}']) &
+                        (features[f'htf_ob_{htf}'] == 1)
                     )
                     ob_conditions.append(in_ob)
-                
-                if all(col in dataframe.columns for col in [f'htf_fvg_top_{htf}', f'htf_fvg_bottom_{htf}', f'htf_fvg_{htf}']):
+
+                if all(col in features for col in [f'htf_fvg_top_{htf}', f'htf_fvg_bottom_{htf}', f'htf_fvg_{htf}']):
                     in_fvg = (
-                        (dataframe['low'] <= dataframe[f'htf_fvg_top_{htf}']) & 
-                        (dataframe['high'] >= dataframe[f'htf_fvg_bottom_{htf}']) & 
-                        (dataframe[f'htf_fvg_{htf}'] == 1)
+                        (features['low'] <= features[f'htf_fvg_top_{htf}']) &
+                        (features['high'] >= features[f'htf_fvg_bottom_{htf}']) &
+                        (features[f'htf_fvg_{htf}'] == 1)
                     )
                     fvg_conditions.append(in_fvg)
-                
+
                 # Kết hợp OB và FVG conditions
                 if ob_conditions or fvg_conditions:
                     all_poi_conditions = ob_conditions + fvg_conditions
@@ -326,192 +503,194 @@ class AdvancedSMC:
             # --- Điều kiện chung cho Lệnh Bán (Short) ---
             htf_bearish_bos = []
             htf_bearish_poi = []
-            
+
             for htf in higher_timeframes:
                 # Bearish BOS
                 bos_col = f'htf_bos_{htf}'
-                if bos_col in dataframe.columns:
-                    htf_bearish_bos.append(dataframe[bos_col] == -1)
-                
+                if bos_col in features:
+                    htf_bearish_bos.append(features[bos_col] == -1)
+
                 # Bearish POI
                 ob_conditions = []
                 fvg_conditions = []
-                
-                if all(col in dataframe.columns for col in [f'htf_ob_top_{htf}', f'htf_ob_bottom_{htf}', f'htf_ob_{htf}']):
+
+                if all(col in features for col in [f'htf_ob_top_{htf}', f'htf_ob_bottom_{htf}', f'htf_ob_{htf}']):
                     in_ob = (
-                        (dataframe['low'] <= dataframe[f'htf_ob_top_{htf}']) & 
-                        (dataframe['high'] >= dataframe[f'htf_ob_bottom_{htf}']) & 
-                        (dataframe[f'htf_ob_{htf}'] == -1)
+                        (features['low'] <= features[f'htf_ob_top_{htf}']) &
+                        (features['high'] >= features[f'htf_ob_bottom_{htf}']) &
+                        (features[f'htf_ob_{htf}'] == -1)
                     )
                     ob_conditions.append(in_ob)
-                
-                if all(col in dataframe.columns for col in [f'htf_fvg_top_{htf}', f'htf_fvg_bottom_{htf}', f'htf_fvg_{htf}']):
+
+                if all(col in features for col in [f'htf_fvg_top_{htf}', f'htf_fvg_bottom_{htf}', f'htf_fvg_{htf}']):
                     in_fvg = (
-                        (dataframe['low'] <= dataframe[f'htf_fvg_top_{htf}']) & 
-                        (dataframe['high'] >= dataframe[f'htf_fvg_bottom_{htf}']) & 
-                        (dataframe[f'htf_fvg_{htf}'] == -1)
+                        (features['low'] <= features[f'htf_fvg_top_{htf}']) &
+                        (features['high'] >= features[f'htf_fvg_bottom_{htf}']) &
+                        (features[f'htf_fvg_{htf}'] == -1)
                     )
                     fvg_conditions.append(in_fvg)
-                
+
                 if ob_conditions or fvg_conditions:
                     all_poi_conditions = ob_conditions + fvg_conditions
                     htf_bearish_poi.append(reduce(lambda a, b: a | b, all_poi_conditions))
 
             # --- Kết hợp điều kiện và tạo tín hiệu ---
+            previous_choch = _shift(features['CHOCH'])
+
             if htf_bullish_bos and htf_bullish_poi:
                 long_conditions = (
                     reduce(lambda a, b: a | b, htf_bullish_bos) &
                     reduce(lambda a, b: a | b, htf_bullish_poi) &
-                    (dataframe['Swept'] == 1) &
-                    (dataframe['CHOCH'].shift(1) == 1)
+                    (features['Swept'] == 1) &
+                    (previous_choch == 1)
                 )
-                
+
                 # Kiểm tra htf_choch_15m nếu có
-                if 'htf_choch_15m' in dataframe.columns:
-                    long_conditions = long_conditions & (dataframe['htf_choch_15m'] != -1)
-                
-                dataframe.loc[long_conditions, 'enter_long'] = 1
-                dataframe.loc[long_conditions, 'enter_tag'] = 'long_smc_manual'
-            
+                if 'htf_choch_15m' in features:
+                    long_conditions = long_conditions & (features['htf_choch_15m'] != -1)
+
+                features['enter_long'][long_conditions] = 1
+                features['enter_tag'][long_conditions] = 'long_smc_manual'
+
             if htf_bearish_bos and htf_bearish_poi:
                 short_conditions = (
                     reduce(lambda a, b: a | b, htf_bearish_bos) &
                     reduce(lambda a, b: a | b, htf_bearish_poi) &
-                    (dataframe['Swept'] == -1) &
-                    (dataframe['CHOCH'].shift(1) == -1)
+                    (features['Swept'] == -1) &
+                    (previous_choch == -1)
                 )
-                
+
                 # Kiểm tra htf_choch_15m nếu có
-                if 'htf_choch_15m' in dataframe.columns:
-                    short_conditions = short_conditions & (dataframe['htf_choch_15m'] != 1)
-                
-                dataframe.loc[short_conditions, 'enter_short'] = 1
-                dataframe.loc[short_conditions, 'enter_tag'] = 'short_smc_manual'
+                if 'htf_choch_15m' in features:
+                    short_conditions = short_conditions & (features['htf_choch_15m'] != 1)
+
+                features['enter_short'][short_conditions] = 1
+                features['enter_tag'][short_conditions] = 'short_smc_manual'
+
+            return features
 
-            return dataframe
-            
         except Exception as e:
             logger.error(f"Error in populate_entry_trend: {e}")
-            return dataframe
-    
-    def populate_exit_trend(self, dataframe):
+            return features
+
+    def populate_exit_trend(self, features):
         """
         Logic exit trend từ SMC Original
         """
         try:
-            # Khởi tạo cột exit signals
-            dataframe['exit_long'] = 0
-            dataframe['exit_short'] = 0
-            
             # Exit Long khi CHoCH bearish
-            dataframe.loc[(dataframe['CHOCH'] == -1), 'exit_long'] = 1
-            
+            features['exit_long'][features['CHOCH'] == -1] = 1
+
             # Exit Short khi CHoCH bullish
-            dataframe.loc[(dataframe['CHOCH'] == 1), 'exit_short'] = 1
-            
-            return dataframe
-            
+            features['exit_short'][features['CHOCH'] == 1] = 1
+
+            return features
+
         except Exception as e:
             logger.error(f"Error in populate_exit_trend: {e}")
-            return dataframe
-    
-    def get_trading_signals(self, symbol, timeframe='1d'):
-        """METHOD CHÍNH - Lấy tín hiệu trading dựa trên SMC"""
+            return features
+
+    def get_trading_signals(self, symbol, timeframe='1d', candles=None):
+        """METHOD CHÍNH - Lấy tín hiệu trading dựa trên SMC (candles: nến đã lấy sẵn, tùy chọn)"""
         try:
             # Lấy dữ liệu
-            df = self.get_market_data(symbol, timeframe)
-            if df is None:
+            if candles is None:
+                candles = self.get_market_data(symbol, timeframe)
+            if candles is None:
                 return None
-            
+
             # Phân tích SMC
-            smc_analysis = self.analyze_smc_structure(df)
-            
-            # Tính indicators bổ sung
-            df_calc = df.tail(200).copy()
-            indicators = calculate_indicators(df, df_calc)
-            
+            smc_analysis = self.analyze_smc_structure(candles)
+
+            # Tính indicators bổ sung (tail là view, không sao chép)
+            indicators = calculate_indicators(candles, candles.tail(200))
+
             # Kết hợp tất cả
             result = {
                 'symbol': symbol,
                 'timeframe': timeframe,
-                'timestamp': int(df.iloc[-1]['timestamp'].timestamp()),
-                'current_price': float(df.iloc[-1]['close']),
+                'timestamp': int(candles.timestamp[-1] // 1000),
+                'current_price': float(candles.close[-1]),
                 'smc_analysis': {
                     'order_blocks': smc_analysis['order_blocks'],
                     'liquidity_zones': smc_analysis['liquidity_zones'],
                     'fair_value_gaps': smc_analysis['fair_value_gaps'],
-                    'break_of_structure': smc_analysis['break_of_structure']
+                    'break_of_structure': smc_analysis['break_of_structure'],
+                    'internal_structure': smc_analysis['internal_structure']
                 },
                 'trading_signals': smc_analysis['trading_signals'],
                 'indicators': indicators
             }
-            
+
             return result
-            
+
         except Exception as e:
             print(f"Lỗi khi phân tích SMC: {e}")
             return None
-    
+
     def get_trading_signals_mtf(self, symbol, timeframe='15m'):
         """Lấy tín hiệu trading với multi-timeframe analysis"""
         try:
             # Lấy dữ liệu multi-timeframe
             print(f"Đang lấy dữ liệu multi-timeframe cho {symbol}...")
-            mtf_data = self.get_multi_timeframe_data(symbol)
-            
+            mtf_data = self.get_multi_timeframe_data(symbol, base_timeframe=timeframe)
+
             if not mtf_data:
                 print("Không thể lấy dữ liệu multi-timeframe")
                 return None
-            
+
             # Sử dụng timeframe thấp nhất làm base
             base_tf = timeframe
             if base_tf not in mtf_data:
                 base_tf = list(mtf_data.keys())[0]
-            
-            base_df = mtf_data[base_tf].copy()
-            
+
+            base_features = mtf_data[base_tf]
+            base_candles = base_features.candles
+
             # Merge HTF data
             print("Đang merge dữ liệu HTF...")
-            merged_df = self.merge_htf_data(base_df, mtf_data)
-            
+            merged = self.merge_htf_data(base_features, mtf_data)
+
             # Áp dụng entry/exit logic
             print("Đang áp dụng logic entry/exit...")
-            merged_df = self.populate_entry_trend(merged_df)
-            merged_df = self.populate_exit_trend(merged_df)
-            
+            merged = self.populate_entry_trend(merged)
+            merged = self.populate_exit_trend(merged)
+
             # Tính indicators bổ sung
-            df_calc = base_df.tail(200).copy()
-            indicators = calculate_indicators(base_df, df_calc)
-            
+            indicators = calculate_indicators(base_candles, base_candles.tail(200))
+
             # Lấy signals gần nhất
-            recent_signals = self.extract_recent_signals(merged_df)
-            
+            recent_signals = self.extract_recent_signals(merged)
+
             # Kết hợp tất cả
             result = {
                 'symbol': symbol,
                 'timeframe': timeframe,
-                'timestamp': int(base_df.iloc[-1]['timestamp'].timestamp()),
-                'current_price': float(base_df.iloc[-1]['close']),
+                'timestamp': int(base_candles.timestamp[-1] // 1000),
+                'current_price': float(base_candles.close[-1]),
                 'smc_analysis': {
-                    'order_blocks': self.extract_order_blocks(merged_df),
-                    'liquidity_zones': self.extract_liquidity_zones(merged_df),
-                    'fair_value_gaps': self.extract_fair_value_gaps(merged_df),
-                    'break_of_structure': self.extract_break_of_structure(merged_df)
+                    'order_blocks': self.extract_order_blocks(merged),
+                    'liquidity_zones': self.extract_liquidity_zones(merged),
+                    'fair_value_gaps': self.extract_fair_value_gaps(merged),
+                    'break_of_structure': self.extract_break_of_structure(merged),
+                    'internal_structure': self.extract_internal_structure(merged)
                 },
                 'trading_signals': recent_signals,
-                'indicators': indicators
+                'indicators': indicators,
+                # Timeframe không lấy được/quá thời gian (kết quả một phần nếu khác rỗng)
+                'missing_timeframes': [tf for tf in self.informative_timeframes if tf not in mtf_data]
             }
-            
+
             return result
-            
+
         except Exception as e:
             print(f"Lỗi khi phân tích SMC: {e}")
             import traceback
             traceback.print_exc()
             return None
 
-    # ... existing extraction methods remain the same ...
-    def extract_recent_signals(self, df):
+    # ... extraction methods: chỉ duyệt các vị trí có tín hiệu thay vì iterrows ...
+    def extract_recent_signals(self, features):
         """Trích xuất các signals gần nhất"""
         signals = {
             'entry_long': [],
@@ -519,113 +698,109 @@ class AdvancedSMC:
             'exit_long': [],
             'exit_short': []
         }
-        
-        # Lấy signals gần nhất
-        recent_df = df.tail(50)
-        
-        for i, row in recent_df.iterrows():
-            timestamp = int(row['timestamp'].timestamp())
-            
-            if row.get('enter_long', 0) == 1:
-                signals['entry_long'].append({
-                    'time': timestamp,
-                    'price': row['close'],
-                    'tag': row.get('enter_tag', 'long_smc')
-                })
-            
-            if row.get('enter_short', 0) == 1:
-                signals['entry_short'].append({
-                    'time': timestamp,
-                    'price': row['close'],
-                    'tag': row.get('enter_tag', 'short_smc')
-                })
-            
-            if row.get('exit_long', 0) == 1:
-                signals['exit_long'].append({
-                    'time': timestamp,
-                    'price': row['close']
-                })
-            
-            if row.get('exit_short', 0) == 1:
-                signals['exit_short'].append({
-                    'time': timestamp,
-                    'price': row['close']
+
+        # Lấy signals gần nhất (50 nến cuối)
+        start = max(len(features) - 50, 0)
+        timestamps = features['timestamp']
+        close = features['close']
+        enter_tag = features['enter_tag']
+
+        for i in (np.flatnonzero(features['enter_long'][start:]) + start).tolist():
+            signals['entry_long'].append({
+                'time': int(timestamps[i] // 1000),
+                'price': float(close[i]),
+                'tag': enter_tag[i]
+            })
+
+        for i in (np.flatnonzero(features['enter_short'][start:]) + start).tolist():
+            signals['entry_short'].append({
+                'time': int(timestamps[i] // 1000),
+                'price': float(close[i]),
+                'tag': enter_tag[i]
+            })
+
+        for name in ('exit_long', 'exit_short'):
+            for i in (np.flatnonzero(features[name][start:]) + start).tolist():
+                signals[name].append({
+                    'time': int(timestamps[i] // 1000),
+                    'price': float(close[i])
                 })
-        
+
         return signals
 
-    def extract_order_blocks(self, df):
-        """Trích xuất Order Blocks từ DataFrame đã phân tích"""
+    def extract_order_blocks(self, features):
+        """Trích xuất Order Blocks từ kết quả phân tích"""
         order_blocks = []
-        
-        for i, row in df.iterrows():
-            if row.get('OB', 0) != 0:
-                order_blocks.append({
-                    'type': 'bullish_ob' if row['OB'] == 1 else 'bearish_ob',
-                    'high': row.get('Top_OB'),
-                    'low': row.get('Bottom_OB'),
-                    'time': int(row['timestamp'].timestamp()),
-                    'strength': 'high'
-                })
-        
-        return order_blocks[-10:]  # Trả về 10 OB gần nhất
-    
-    def extract_liquidity_zones(self, df):
-        """Trích xuất Liquidity Zones"""
-        liquidity_zones = []
-        
-        # Tìm các swing highs và lows
-        swing_highs = df[df.get('swing_high', False) == True]
-        swing_lows = df[df.get('swing_low', False) == True]
-        
-        for i, row in swing_highs.iterrows():
-            liquidity_zones.append({
-                'type': 'buy_side_liquidity',
-                'price': row['high'],
-                'time': int(row['timestamp'].timestamp()),
-                'strength': 'high'
-            })
-        
-        for i, row in swing_lows.iterrows():
-            liquidity_zones.append({
-                'type': 'sell_side_liquidity',
-                'price': row['low'],
-                'time': int(row['timestamp'].timestamp()),
+        ob = features['OB']
+
+        for i in np.flatnonzero(ob)[-10:].tolist():  # 10 OB gần nhất
+            order_blocks.append({
+                'type': 'bullish_ob' if ob[i] == 1 else 'bearish_ob',
+                'high': float(features['Top_OB'][i]),
+                'low': float(features['Bottom_OB'][i]),
+                'time': int(features['timestamp'][i] // 1000),
                 'strength': 'high'
             })
-        
-        return liquidity_zones[-10:]  # Trả về 10 zone gần nhất
-    
-    def extract_fair_value_gaps(self, df):
+
+        return order_blocks
+
+    def extract_liquidity_zones(self, features, limit=10):
+        """
+        Trích xuất Liquidity Zones: pool equal highs/lows gom từ các swing point
+        (sai số theo ATR, xem liquidity.py), kèm số đỉnh/đáy, khoảng thời gian và trạng thái bị quét.
+        """
+        pools = detect_liquidity_pools(features['timestamp'], features['high'], features['low'],
+                                       features['swing_high'], features['swing_low'], close=features['close'],
+                                       atr_mult=self.liquidity_atr_mult, pct=self.liquidity_pct)
+        for pool in pools:
+            pool['strength'] = 'high' if pool['count'] >= 3 else 'medium' if pool['count'] == 2 else 'low'
+        return pools[-limit:]  # 10 pool có lần chạm gần nhất
+
+    def extract_fair_value_gaps(self, features):
         """Trích xuất Fair Value Gaps"""
         fvgs = []
-        
-        for i, row in df.iterrows():
-            if row.get('FVG', 0) != 0:
-                fvgs.append({
-                    'type': 'bullish_fvg' if row['FVG'] == 1 else 'bearish_fvg',
-                    'top': row.get('Top_FVG'),
-                    'bottom': row.get('Bottom_FVG'),
-                    'time': int(row['timestamp'].timestamp()),
-                    'filled': False
-                })
-        
-        return fvgs[-20:]  # Trả về 20 FVG gần nhất
-    
-    def extract_break_of_structure(self, df):
+        fvg = features['FVG']
+
+        for i in np.flatnonzero(fvg)[-20:].tolist():  # 20 FVG gần nhất
+            fvgs.append({
+                'type': 'bullish_fvg' if fvg[i] == 1 else 'bearish_fvg',
+                'top': float(features['Top_FVG'][i]),
+                'bottom': float(features['Bottom_FVG'][i]),
+                'time': int(features['timestamp'][i] // 1000),
+                'filled': False
+            })
+
+        return fvgs
+
+    def extract_break_of_structure(self, features):
         """Trích xuất Break of Structure"""
         bos_signals = []
-        
-        for i, row in df.iterrows():
-            if row.get('BOS', 0) != 0:
-                bos_signals.append({
-                    'type': 'bullish_bos' if row['BOS'] == 1 else 'bearish_bos',
-                    'price': row['close'],
-                    'time': int(row['timestamp'].timestamp()),
-                    'strength': 'confirmed'
-                })
-        
-        return bos_signals[-10:]  # Trả về 10 BOS gần nhất
+        bos = features['BOS']
+
+        for i in np.flatnonzero(bos)[-10:].tolist():  # 10 BOS gần nhất
+            bos_signals.append({
+                'type': 'bullish_bos' if bos[i] == 1 else 'bearish_bos',
+                'price': float(features['close'][i]),
+                'time': int(features['timestamp'][i] // 1000),
+                'strength': 'confirmed'
+            })
+
+        return bos_signals
+
+    def extract_internal_structure(self, features):
+        """Trích xuất BOS/CHoCH của internal structure (lookback nhỏ, nằm trong swing external)"""
+        if not self.structure_lookbacks:
+            return []
+        lookback = self.structure_lookbacks[0]
+        signal = features[f'bos_choch_signal_{lookback}']
+        names = {1: 'bullish_bos', -1: 'bearish_bos', 2: 'bullish_choch', -2: 'bearish_choch'}
+
+        return [{
+            'type': names[int(signal[i])],
+            'price': float(features['close'][i]),
+            'time': int(features['timestamp'][i] // 1000),
+            'lookback': lookback
+        } for i in np.flatnonzero(signal)[-10:].tolist()]  # 10 tín hiệu gần nhất
     
     def get_telegram_summary(self, symbol, timeframe='1d'):
         """Lấy tóm tắt ngắn gọn cho Telegram"""
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from craw_data import next_candle_close, timeframe_to_ms
+
+logger = logging.getLogger(__name__)
+
+ALERT_SECTIONS = {
+    'entry_long': "🟢 *Long Signal*",
+    'entry_short': "🔴 *Short Signal*",
+    'exit_long': "❌ *Exit Long* (CHoCH)",
+    'exit_short': "❌ *Exit Short* (CHoCH)",
+}
+
+
+class AlertStore:
+    """
+    Đăng ký nhận alert: (symbol, timeframe) -> tập chat_id, kèm thời điểm nến đã alert gần nhất.
+    Thay đổi chỉ đánh dấu trong bộ nhớ; flush() ghi file JSON (atomic, ngoài event loop)
+    một lần sau mỗi lệnh đăng ký hoặc mỗi lượt quét để giữ được qua các lần restart.
+    """
+
+    def __init__(self, path='alerts.json', max_per_chat=20):
+        self.path = path
+        self.max_per_chat = max_per_chat
+        self._subscriptions = {}
+        self._last_alerted = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Các lần ghi nối tiếp: bản ghi sau luôn mới hơn
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            with self._lock:
+                for entry in data:
+                    key = (entry['symbol'], entry['timeframe'])
+                    self._subscriptions[key] = set(entry['chats'])
+                    if entry.get('last_alerted') is not None:
+                        self._last_alerted[key] = entry['last_alerted']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Không thể đọc danh sách alert {self.path}: {e}")
+
+    def save(self):
+        """Ghi file (blocking); trong event loop dùng flush()"""
+        if not self.path:
+            return
+        with self._write_lock:
+            with self._lock:
+                self._dirty = False
+                data = [{'symbol': symbol, 'timeframe': timeframe, 'chats': sorted(chats),
+                         'last_alerted': self._last_alerted.get((symbol, timeframe))}
+                        for (symbol, timeframe), chats in self._subscriptions.items() if chats]
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                with self._lock:
+                    self._dirty = True
+                logger.warning(f"Không thể lưu danh sách alert {self.path}: {e}")
+
+    async def flush(self):
+        """Ghi các thay đổi chưa lưu trên thread riêng, không chặn event loop"""
+        if self._dirty:
+            await asyncio.to_thread(self.save)
+
+    def subscribe(self, chat_id, symbol, timeframe):
+        """Thêm đăng ký; ValueError nếu chat đã đạt giới hạn"""
+        timeframe_to_ms(timeframe)  # ValueError nếu timeframe không hợp lệ
+        with self._lock:
+            chats = self._subscriptions.setdefault((symbol, timeframe), set())
+            if chat_id in chats:
+                return False
+            if sum(chat_id in subscribers for subscribers in self._subscriptions.values()) >= self.max_per_chat:
+                raise ValueError(f"Tối đa {self.max_per_chat} alert mỗi chat")
+            chats.add(chat_id)
+            self._dirty = True
+        return True
+
+    def unsubscribe(self, chat_id, symbol=None, timeframe=None):
+        """Hủy các đăng ký của chat khớp symbol/timeframe (None: tất cả); trả về số đăng ký đã hủy"""
+        removed = 0
+        with self._lock:
+            for (key_symbol, key_timeframe), chats in list(self._subscriptions.items()):
+                if symbol not in (None, key_symbol) or timeframe not in (None, key_timeframe):
+                    continue
+                if chat_id in chats:
+                    chats.discard(chat_id)
+                    removed += 1
+                if not chats:
+                    del self._subscriptions[(key_symbol, key_timeframe)]
+                    self._last_alerted.pop((key_symbol, key_timeframe), None)
+            if removed:
+                self._dirty = True
+        return removed
+
+    def for_chat(self, chat_id):
+        with self._lock:
+            return sorted(key for key, chats in self._subscriptions.items() if chat_id in chats)
+
+    def keys(self):
+        """Các (symbol, timeframe) có ít nhất một subscriber"""
+        with self._lock:
+            return [key for key, chats in self._subscriptions.items() if chats]
+
+    def subscribers(self, key):
+        with self._lock:
+            return set(self._subscriptions.get(key, ()))
+
+    def last_alerted(self, key):
+        with self._lock:
+            return self._last_alerted.get(key)
+
+    def mark_alerted(self, key, candle_time):
+        with self._lock:
+            self._last_alerted[key] = candle_time
+            self._dirty = True
+
+
+def closed_candle_signals(result, candle_time):
+    """Các signal entry/exit nằm trên nến vừa đóng (candle_time tính bằng giây)"""
+    signals = result.get('trading_signals') or {}
+    return [(section, signal) for section in ALERT_SECTIONS
+            for signal in signals.get(section, []) if signal.get('time') == candle_time]
+
+
+def format_alert(symbol, timeframe, signals):
+    message = f"🔔 *Alert {symbol} - {timeframe}*\n\n"
+    for section, signal in signals:
+        message += f"{ALERT_SECTIONS[section]}: ${signal['price']:,.2f}\n"
+        if signal.get('tag'):
+            message += f"   🏷️ Tag: {signal['tag']}\n"
+    return message
+
+
+class AlertScheduler:
+    """
+    Thức dậy ở mỗi lần đóng nến của các timeframe đang có đăng ký, phân tích mỗi
+    (symbol, timeframe) đúng một lần rồi gửi kết quả cho tất cả subscriber của nó.
+    Chi phí tỉ lệ với số cặp khác nhau, không phụ thuộc số user.
+    """
+
+    def __init__(self, store, analyze, notify, close_grace=5):
+        self.store = store
+        self.analyze = analyze  # async analyze(symbol, timeframe) -> kết quả get_trading_signals
+        self.notify = notify  # async notify(chat_id, text)
+        self.close_grace = close_grace
+        self._changed = asyncio.Event()
+
+    def changed(self):
+        """Gọi sau khi thêm đăng ký để scheduler tính lại lần thức dậy"""
+        self._changed.set()
+
+    async def run(self):
+        while True:
+            now_ms = int(time.time() * 1000)
+            timeframes = {timeframe for _, timeframe in self.store.keys()}
+            closes = {timeframe: next_candle_close(timeframe, now_ms) for timeframe in timeframes}
+            self._changed.clear()
+            if not closes:
+                await self._changed.wait()
+                continue
+
+            wake_ms = min(closes.values())
+            delay = (wake_ms - now_ms) / 1000 + self.close_grace
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                continue  # Có đăng ký mới: tính lại
+            except asyncio.TimeoutError:
+                pass
+
+            due = [timeframe for timeframe, close_ms in closes.items() if close_ms <= wake_ms]
+            try:
+                await self.scan(due, wake_ms)
+            except Exception as e:
+                logger.error(f"Alert scan lỗi: {e}")
+
+    async def scan(self, timeframes, close_ms):
+        """Phân tích các cặp có đăng ký thuộc các timeframe vừa đóng nến"""
+        keys = [key for key in self.store.keys() if key[1] in timeframes]
+        try:
+            await asyncio.gather(*(self._scan_key(key, close_ms) for key in keys))
+        finally:
+            # Một lần ghi cho cả lượt quét thay vì mỗi mark_alerted
+            await self.store.flush()
+
+    async def _scan_key(self, key, close_ms):
+        symbol, timeframe = key
+        candle_time = (close_ms - timeframe_to_ms(timeframe)) // 1000
+        if self.store.last_alerted(key) == candle_time:
+            return
+        try:
+            result = await self.analyze(symbol, timeframe)
+        except Exception as e:
+            logger.warning(f"Alert {symbol} {timeframe}: lỗi phân tích: {e}")
+            return
+        if result is None:
+            return
+
+        self.store.mark_alerted(key, candle_time)
+        signals = closed_candle_signals(result, candle_time)
+        if not signals:
+            return
+
+        message = format_alert(symbol, timeframe, signals)
+        for chat_id in self.store.subscribers(key):
+            try:
+                await self.notify(chat_id, message)
+            except Exception as e:
+                logger.warning(f"Không gửi được alert tới {chat_id}: {e}")
@@ -1,10 +1,20 @@
 # backend/app.py
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from craw_data import fetch_ohlcv, calculate_indicators
 from AdvancedSMC import AdvancedSMC
-import ccxt
+from exchange_adapter import get_exchange
+from market_catalog import MarketCatalog, SUPPORTED_EXCHANGES
+from signal_stream import SignalStreamHub
+from snapshot import AnalysisResultStore, warm_state_from_env
+from startup import startup_report
+from screener import RECOMMENDATION_CODES, SCREENER_TIMEFRAMES, TREND_CODES, UniverseScreener
+from correlation import ReturnCorrelation
+from chart_codec import candles_etag, encode_candles, etag_matches, negotiate_format, slice_since
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import os
+import threading
 import time
+from collections import OrderedDict
 
 app = Flask(__name__)
 CORS(app) # Cho phép truy cập từ domain khác (Frontend)
@@ -16,80 +26,164 @@ smc_analyzer = AdvancedSMC(exchange_name='binance')
 CANDLE_LIMIT_DISPLAY = 4000
 CANDLE_LIMIT_CALC = 200
 
-# Cache để lưu danh sách tokens (tránh gọi API quá nhiều)
-tokens_cache = {}
+# Danh mục cặp theo exchange: trả snapshot ngay, refresh nền sau 300 giây, lưu ra đĩa cho lần khởi động sau
+market_catalog = MarketCatalog(ttl=300)
+
+# Cache nến cho chart: nhiều client poll cùng cặp trong CHART_CACHE_TTL giây chỉ tốn một lần lấy dữ liệu;
+# key do client gửi nên giữ tối đa CHART_CACHE_MAX_ENTRIES cặp, bỏ entry hết hạn/cũ nhất
+CHART_CACHE_TTL = 2
+CHART_CACHE_MAX_ENTRIES = int(os.getenv('SMC_CHART_CACHE_SIZE', '500'))
+chart_cache = OrderedDict()  # (symbol, timeframe) -> {'candles', 'etag', 'timestamp'}, cũ nhất ở đầu
+chart_cache_lock = threading.Lock()
+
+# Pool giới hạn cho I/O exchange: request chờ tối đa IO_TIMEOUT giây rồi trả 504
+IO_WORKERS = int(os.getenv('SMC_IO_WORKERS', '16'))
+IO_TIMEOUT = float(os.getenv('SMC_IO_TIMEOUT', '20'))
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='smc-io')
+
+# Batch phân tích: số cặp tối đa mỗi request và thời gian chạy tối đa của mỗi cặp (giây)
+BATCH_MAX_ITEMS = int(os.getenv('SMC_BATCH_MAX_ITEMS', '50'))
+BATCH_ITEM_TIMEOUT = float(os.getenv('SMC_BATCH_ITEM_TIMEOUT', '15'))
+
+# Stream SSE thay đổi signal: một producer phân tích mỗi STREAM_INTERVAL giây cho mỗi cặp
+STREAM_INTERVAL = float(os.getenv('SMC_STREAM_INTERVAL', '15'))
+STREAM_HEARTBEAT = 15
+signal_hub = SignalStreamHub(smc_analyzer.get_trading_signals, interval=STREAM_INTERVAL,
+                             queue_size=int(os.getenv('SMC_STREAM_QUEUE', '100')),
+                             max_keys=int(os.getenv('SMC_STREAM_MAX_KEYS', '200')))
+
+# Response stream (SSE, batch NDJSON) giữ một worker HTTP suốt kết nối: tối đa MAX_STREAMS stream
+# cùng lúc để các request thường luôn còn worker, vượt thì trả 503
+MAX_STREAMS = int(os.getenv('SMC_MAX_STREAMS', '16'))
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Screener: mỗi (exchange, timeframe) một UniverseScreener, quét lại toàn bộ universe sau SCREENER_TTL giây;
+# giữ tối đa SCREENER_MAX_INSTANCES screener, bỏ screener ít dùng nhất khi vượt
+SCREENER_TTL = float(os.getenv('SMC_SCREENER_TTL', '900'))
+SCREENER_MAX_SYMBOLS = int(os.getenv('SMC_SCREENER_MAX_SYMBOLS', '500'))
+SCREENER_MAX_INSTANCES = int(os.getenv('SMC_SCREENER_MAX_INSTANCES', '12'))
+screeners = OrderedDict()
+screeners_lock = threading.Lock()
+
+# Tương quan return giữa các cặp của screener: cửa sổ SMC_CORRELATION_WINDOW nến, tối thiểu MIN_PERIODS nến chung
+CORRELATION_WINDOW = int(os.getenv('SMC_CORRELATION_WINDOW', '200'))
+CORRELATION_MIN_PERIODS = int(os.getenv('SMC_CORRELATION_MIN_PERIODS', '30'))
+
+# Kết quả phân tích gần nhất: trả ngay khi nến chưa đóng, cũ hơn SMC_RESULT_MAX_AGE giây thì tính lại nền
+analysis_results = AnalysisResultStore(max_age=float(os.getenv('SMC_RESULT_MAX_AGE', '30')))
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+# Warm restart: kết quả phân tích + đuôi nến ghi định kỳ ra snapshot, nạp lại khi khởi động (serve.py)
+warm_state = warm_state_from_env('snapshots/app.npz')
+warm_state.register('results', analysis_results.dump, analysis_results.restore)
+
+# Readiness: serve.py xóa cờ này khi khởi động và bật lại sau khi warm_up xong
+ready = threading.Event()
+ready.set()
 
 def get_exchange_instance(exchange_name):
-    """Tạo instance của exchange"""
+    """Tạo instance của exchange (live, record hoặc replay theo exchange_adapter)"""
     try:
-        exchange_map = {
-            'binance': ccxt.binance(),
-            'bitget': ccxt.bitget(),
-            'bybit': ccxt.bybit(),
-            'mexc': ccxt.mexc(),
-            'kucoin': ccxt.kucoin(),
-            'okx': ccxt.okx(),
-            'gate.io': ccxt.gateio(),
-            'huobi': ccxt.huobi()
-        }
-        return exchange_map.get(exchange_name.lower())
+        if exchange_name.lower() not in SUPPORTED_EXCHANGES:
+            return None
+        return get_exchange(exchange_name)
     except Exception:
         return None
 
 def fetch_exchange_tokens(exchange_name):
-    """Lấy danh sách tokens từ exchange"""
-    try:
-        exchange = get_exchange_instance(exchange_name)
-        if not exchange or not exchange.has['fetchMarkets']:
-            return []
+    """Lấy danh sách tokens mới nhất từ exchange (blocking) và cập nhật market_catalog"""
+    snapshot = market_catalog.refresh(exchange_name)
+    return snapshot.symbols if snapshot is not None else market_catalog.symbols(exchange_name)
 
-        markets = exchange.load_markets()
-        
-        usdt_pairs = [
-            symbol for symbol, market in markets.items()
-            if market.get('quote', '').upper() == 'USDT'
-            and market.get('active', True)
-            and market.get('spot', False) # Đảm bảo là cặp spot
-            and ':' not in symbol # Loại bỏ các cặp futures/swap nếu có
-        ]
-        
-        usdt_pairs.sort()
-        
-        popular_pairs = [
-            'BTC/USDT', 'ETH/USDT', 'BNB/USDT', 'SOL/USDT', 'XRP/USDT',
-            'DOGE/USDT', 'ADA/USDT', 'AVAX/USDT', 'DOT/USDT', 'MATIC/USDT'
-        ]
-        
-        final_pairs = [pair for pair in popular_pairs if pair in usdt_pairs]
-        remaining_pairs = [pair for pair in usdt_pairs if pair not in popular_pairs]
-        final_pairs.extend(remaining_pairs)
-        
-        print(f"Tìm thấy {len(final_pairs)} cặp USDT spot trên {exchange_name}")
-        return final_pairs
-        
-    except Exception as e:
-        print(f"Lỗi khi lấy danh sách tokens từ {exchange_name}: {e}")
-        return ['BTC/USDT', 'ETH/USDT', 'BNB/USDT']
+def run_blocking(func, *args, timeout=None):
+    """Chạy I/O blocking trên io_executor, chờ tối đa timeout giây (mặc định IO_TIMEOUT)"""
+    return io_executor.submit(func, *args).result(timeout=timeout or IO_TIMEOUT)
+
+def warm_up(exchanges=('binance',), symbols=('BTC/USDT',), timeframes=('4h',)):
+    """Nạp sẵn exchange clients, markets, danh sách tokens và đường phân tích trước khi nhận traffic"""
+    started = time.time()
+    for exchange_name in exchanges:
+        try:
+            fetch_exchange_tokens(exchange_name)
+        except Exception as e:
+            print(f"Warm-up tokens {exchange_name} thất bại: {e}")
+    
+    for symbol in symbols:
+        for timeframe in timeframes:
+            try:
+                get_chart_candles(symbol, timeframe)
+                compute_analysis(symbol, timeframe)
+            except Exception as e:
+                print(f"Warm-up {symbol} {timeframe} thất bại: {e}")
+    
+    print(f"Warm-up xong sau {time.time() - started:.2f}s")
+
+def compute_analysis(symbol, timeframe):
+    """Phân tích (blocking) và lưu kết quả vào analysis_results"""
+    result = smc_analyzer.get_trading_signals(symbol, timeframe)
+    if result is not None:
+        analysis_results.put(symbol, timeframe, result)
+    return result
+
+def refresh_analysis(symbol, timeframe):
+    """Tính lại kết quả trên io_executor, mỗi cặp chỉ một lần cùng lúc"""
+    key = (symbol, timeframe)
+    with refreshing_lock:
+        if key in refreshing:
+            return
+        refreshing.add(key)
+    
+    def run():
+        try:
+            compute_analysis(symbol, timeframe)
+        finally:
+            with refreshing_lock:
+                refreshing.discard(key)
+    
+    io_executor.submit(run)
+
+def get_analysis(symbol, timeframe):
+    """Kết quả đã lưu nếu nến của nó chưa đóng (cũ thì refresh nền), ngược lại phân tích và chờ"""
+    result, fresh = analysis_results.get(symbol, timeframe)
+    if result is not None:
+        if not fresh:
+            refresh_analysis(symbol, timeframe)
+        return result
+    return run_blocking(compute_analysis, symbol, timeframe)
 
 # --- API Endpoints ---
 
+@app.before_request
+def require_ready():
+    """Từ chối traffic (503) khi đang warm-up, trừ các endpoint kiểm tra"""
+    if not ready.is_set() and request.path not in ('/api/test', '/api/ready'):
+        response = jsonify({'error': 'Server đang khởi động'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+@app.errorhandler(FutureTimeoutError)
+def handle_io_timeout(e):
+    """Exchange phản hồi quá IO_TIMEOUT"""
+    return jsonify({'error': 'Hết thời gian chờ exchange'}), 504
+
 @app.route('/api/tokens', methods=['GET'])
 def get_tokens():
     """Cung cấp danh sách các token từ exchange."""
     exchange = request.args.get('exchange', 'binance').lower()
     
-    cache_key = f"{exchange}_tokens"
-    if cache_key in tokens_cache and time.time() - tokens_cache[cache_key]['timestamp'] < 300:
-        print(f"Trả về {len(tokens_cache[cache_key]['tokens'])} tokens từ cache cho {exchange}")
-        return jsonify(tokens_cache[cache_key]['tokens'])
-    
-    tokens = fetch_exchange_tokens(exchange)
-    
-    tokens_cache[cache_key] = {'tokens': tokens, 'timestamp': time.time()}
-    
-    print(f"Trả về {len(tokens)} tokens mới cho exchange: {exchange}")
+    # Không chờ exchange: snapshot cũ vẫn được trả trong lúc refresh nền
+    tokens = market_catalog.symbols(exchange)
     return jsonify(tokens)
 
+@app.route('/api/tokens/search', methods=['GET'])
+def search_tokens():
+    """Tìm token cho ô autocomplete: ?q=<chuỗi>&exchange=binance&limit=20"""
+    exchange = request.args.get('exchange', 'binance').lower()
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    return jsonify(market_catalog.search(exchange, query, limit))
+
 @app.route('/api/smc-analysis', methods=['GET'])
 def get_smc_analysis():
     """API endpoint cho phân tích SMC"""
@@ -98,47 +192,322 @@ def get_smc_analysis():
         timeframe = request.args.get('timeframe', '4h')
         
         # Lấy phân tích SMC
-        analysis = smc_analyzer.get_trading_signals(symbol, timeframe)
+        analysis = get_analysis(symbol, timeframe)
         
         if analysis is None:
             return jsonify({'error': 'Không thể lấy dữ liệu'}), 200
         
         return jsonify(analysis)
         
+    except FutureTimeoutError:
+        raise  # errorhandler trả 504
     except Exception as e:
         print(f"Error in SMC analysis: {str(e)}")
         return jsonify({'error': str(e)}), 200
 
+def parse_batch_items(payload):
+    """
+    Danh sách (symbol, timeframe) không trùng lặp từ body JSON:
+    {"items": [{"symbol": "BTC/USDT", "timeframe": "4h"}, ...]}
+    hoặc {"symbols": [...], "timeframes": [...]} (tích symbol × timeframe)
+    """
+    if 'items' in payload:
+        pairs = [(item['symbol'], item.get('timeframe', '4h')) for item in payload['items']]
+    else:
+        pairs = [(symbol, timeframe) for symbol in payload.get('symbols', [])
+                 for timeframe in payload.get('timeframes', ['4h'])]
+    
+    items = list(dict.fromkeys((str(symbol), str(timeframe)) for symbol, timeframe in pairs))
+    if not items:
+        raise ValueError('Không có cặp nào để phân tích')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'Tối đa {BATCH_MAX_ITEMS} cặp mỗi batch')
+    return items
+
+def stream_batch_analysis(items, item_timeout):
+    """
+    Chạy get_trading_signals cho các cặp trên io_executor và yield từng record NDJSON
+    ngay khi có kết quả. Thời gian chờ mỗi cặp tính từ lúc cặp đó bắt đầu chạy,
+    cặp còn xếp hàng trong pool không bị tính giờ.
+    """
+    started_at = time.time()
+    started = {}
+    
+    def run_item(symbol, timeframe):
+        started[(symbol, timeframe)] = time.time()
+        return compute_analysis(symbol, timeframe)
+    
+    def record(**fields):
+        return app.json.dumps(fields) + '\n'
+    
+    pending = {io_executor.submit(run_item, symbol, timeframe): (symbol, timeframe) for symbol, timeframe in items}
+    failed = []
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol, timeframe = key = pending.pop(future)
+                elapsed_ms = int((time.time() - started.get(key, started_at)) * 1000)
+                try:
+                    analysis = future.result()
+                except Exception as e:
+                    failed.append({'symbol': symbol, 'timeframe': timeframe, 'status': 'error'})
+                    yield record(type='result', symbol=symbol, timeframe=timeframe, ok=False,
+                                 status='error', error=str(e), elapsed_ms=elapsed_ms)
+                    continue
+                
+                if analysis is None:
+                    failed.append({'symbol': symbol, 'timeframe': timeframe, 'status': 'no_data'})
+                    yield record(type='result', symbol=symbol, timeframe=timeframe, ok=False,
+                                 status='no_data', error='Không thể lấy dữ liệu', elapsed_ms=elapsed_ms)
+                else:
+                    yield record(type='result', symbol=symbol, timeframe=timeframe, ok=True,
+                                 elapsed_ms=elapsed_ms, data=analysis)
+            
+            # Cặp chạy quá item_timeout: báo timeout, không chờ nữa (thread vẫn chạy nốt trong pool)
+            now = time.time()
+            for future, key in list(pending.items()):
+                if key in started and now - started[key] > item_timeout:
+                    del pending[future]
+                    symbol, timeframe = key
+                    failed.append({'symbol': symbol, 'timeframe': timeframe, 'status': 'timeout'})
+                    yield record(type='result', symbol=symbol, timeframe=timeframe, ok=False,
+                                 status='timeout', error='Hết thời gian chờ exchange',
+                                 elapsed_ms=int((now - started[key]) * 1000))
+        
+        yield record(type='summary', total=len(items), succeeded=len(items) - len(failed),
+                     failed=failed, elapsed_ms=int((time.time() - started_at) * 1000))
+    finally:
+        # Client ngắt kết nối giữa chừng: bỏ các cặp chưa chạy
+        for future in pending:
+            future.cancel()
+
+@app.route('/api/smc-analysis/batch', methods=['POST'])
+def batch_smc_analysis():
+    """
+    Phân tích nhiều cặp song song, trả về NDJSON: mỗi dòng một kết quả theo thứ tự hoàn thành,
+    dòng cuối là summary (tổng số, số thành công, danh sách cặp lỗi/timeout).
+    Body: {"items": [...]} hoặc {"symbols": [...], "timeframes": [...]}, tùy chọn "timeout" (giây/cặp).
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        items = parse_batch_items(payload)
+        item_timeout = min(float(payload.get('timeout', BATCH_ITEM_TIMEOUT)), IO_TIMEOUT)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not stream_slots.acquire(blocking=False):
+        return streams_full()
+    
+    response = Response(stream_with_context(stream_batch_analysis(items, item_timeout)),
+                        mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+    response.call_on_close(stream_slots.release)
+    return response
+
+def streams_full():
+    return jsonify({'error': f'Đã đạt tối đa {MAX_STREAMS} stream đồng thời'}), 503, {'Retry-After': '5'}
+
+def stream_signal_events(subscriber):
+    """Chuyển sự kiện của subscriber thành text/event-stream, gửi heartbeat khi không có gì mới"""
+    yield 'retry: 5000\n\n'
+    while True:
+        event = subscriber.get(timeout=STREAM_HEARTBEAT)
+        if event is None:
+            yield ': ping\n\n'
+            continue
+        yield f"event: {event['event']}\ndata: {app.json.dumps(event)}\n\n"
+
+@app.route('/api/signal-stream', methods=['GET'])
+def signal_stream():
+    """
+    SSE: ?symbols=BTC/USDT,ETH/USDT&timeframes=4h,1h
+    Sự kiện 'snapshot' (kết quả đầy đủ khi bắt đầu), 'diff' (chỉ các zone/signal thay đổi)
+    và 'resync' (kết quả đầy đủ khi client đọc không kịp và diff bị bỏ).
+    """
+    symbols = [value for value in request.args.get('symbols', 'BTC/USDT').split(',') if value]
+    timeframes = [value for value in request.args.get('timeframes', '4h').split(',') if value]
+    keys = list(dict.fromkeys((symbol, timeframe) for symbol in symbols for timeframe in timeframes))
+    if not keys or len(keys) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Cần từ 1 đến {BATCH_MAX_ITEMS} cặp'}), 400
+    
+    if not stream_slots.acquire(blocking=False):
+        return streams_full()
+    try:
+        subscriber = signal_hub.subscribe(keys)
+    except ValueError as e:
+        stream_slots.release()
+        return jsonify({'error': str(e)}), 503
+    
+    response = Response(stream_with_context(stream_signal_events(subscriber)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def close():
+        signal_hub.unsubscribe(subscriber)
+        stream_slots.release()
+
+    # Gọi cả khi client ngắt kết nối trước khi stream bắt đầu
+    response.call_on_close(close)
+    return response
+
+def get_screener(exchange_name, timeframe):
+    """UniverseScreener dùng chung cho một exchange/timeframe"""
+    if timeframe not in SCREENER_TIMEFRAMES:
+        raise ValueError(f"Timeframe không hỗ trợ: {timeframe}")
+    key = (exchange_name, timeframe)
+    with screeners_lock:
+        if key in screeners:
+            screeners.move_to_end(key)
+        else:
+            analyzer = smc_analyzer if exchange_name == smc_analyzer.exchange_name else None
+            correlation = ReturnCorrelation(timeframe, window=CORRELATION_WINDOW,
+                                            min_periods=CORRELATION_MIN_PERIODS)
+            screeners[key] = UniverseScreener(market_catalog, exchange_name, timeframe, analyzer=analyzer,
+                                              ttl=SCREENER_TTL, max_symbols=SCREENER_MAX_SYMBOLS,
+                                              correlation=correlation)
+            while len(screeners) > SCREENER_MAX_INSTANCES:
+                screeners.popitem(last=False)
+        return screeners[key]
+
+@app.route('/api/screener', methods=['GET'])
+def screener():
+    """
+    Top-k cặp theo độ mạnh signal: ?exchange=binance&timeframe=4h&k=20
+    Lọc: trend=bullish|bearish|neutral, rsi_min, rsi_max,
+    recommendation=strong_buy|buy|sell|strong_sell|hold, min_strength,
+    dedupe=0.8 (bỏ cặp tương quan >= 0.8 với cặp xếp trên, liệt kê trong 'correlated').
+    Trả ngay từ trạng thái đã quét; lần quét đầu chạy nền ('scored' = 0 cho tới khi có kết quả).
+    """
+    exchange = request.args.get('exchange', 'binance').lower()
+    timeframe = request.args.get('timeframe', '4h')
+    trend = request.args.get('trend')
+    recommendation = request.args.get('recommendation')
+    if exchange not in SUPPORTED_EXCHANGES:
+        return jsonify({'error': f'Exchange không hỗ trợ: {exchange}'}), 400
+    if timeframe not in SCREENER_TIMEFRAMES:
+        return jsonify({'error': f'Timeframe không hỗ trợ: {timeframe}'}), 400
+    if trend is not None and trend not in TREND_CODES:
+        return jsonify({'error': f'trend không hợp lệ: {trend}'}), 400
+    if recommendation is not None and recommendation not in RECOMMENDATION_CODES:
+        return jsonify({'error': f'recommendation không hợp lệ: {recommendation}'}), 400
+    
+    result = get_screener(exchange, timeframe).screen(
+        k=max(1, min(request.args.get('k', 20, type=int), 100)),
+        trend=trend,
+        rsi_min=request.args.get('rsi_min', type=float),
+        rsi_max=request.args.get('rsi_max', type=float),
+        recommendation=recommendation,
+        min_strength=request.args.get('min_strength', type=float),
+        dedupe=request.args.get('dedupe', type=float),
+    )
+    return jsonify(result)
+
+def get_correlation(exchange_name, timeframe):
+    """ReturnCorrelation của screener (exchange, timeframe); lần đầu kích hoạt quét nền"""
+    screener_instance = get_screener(exchange_name, timeframe)
+    if screener_instance.refreshed_at == 0:
+        screener_instance.refresh_async()
+    return screener_instance.correlation
+
+@app.route('/api/correlation', methods=['GET'])
+def correlation_pairs():
+    """
+    Các cặp có return tương quan cao nhất: ?exchange=binance&timeframe=15m&k=20
+    symbol=ETH/USDT: chỉ các cặp của symbol; absolute=1: xếp theo trị tuyệt đối (gồm tương quan âm).
+    """
+    exchange = request.args.get('exchange', 'binance').lower()
+    timeframe = request.args.get('timeframe', '4h')
+    if exchange not in SUPPORTED_EXCHANGES:
+        return jsonify({'error': f'Exchange không hỗ trợ: {exchange}'}), 400
+    if timeframe not in SCREENER_TIMEFRAMES:
+        return jsonify({'error': f'Timeframe không hỗ trợ: {timeframe}'}), 400
+
+    correlation = get_correlation(exchange, timeframe)
+    pairs = correlation.top_pairs(
+        k=max(1, min(request.args.get('k', 20, type=int), 500)),
+        symbol=request.args.get('symbol'),
+        absolute=request.args.get('absolute', '0') == '1',
+    )
+    return jsonify({**correlation.stats(), 'exchange': exchange, 'pairs': pairs})
+
+@app.route('/api/correlation/clusters', methods=['GET'])
+def correlation_clusters():
+    """Nhóm các cặp cùng chạy (tương quan >= threshold): ?exchange=binance&timeframe=15m&threshold=0.8"""
+    exchange = request.args.get('exchange', 'binance').lower()
+    timeframe = request.args.get('timeframe', '4h')
+    if exchange not in SUPPORTED_EXCHANGES:
+        return jsonify({'error': f'Exchange không hỗ trợ: {exchange}'}), 400
+    if timeframe not in SCREENER_TIMEFRAMES:
+        return jsonify({'error': f'Timeframe không hỗ trợ: {timeframe}'}), 400
+
+    correlation = get_correlation(exchange, timeframe)
+    clusters = correlation.clusters(
+        threshold=request.args.get('threshold', 0.8, type=float),
+        min_size=max(2, request.args.get('min_size', 2, type=int)),
+    )
+    return jsonify({**correlation.stats(), 'exchange': exchange, 'clusters': clusters})
+
+def get_chart_candles(symbol, timeframe):
+    """Lấy nến cho chart kèm ETag, dùng cache ngắn hạn"""
+    cache_key = (symbol, timeframe)
+    with chart_cache_lock:
+        cached = chart_cache.get(cache_key)
+    if cached and time.time() - cached['timestamp'] < CHART_CACHE_TTL:
+        return cached['candles'], cached['etag']
+    
+    candles = smc_analyzer.get_market_data(symbol, timeframe, 200)
+    if candles is None:
+        return None, None
+    
+    etag = candles_etag(candles)
+    now = time.time()
+    with chart_cache_lock:
+        chart_cache[cache_key] = {'candles': candles, 'etag': etag, 'timestamp': now}
+        chart_cache.move_to_end(cache_key)
+        # Thứ tự theo thời điểm ghi: entry hết hạn hoặc vượt giới hạn luôn nằm ở đầu
+        while chart_cache:
+            oldest = next(iter(chart_cache.values()))
+            if len(chart_cache) <= CHART_CACHE_MAX_ENTRIES and now - oldest['timestamp'] < CHART_CACHE_TTL:
+                break
+            chart_cache.popitem(last=False)
+    return candles, etag
+
 @app.route('/api/chart-data', methods=['GET'])
 def get_chart_data():
-    """API endpoint cho dữ liệu chart"""
+    """
+    API endpoint cho dữ liệu chart.
+    Định dạng chọn bằng ?format=json|binary|arrow hoặc header Accept; nén gzip theo Accept-Encoding.
+    Delta: ?since=<timestamp ms của nến cuối client đang có> chỉ trả nến đó và các nến mới hơn.
+    Gửi If-None-Match với ETag lần trước: dữ liệu không đổi thì trả 304 không có body.
+    """
     try:
         symbol = request.args.get('symbol', 'BTC/USDT')
         timeframe = request.args.get('timeframe', '4h')
         
-        # Lấy dữ liệu OHLCV
-        df = fetch_ohlcv('binance', symbol, timeframe, 200)
-        if df is None:
+        try:
+            fmt = negotiate_format(request.args.get('format'), request.accept_mimetypes)
+            since = request.args.get('since', type=int)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Lấy dữ liệu OHLCV (feed / vùng nhớ dùng chung / REST)
+        candles, etag = run_blocking(get_chart_candles, symbol, timeframe)
+        if candles is None:
             return jsonify({'error': 'Không thể lấy dữ liệu'}), 200
-
-        # Chuyển đổi dữ liệu cho chart
-        candles = []
-        for _, row in df.iterrows():
-            candles.append([
-                int(row['timestamp'].timestamp() * 1000),  # timestamp in ms
-                float(row['open']),
-                float(row['high']),
-                float(row['low']),
-                float(row['close']),
-                float(row['volume'])
-            ])
         
-        return jsonify({
-            'candles': candles,
-            'symbol': symbol,
-            'timeframe': timeframe
-        })
+        cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers=cache_headers)
         
+        # Dựng payload trực tiếp từ các mảng cột, không duyệt từng dòng
+        fields = {'symbol': symbol, 'timeframe': timeframe}
+        if since is not None:
+            candles = slice_since(candles, since)
+            fields['since'] = since
+        body, headers = encode_candles(candles, fmt, request.headers.get('Accept-Encoding', ''), **fields)
+        headers.update(cache_headers)
+        return Response(body, headers=headers)
+        
+    except FutureTimeoutError:
+        raise  # errorhandler trả 504
     except Exception as e:
         print(f"Error: {str(e)}")
         return jsonify({'error': str(e)}), 200
@@ -148,6 +517,15 @@ def test_connection():
     """Test API connection"""
     return jsonify({"status": "success", "message": "API đang hoạt động"})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness: 200 khi đã warm-up xong, 503 khi đang khởi động; kèm thời gian các bước khởi động"""
+    if ready.is_set():
+        return jsonify({"status": "ready", "startup": startup_report.as_dict()})
+    return jsonify({"status": "warming", "startup": startup_report.as_dict()}), 503
+
 if __name__ == '__main__':
     print("Khởi động Flask server...")
+    warm_state.load()
+    warm_state.start()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import deque
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Xử lý tối đa max_concurrent_updates update cùng lúc, nhưng update của cùng một chat
+    chạy tuần tự theo thứ tự nhận. Update chờ chat của nó không giữ slot toàn cục: chỉ update
+    đang chạy của mỗi chat chiếm slot, update kế tiếp xếp hàng riêng và lấy slot khi tới lượt.
+    Callback query (bấm nút) không xếp hàng theo chat: nút bấm mới trên cùng message
+    thay thế phân tích đang chờ của nút cũ (TradingBot.analyze).
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_queues = {}  # chat_id -> deque coroutine chờ chạy sau update hiện tại của chat
+        self._drains = set()  # task chạy update kế tiếp của chat
+
+    @staticmethod
+    def ordering_key(update):
+        if not isinstance(update, Update) or update.callback_query is not None:
+            return None
+        return update.effective_chat.id if update.effective_chat else None
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = self.ordering_key(update)
+        if chat_id is None:
+            await coroutine
+            return
+
+        queue = self._chat_queues.get(chat_id)
+        if queue is not None:
+            # Chat đang có update chạy: xếp hàng và trả slot ngay
+            queue.append(coroutine)
+            return
+        self._chat_queues[chat_id] = deque()
+        await self._run(chat_id, coroutine)
+
+    async def _run(self, chat_id, coroutine):
+        try:
+            await coroutine
+        finally:
+            if self._chat_queues[chat_id]:
+                task = asyncio.create_task(self._run_next(chat_id))
+                self._drains.add(task)
+                task.add_done_callback(self._drains.discard)
+            else:
+                del self._chat_queues[chat_id]
+
+    async def _run_next(self, chat_id):
+        coroutine = self._chat_queues[chat_id].popleft()
+        try:
+            async with self._semaphore:
+                await self._run(chat_id, coroutine)
+        except Exception as e:
+            logger.exception(f"Lỗi xử lý update của chat {chat_id}: {e}")
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        # Chạy nốt các update đã nhận
+        while self._drains:
+            await asyncio.gather(*self._drains, return_exceptions=True)
+
+
+async def serve_webhook(application, listen='0.0.0.0', port=8443, path='/telegram', url=None, secret=None):
+    """
+    Chạy bot ở chế độ webhook bằng aiohttp: Telegram POST update tới `path`,
+    update được đưa vào update_queue của application và trả 200 ngay.
+    url: địa chỉ public để đăng ký setWebhook (bỏ trống nếu đã đăng ký sẵn).
+    """
+
+    async def handle_update(request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except ValueError as e:
+            logger.warning(f"Webhook nhận update không hợp lệ: {e}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    web_app = web.Application()
+    web_app.router.add_post(path, handle_update)
+    runner = web.AppRunner(web_app)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        if url:
+            await application.bot.set_webhook(url=url.rstrip('/') + path, secret_token=secret,
+                                              max_connections=100, drop_pending_updates=False)
+        print(f"🤖 Bot đang chạy (webhook) tại {listen}:{port}{path}...")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
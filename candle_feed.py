@@ -0,0 +1,265 @@
+import csv
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from craw_data import timeframe_to_ms
+from exchange_adapter import create_exchange
+
+logger = logging.getLogger(__name__)
+
+# Một sự kiện nến: danh sách nến dạng ccxt [timestamp_ms, open, high, low, close, volume]
+# closed=True  -> các nến đã đóng (lần đầu có thể là cả một đoạn lịch sử)
+# closed=False -> nến đang hình thành (chỉ gửi cho subscriber yêu cầu include_partial)
+CandleEvent = namedtuple('CandleEvent', ['symbol', 'timeframe', 'candles', 'closed'])
+
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+class CandleFeed:
+    """
+    Interface chung cho nguồn nến: đẩy nến đã đóng (và tùy chọn nến đang chạy)
+    theo từng symbol/timeframe tới các subscriber.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def subscribe(self, symbol, timeframe, callback, include_partial=False):
+        """Đăng ký callback(event) cho một cặp symbol/timeframe"""
+        timeframe_to_ms(timeframe)  # Kiểm tra timeframe hợp lệ ngay khi đăng ký
+        with self._lock:
+            self._subscribers.setdefault((symbol, timeframe), []).append((callback, include_partial))
+        return callback
+
+    def unsubscribe(self, symbol, timeframe, callback):
+        """Hủy đăng ký callback"""
+        with self._lock:
+            subscribers = self._subscribers.get((symbol, timeframe), [])
+            subscribers[:] = [sub for sub in subscribers if sub[0] is not callback]
+            if not subscribers:
+                self._subscribers.pop((symbol, timeframe), None)
+
+    def keys(self):
+        """Danh sách (symbol, timeframe) đang có subscriber"""
+        with self._lock:
+            return list(self._subscribers.keys())
+
+    def wants_partial(self, symbol, timeframe):
+        """Có subscriber nào cần nến đang hình thành không"""
+        with self._lock:
+            return any(partial for _, partial in self._subscribers.get((symbol, timeframe), []))
+
+    def publish(self, symbol, timeframe, candles, closed=True):
+        """Đẩy nến tới các subscriber; lỗi của một subscriber không ảnh hưởng subscriber khác"""
+        if not candles:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get((symbol, timeframe), []))
+
+        event = CandleEvent(symbol, timeframe, candles, closed)
+        for callback, include_partial in subscribers:
+            if not closed and not include_partial:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Lỗi trong subscriber của {symbol} {timeframe}: {e}")
+
+    def start(self):
+        """Chạy feed trên một thread nền"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Dừng feed và đợi thread kết thúc"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self):
+        """Vòng lặp chính của feed (chạy đồng bộ)"""
+        raise NotImplementedError
+
+
+class CcxtCandleFeed(CandleFeed):
+    """
+    Feed nến lấy từ exchange qua ccxt.
+    Lần đầu lấy `history` nến, sau đó chỉ lấy các nến mới kể từ nến đóng cuối cùng
+    thay vì tải lại toàn bộ cửa sổ ở mỗi lần poll.
+    """
+
+    def __init__(self, exchange_name='binance', history=200, poll_interval=10, close_grace=2, exchange=None):
+        super().__init__()
+        self.exchange_name = exchange_name
+        self.history = history
+        self.poll_interval = poll_interval  # Chu kỳ poll khi có subscriber cần nến đang chạy
+        self.close_grace = close_grace  # Đợi thêm vài giây sau giờ đóng nến để exchange kịp chốt nến
+        self.exchange = exchange
+        self._state = {}
+
+    def get_exchange(self):
+        """Khởi tạo exchange một lần (qua exchange_adapter: live/record/replay) và dùng lại cho mọi lần poll"""
+        if self.exchange is None:
+            self.exchange = create_exchange(self.exchange_name, {
+                'timeout': 30000,
+                'enableRateLimit': True,
+            })
+        return self.exchange
+
+    def poll_once(self, now_ms=None):
+        """Poll tất cả các cặp đang được subscribe một lần"""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        for symbol, timeframe in self.keys():
+            try:
+                self._poll_key(symbol, timeframe, now_ms)
+            except Exception as e:
+                logger.error(f"Lỗi khi poll {symbol} {timeframe} từ {self.exchange_name}: {e}")
+
+    def _poll_key(self, symbol, timeframe, now_ms):
+        tf_ms = timeframe_to_ms(timeframe)
+        state = self._state.setdefault((symbol, timeframe), {'last_closed': None, 'partial': None})
+        exchange = self.get_exchange()
+
+        if state['last_closed'] is None:
+            rows = exchange.fetch_ohlcv(symbol, timeframe, limit=self.history)
+        else:
+            rows = exchange.fetch_ohlcv(symbol, timeframe, since=state['last_closed'] + tf_ms)
+        if not rows:
+            return
+
+        last_closed = state['last_closed']
+        closed = [
+            row for row in rows
+            if row[0] + tf_ms <= now_ms and (last_closed is None or row[0] > last_closed)
+        ]
+        if closed:
+            state['last_closed'] = closed[-1][0]
+            state['partial'] = None
+            self.publish(symbol, timeframe, closed, closed=True)
+
+        partial = rows[-1]
+        if partial[0] + tf_ms > now_ms and partial != state['partial'] and self.wants_partial(symbol, timeframe):
+            state['partial'] = partial
+            self.publish(symbol, timeframe, [partial], closed=False)
+
+    def next_wakeup(self, now_ms):
+        """Số giây cần đợi tới lần poll tiếp theo: giờ đóng nến sớm nhất hoặc poll_interval"""
+        wait = None
+        for symbol, timeframe in self.keys():
+            if self.wants_partial(symbol, timeframe):
+                wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+                continue
+            state = self._state.get((symbol, timeframe))
+            if state is None or state['last_closed'] is None:
+                return 0
+            tf_ms = timeframe_to_ms(timeframe)
+            next_close = state['last_closed'] + 2 * tf_ms
+            key_wait = max(0, (next_close - now_ms) / 1000) + self.close_grace
+            wait = key_wait if wait is None else min(wait, key_wait)
+        return self.poll_interval if wait is None else wait
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.poll_once()
+            self._stop_event.wait(self.next_wakeup(int(time.time() * 1000)))
+
+
+def candle_file_path(directory, symbol, timeframe):
+    """Đường dẫn file CSV lưu nến cho một cặp symbol/timeframe"""
+    return os.path.join(directory, f"{symbol.replace('/', '_')}_{timeframe}.csv")
+
+
+def save_candles(directory, symbol, timeframe, candles):
+    """Lưu danh sách nến dạng ccxt ra file CSV để replay sau này"""
+    os.makedirs(directory, exist_ok=True)
+    path = candle_file_path(directory, symbol, timeframe)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CANDLE_COLUMNS)
+        writer.writerows(candles)
+    return path
+
+
+def load_candles(directory, symbol, timeframe):
+    """Đọc nến từ file CSV (định dạng của save_candles)"""
+    with open(candle_file_path(directory, symbol, timeframe), newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [[int(row[0])] + [float(value) for value in row[1:6]] for row in reader]
+
+
+class ReplayCandleFeed(CandleFeed):
+    """
+    Feed phát lại nến từ file local, dùng để test offline.
+    speed=None phát nhanh nhất có thể; speed=60 nghĩa là 1 phút dữ liệu trong 1 giây.
+    `warmup` nến đầu tiên được gửi một lần như dữ liệu lịch sử.
+    """
+
+    def __init__(self, directory, speed=None, warmup=200):
+        super().__init__()
+        self.directory = directory
+        self.speed = speed
+        self.warmup = warmup
+        self.finished = threading.Event()
+
+    def _key_stream(self, symbol, timeframe, rows):
+        tf_ms = timeframe_to_ms(timeframe)
+        for row in rows:
+            # Sắp theo giờ đóng nến để các timeframe khác nhau xen kẽ đúng thứ tự
+            yield row[0] + tf_ms, symbol, timeframe, row
+
+    def run(self):
+        self.finished.clear()
+        streams = []
+        for symbol, timeframe in self.keys():
+            try:
+                rows = load_candles(self.directory, symbol, timeframe)
+            except OSError as e:
+                logger.error(f"Không thể đọc dữ liệu replay cho {symbol} {timeframe}: {e}")
+                continue
+            self.publish(symbol, timeframe, rows[:self.warmup], closed=True)
+            streams.append(self._key_stream(symbol, timeframe, rows[self.warmup:]))
+
+        previous_close = None
+        for close_time, symbol, timeframe, row in heapq.merge(*streams, key=lambda item: item[0]):
+            if self._stop_event.is_set():
+                break
+            if self.speed and previous_close is not None and close_time > previous_close:
+                self._stop_event.wait((close_time - previous_close) / 1000 / self.speed)
+            previous_close = close_time
+            self.publish(symbol, timeframe, [row], closed=True)
+
+        self.finished.set()
+
+
+# Test function
+if __name__ == "__main__":
+    import sys
+    from AdvancedSMC import AdvancedSMC
+
+    if len(sys.argv) < 4:
+        print("Cách dùng: python candle_feed.py <thư mục replay> <symbol> <timeframe>")
+        sys.exit(1)
+
+    directory, symbol, timeframe = sys.argv[1:4]
+    feed = ReplayCandleFeed(directory)
+    smc = AdvancedSMC()
+
+    def print_result(result):
+        if result:
+            print(f"{result['timestamp']} {result['symbol']} {result['current_price']:.2f} "
+                  f"BOS={len(result['smc_analysis']['break_of_structure'])}")
+
+    smc.attach_feed(feed, symbol, timeframe, on_result=print_result)
+    feed.run()
@@ -0,0 +1,143 @@
+import gzip
+import json
+import struct
+import zlib
+
+import numpy as np
+
+JSON_MIMETYPE = 'application/json'
+# Định dạng nhị phân: header '<4sHHI' (magic, version, số cột, số nến)
+# rồi các cột little-endian: timestamp int64, open/high/low/close/volume float64
+BINARY_MIMETYPE = 'application/x-smc-candles'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+BINARY_MAGIC = b'SMCC'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHI')
+
+FORMATS = {
+    'json': JSON_MIMETYPE,
+    'binary': BINARY_MIMETYPE,
+    'arrow': ARROW_MIMETYPE,
+}
+
+# Payload nhỏ hơn ngưỡng này không đáng nén
+GZIP_MIN_BYTES = 1024
+
+
+def candles_etag(candles):
+    """
+    ETag (weak) theo nến cuối: đổi khi có nến mới hoặc nến đang chạy thay đổi.
+    Dùng chung cho mọi định dạng/nén vì cùng một phiên bản dữ liệu.
+    """
+    if not len(candles):
+        return 'W/"empty"'
+    last = candles.tail(1)
+    checksum = zlib.crc32(last.values.tobytes())
+    return f'W/"{candles.last_timestamp:x}-{len(candles):x}-{checksum:08x}"'
+
+
+def etag_matches(if_none_match, etag):
+    """So khớp header If-None-Match với ETag hiện tại"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    bare = etag[2:] if etag.startswith('W/') else etag
+    return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == bare for tag in tags)
+
+
+def slice_since(candles, since):
+    """
+    View các nến có timestamp >= since (ms): nến client đang có ở cuối (có thể đã thay đổi)
+    cùng các nến mới hơn.
+    """
+    if since is None:
+        return candles
+    start = int(np.searchsorted(candles.timestamp, since, side='left'))
+    return candles[start:]
+
+
+def encode_json(candles, **fields):
+    """JSON {'candles': [[ts_ms, o, h, l, c, v], ...], ...} dựng trực tiếp từ mảng cột"""
+    payload = {'candles': candles.to_rows()}
+    payload.update(fields)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def encode_binary(candles):
+    """Các cột little-endian liền nhau, client đọc thẳng thành typed array"""
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 6, len(candles))
+    return b''.join((
+        header,
+        candles.timestamp.astype('<i8', copy=False).tobytes(),
+        candles.values.astype('<f8', copy=False).tobytes(),
+    ))
+
+
+def decode_binary(data):
+    """Giải mã payload của encode_binary (dùng cho test và client Python)"""
+    magic, version, columns, count = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Payload nến nhị phân không hợp lệ")
+    offset = BINARY_HEADER.size
+    timestamp = np.frombuffer(data, dtype='<i8', count=count, offset=offset)
+    values = np.frombuffer(data, dtype='<f8', count=(columns - 1) * count, offset=offset + 8 * count)
+    return timestamp, values.reshape(columns - 1, count)
+
+
+def encode_arrow(candles):
+    """Arrow IPC stream (cần pyarrow, không bắt buộc)"""
+    import pyarrow as pa
+    table = pa.table({
+        'timestamp': pa.array(candles.timestamp, type=pa.int64()),
+        'open': candles.open,
+        'high': candles.high,
+        'low': candles.low,
+        'close': candles.close,
+        'volume': candles.volume,
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate_format(requested, accept_mimetypes):
+    """Chọn định dạng theo ?format=... hoặc header Accept; mặc định JSON"""
+    if requested:
+        fmt = requested.lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Định dạng không hỗ trợ: {requested}")
+        return fmt
+    offered = [JSON_MIMETYPE, BINARY_MIMETYPE] + ([ARROW_MIMETYPE] if arrow_available() else [])
+    best = accept_mimetypes.best_match(offered, default=JSON_MIMETYPE) if accept_mimetypes else JSON_MIMETYPE
+    return next(fmt for fmt, mimetype in FORMATS.items() if mimetype == best)
+
+
+def encode_candles(candles, fmt='json', accept_encoding='', **fields):
+    """
+    Mã hóa nến theo định dạng đã chọn, nén gzip nếu client hỗ trợ.
+    Trả về (body, headers). Với định dạng nhị phân, các trường phụ nằm trong header X-Chart-*.
+    """
+    headers = {'Content-Type': FORMATS[fmt], 'Vary': 'Accept, Accept-Encoding'}
+    if fmt == 'json':
+        body = encode_json(candles, **fields)
+    else:
+        body = encode_binary(candles) if fmt == 'binary' else encode_arrow(candles)
+        for name, value in fields.items():
+            headers[f"X-Chart-{name.replace('_', '-').title()}"] = str(value)
+
+    if 'gzip' in (accept_encoding or '').lower() and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+
+    headers['Content-Length'] = str(len(body))
+    return body, headers
@@ -0,0 +1,321 @@
+import threading
+import time
+
+import numpy as np
+
+from craw_data import timeframe_to_ms
+
+
+def _lookup(timestamps, closes, targets):
+    """Giá đóng cửa tại từng timestamp trong targets (nan nếu series không có nến đó)"""
+    if not len(timestamps):
+        return np.full(len(targets), np.nan)
+    positions = np.minimum(np.searchsorted(timestamps, targets), len(timestamps) - 1)
+    return np.where(timestamps[positions] == targets, closes[positions], np.nan)
+
+
+def _log_returns(timestamps, closes, targets, tf_ms):
+    """(returns, valid) của các nến targets: log(close_t / close_{t - 1 nến}), 0 nếu thiếu một trong hai"""
+    current = _lookup(timestamps, closes, targets)
+    previous = _lookup(timestamps, closes, targets - tf_ms)
+    valid = (current > 0) & (previous > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(valid, np.log(current / previous), 0.0)
+    return returns, valid
+
+
+class ReturnCorrelation:
+    """
+    Ma trận tương quan log-return giữa các symbol trên lưới timestamp chung của một timeframe,
+    cửa sổ trượt `window` nến.
+
+    Giữ return của cửa sổ trong ring buffer (window x symbol) và các tổng tích lũy theo từng cặp
+    (số nến chung, tổng x, tổng x^2, tổng xy chỉ tính trên các nến cả hai cùng có dữ liệu).
+    Mỗi nến đóng chỉ cộng dòng mới / trừ dòng rơi khỏi cửa sổ bằng một cập nhật hạng 2 (O(n^2)),
+    không tính lại cả ma trận (O(window * n^2)). Symbol mới hoặc bị thiếu nến rồi có lại dữ liệu
+    chỉ tính lại hàng/cột của nó; tính lại toàn bộ khi quá nhiều cột đổi và sau mỗi `window` nến
+    (tránh sai số cộng dồn).
+    """
+
+    def __init__(self, timeframe, window=200, min_periods=30, capacity=64):
+        self.timeframe = timeframe
+        self.tf_ms = timeframe_to_ms(timeframe)
+        self.window = window
+        self.min_periods = min_periods
+        self.grid_end = None  # timestamp (ms) của nến mới nhất đã đưa vào cửa sổ
+        self.updated_at = 0.0
+        self._symbols = []
+        self._index = {}
+        self._series = []  # theo cột: (timestamps, closes) các nến đã đóng gần nhất
+        self._pending = []  # theo cột: {timestamp: return (nan nếu thiếu nến trước)} các nến sau grid_end
+        self._allocate(capacity)
+        self._stale = True  # tổng tích lũy cần tính lại toàn bộ
+        self._dirty = set()  # cột cần tính lại hàng/cột
+        self._pushes = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self, capacity):
+        self._returns = np.zeros((self.window, capacity))
+        self._valid = np.zeros((self.window, capacity), dtype=bool)
+        self._covered = np.full(capacity, -1, dtype=np.int64)  # nến cuối cột đã có dữ liệu thật
+        self._counts = np.zeros((capacity, capacity))
+        self._sums = np.zeros((capacity, capacity))  # [i, j]: tổng x_i trên các nến chung của i, j
+        self._squares = np.zeros((capacity, capacity))
+        self._products = np.zeros((capacity, capacity))
+
+    def _column(self, symbol):
+        """Cột của symbol (gọi khi đang giữ _lock)"""
+        column = self._index.get(symbol)
+        if column is None:
+            column = len(self._symbols)
+            if column == self._returns.shape[1]:
+                # Hết chỗ: tăng gấp đôi (giữ ring buffer, tính lại tổng ở lần truy vấn sau)
+                old = self._returns, self._valid, self._covered
+                self._allocate(2 * column)
+                self._returns[:, :column], self._valid[:, :column], self._covered[:column] = old
+                self._stale = True
+            self._symbols.append(symbol)
+            self._index[symbol] = column
+            self._series.append((np.zeros(0, dtype=np.int64), np.zeros(0)))
+            self._pending.append({})
+        return column
+
+    def _rows(self, timestamps):
+        return (timestamps // self.tf_ms) % self.window
+
+    def _window_timestamps(self):
+        return self.grid_end - self.tf_ms * np.arange(self.window - 1, -1, -1, dtype=np.int64)
+
+    def _fill_column(self, column):
+        """Viết lại cột trong ring buffer từ series của symbol (tổng tích lũy: đánh dấu dirty)"""
+        timestamps, closes = self._series[column]
+        targets = self._window_timestamps()
+        returns, valid = _log_returns(timestamps, closes, targets, self.tf_ms)
+        rows = self._rows(targets)
+        self._returns[rows, column] = returns
+        self._valid[rows, column] = valid
+        self._covered[column] = min(int(timestamps[-1]), self.grid_end) if len(timestamps) else -1
+        self._dirty.add(column)
+
+    def update(self, symbol, candles, now_ms=None):
+        """
+        Ghi nến mới nhất của symbol (OHLCV, nến đang chạy bị bỏ qua).
+        Dòng mới của ma trận chỉ được thêm khi gọi advance(), sau khi đã update các symbol.
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        closed = candles.timestamp + self.tf_ms <= now_ms
+        timestamps = candles.timestamp[closed][-(self.window + 1):]
+        closes = candles.close[closed][-(self.window + 1):]
+        with self._lock:
+            column = self._column(symbol)
+            self._series[column] = (timestamps, closes)
+            if self.grid_end is None or not len(timestamps):
+                return
+            newer = timestamps[timestamps > self.grid_end]
+            returns, valid = _log_returns(timestamps, closes, newer, self.tf_ms)
+            self._pending[column] = dict(zip(newer.tolist(), np.where(valid, returns, np.nan).tolist()))
+            covered = self._covered[column]
+            if covered < self.grid_end and timestamps[-1] > covered:
+                # Symbol mới, hoặc trước đó thiếu nến đã vào cửa sổ mà giờ có dữ liệu
+                self._fill_column(column)
+
+    def advance(self, up_to=None):
+        """
+        Đưa các nến đã đóng tới up_to vào cửa sổ (mặc định: nến mới nhất mà ít nhất một nửa
+        số symbol đã có, để symbol chậm không làm cả dòng thiếu dữ liệu). Trả về số dòng đã thêm.
+        """
+        with self._lock:
+            n = len(self._symbols)
+            lasts = [int(timestamps[-1]) for timestamps, _ in self._series if len(timestamps)]
+            if not lasts:
+                return 0
+            if up_to is None:
+                up_to = sorted(lasts)[(len(lasts) - 1) // 2]
+            if self.grid_end is None:
+                self.grid_end = up_to
+                for column in range(n):
+                    self._fill_column(column)
+                self._stale = True
+                self.updated_at = time.time()
+                return self.window
+            if up_to <= self.grid_end:
+                return 0
+
+            steps = (up_to - self.grid_end) // self.tf_ms
+            targets = up_to - self.tf_ms * np.arange(min(steps, self.window) - 1, -1, -1, dtype=np.int64)
+            incremental = not self._stale and len(targets) <= self.window // 4
+            if incremental:
+                # Vài nến mới: lấy return đã tính sẵn lúc update (tra dict, không searchsorted từng cột)
+                rows = [[pending.get(target) for pending in self._pending] for target in targets.tolist()]
+                present = np.array([[value is not None for value in row] for row in rows], dtype=bool)
+                returns = np.array([[np.nan if value is None else value for value in row] for row in rows])
+                valid = ~np.isnan(returns)
+                returns[~valid] = 0.0
+            else:
+                returns = np.zeros((len(targets), n))
+                valid = np.zeros((len(targets), n), dtype=bool)
+                for column, (timestamps, closes) in enumerate(self._series):
+                    returns[:, column], valid[:, column] = _log_returns(timestamps, closes, targets, self.tf_ms)
+                present = valid
+            covered = present.any(axis=0)
+            last_present = targets[len(targets) - 1 - np.argmax(present[::-1], axis=0)]
+            self._covered[:n] = np.where(covered, np.maximum(self._covered[:n], last_present), self._covered[:n])
+
+            for target, row_returns, row_valid in zip(targets, returns, valid):
+                row = int(self._rows(target))
+                if incremental:
+                    self._push(row, row_returns, row_valid)
+                self._returns[row, :n] = row_returns
+                self._valid[row, :n] = row_valid
+            if not incremental:
+                self._stale = True
+            self.grid_end = int(up_to)
+            self.updated_at = time.time()
+            return len(targets)
+
+    def _push(self, row, returns, valid):
+        """Cập nhật hạng 2 các tổng tích lũy: cộng dòng mới, trừ dòng cũ cùng vị trí ring"""
+        n = len(returns)
+        old_returns = self._returns[row, :n]
+        old_valid = self._valid[row, :n].astype(np.float64)
+        valid = valid.astype(np.float64)
+        masks = np.stack([valid, old_valid])
+        signed = np.stack([returns, -old_returns])
+        for matrix, left, right in ((self._counts, np.stack([valid, -old_valid]), masks),
+                                    (self._sums, signed, masks),
+                                    (self._squares, signed * np.stack([returns, old_returns]), masks),
+                                    (self._products, signed, np.stack([returns, old_returns]))):
+            view = matrix[:n, :n]
+            np.add(view, np.einsum('ki,kj->ij', left, right), out=view)
+        self._pushes += 1
+        if self._pushes >= self.window:
+            self._stale = True
+
+    def _recompute(self):
+        """Tính lại tổng tích lũy từ ring buffer: toàn bộ nếu stale, ngược lại chỉ các cột dirty"""
+        n = len(self._symbols)
+        if not self._stale and not self._dirty:
+            return
+        returns = self._returns[:, :n]
+        valid = self._valid[:, :n].astype(np.float64)
+        squares = returns * returns
+        if self._stale or len(self._dirty) > n // 4:
+            self._counts[:n, :n] = valid.T @ valid
+            self._sums[:n, :n] = returns.T @ valid
+            self._squares[:n, :n] = squares.T @ valid
+            self._products[:n, :n] = returns.T @ returns
+            self._pushes = 0
+        else:
+            columns = np.array(sorted(self._dirty))
+            for matrix, left, right in ((self._counts, valid, valid), (self._sums, returns, valid),
+                                        (self._squares, squares, valid), (self._products, returns, returns)):
+                matrix[:n, columns] = left.T @ right[:, columns]
+                matrix[columns, :n] = (right.T @ left[:, columns]).T
+        self._stale = False
+        self._dirty.clear()
+
+    def _correlation(self):
+        """Ma trận tương quan Pearson các cột hiện có (nan nếu ít hơn min_periods nến chung)"""
+        self._recompute()
+        n = len(self._symbols)
+        counts = self._counts[:n, :n]
+        sums = self._sums[:n, :n]
+        variances = counts * self._squares[:n, :n] - sums * sums
+        covariance = counts * self._products[:n, :n] - sums * sums.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = covariance / np.sqrt(variances * variances.T)
+        correlation[(counts < self.min_periods) | ~(variances > 0) | ~(variances.T > 0)] = np.nan
+        np.clip(correlation, -1.0, 1.0, out=correlation)
+        return correlation, counts
+
+    def matrix(self, symbols=None):
+        """(symbols, ma trận tương quan) theo thứ tự symbols (symbol chưa có dữ liệu: hàng nan)"""
+        with self._lock:
+            correlation, _ = self._correlation()
+            if symbols is None:
+                return list(self._symbols), correlation
+            columns = np.array([self._index.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        result = np.full((len(columns), len(columns)), np.nan)
+        known = np.flatnonzero(columns >= 0)
+        result[np.ix_(known, known)] = correlation[np.ix_(columns[known], columns[known])]
+        return list(symbols), result
+
+    def top_pairs(self, k=20, symbol=None, absolute=False):
+        """
+        k cặp tương quan cao nhất (absolute: theo trị tuyệt đối, gồm cả tương quan âm);
+        có symbol thì chỉ các cặp của symbol đó.
+        """
+        with self._lock:
+            correlation, counts = self._correlation()
+            symbols = list(self._symbols)
+            column = self._index.get(symbol) if symbol is not None else None
+        if symbol is not None:
+            if column is None:
+                return []
+            seconds = np.arange(len(symbols))
+            seconds = seconds[seconds != column]
+            firsts = np.full(len(seconds), column)
+        else:
+            firsts, seconds = np.triu_indices(len(symbols), 1)
+        values = correlation[firsts, seconds]
+        scores = np.abs(values) if absolute else values.copy()
+        scores[np.isnan(scores)] = -np.inf
+        k = min(k, int(np.count_nonzero(np.isfinite(scores))))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{
+            'symbols': [symbols[firsts[i]], symbols[seconds[i]]],
+            'correlation': float(values[i]),
+            'periods': int(counts[firsts[i], seconds[i]]),
+        } for i in top.tolist()]
+
+    def clusters(self, threshold=0.8, min_size=2):
+        """
+        Nhóm các symbol đi cùng nhau: thành phần liên thông của đồ thị tương quan >= threshold.
+        Leader của nhóm là symbol có tương quan trung bình cao nhất với các thành viên còn lại.
+        """
+        with self._lock:
+            correlation, _ = self._correlation()
+            symbols = list(self._symbols)
+        adjacency = correlation >= threshold
+        np.fill_diagonal(adjacency, False)
+        unvisited = np.ones(len(symbols), dtype=bool)
+        clusters = []
+        for start in np.flatnonzero(adjacency.any(axis=1)).tolist():
+            if not unvisited[start]:
+                continue
+            members = np.zeros(len(symbols), dtype=bool)
+            frontier = np.zeros(len(symbols), dtype=bool)
+            frontier[start] = True
+            while frontier.any():
+                members |= frontier
+                frontier = adjacency[frontier].any(axis=0) & ~members
+            unvisited &= ~members
+            indices = np.flatnonzero(members)
+            if len(indices) < min_size:
+                continue
+            block = correlation[np.ix_(indices, indices)].copy()
+            np.fill_diagonal(block, np.nan)
+            mean = np.nanmean(block, axis=1)
+            clusters.append({
+                'leader': symbols[indices[int(np.argmax(mean))]],
+                'symbols': [symbols[i] for i in indices[np.argsort(-mean)]],
+                'size': len(indices),
+                'mean_correlation': float(np.nanmean(block)),
+            })
+        clusters.sort(key=lambda cluster: -cluster['size'])
+        return clusters
+
+    def stats(self):
+        with self._lock:
+            n = len(self._symbols)
+            return {
+                'timeframe': self.timeframe,
+                'symbols': n,
+                'window': self.window,
+                'grid_end': int(self.grid_end // 1000) if self.grid_end is not None else None,
+                'covered': int(np.count_nonzero(self._covered[:n] == self.grid_end)) if self.grid_end else 0,
+                'updated_at': self.updated_at or None,
+            }
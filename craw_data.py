@@ -1,12 +1,50 @@
-import ccxt
-import pandas as pd
 import numpy as np
 import time
+from exchange_adapter import get_exchange, get_mode
+from ohlcv import OHLCV
+from snapshot import candle_tails
+
+# pandas chỉ được import khi cần (indicators, dữ liệu giả) để khởi động process nhanh
 
 # Lấy nến đóng và mở rộng hàm fetch_ohlcv để hỗ trợ nhiều timeframe hơn
 
+TIMEFRAME_UNIT_MS = {
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+    'M': 30 * 24 * 60 * 60 * 1000,
+}
+
+def timeframe_to_ms(timeframe):
+    """Đổi timeframe dạng '15m', '4h', '1d'... sang số mili giây"""
+    try:
+        return int(timeframe[:-1]) * TIMEFRAME_UNIT_MS[timeframe[-1]]
+    except (KeyError, ValueError, IndexError):
+        raise ValueError(f"Timeframe không hợp lệ: {timeframe}")
+
+# Nến tuần của exchange mở vào thứ Hai, còn epoch (1970-01-01) là thứ Năm
+TIMEFRAME_OFFSET_MS = {'1w': 4 * 24 * 60 * 60 * 1000}
+
+def candle_open_time(timeframe, now_ms):
+    """Thời điểm mở (ms) của nến đang chạy tại now_ms"""
+    tf_ms = timeframe_to_ms(timeframe)
+    offset = TIMEFRAME_OFFSET_MS.get(timeframe, 0)
+    return (now_ms - offset) // tf_ms * tf_ms + offset
+
+def next_candle_close(timeframe, now_ms):
+    """Thời điểm đóng (ms) của nến đang chạy tại now_ms"""
+    return candle_open_time(timeframe, now_ms) + timeframe_to_ms(timeframe)
+
 def fetch_ohlcv(exchange_name, symbol, timeframe, limit):
-    """Fetch OHLCV data từ exchange được chỉ định"""
+    """Fetch OHLCV data từ exchange được chỉ định (dạng DataFrame cho code cũ)"""
+    candles = fetch_candles(exchange_name, symbol, timeframe, limit)
+    if candles is None:
+        return None
+    return candles.to_frame()
+
+def fetch_candles(exchange_name, symbol, timeframe, limit):
+    """Fetch OHLCV từ exchange, trả về container OHLCV (int64 ms + float64, không qua pandas)"""
     try:
         # Map timeframe để tương thích với CCXT
         timeframe_map = {
@@ -28,32 +66,44 @@ def fetch_ohlcv(exchange_name, symbol, timeframe, limit):
         # Chuyển đổi timeframe
         ccxt_timeframe = timeframe_map.get(timeframe, timeframe)
         
-        # Tạo exchange instance với cấu hình
+        # Exchange instance dùng chung với cấu hình
         exchange_config = {
             'timeout': 30000,  # 30 seconds timeout
             'enableRateLimit': True,
             'sandbox': False,
         }
         
-        exchange = getattr(ccxt, exchange_name)(exchange_config)
+        exchange = get_exchange(exchange_name, exchange_config)
         
         # Thử kết nối và lấy dữ liệu
         print(f"Đang lấy dữ liệu {symbol} {timeframe} từ {exchange_name}...")
         
+        # Đã có đuôi nến (lần fetch trước hoặc snapshot lúc khởi động): chỉ lấy từ nến cuối đã có
+        tail = candle_tails.get(exchange_name, symbol, timeframe)
+        since = tail.last_timestamp if tail is not None and len(tail) >= limit else None
+        
         # Retry mechanism
         max_retries = 3
         for attempt in range(max_retries):
             try:
+                if since is not None:
+                    ohlcv = exchange.fetch_ohlcv(symbol, ccxt_timeframe, since=since, limit=limit)
+                    if ohlcv and len(ohlcv) < limit and ohlcv[0][0] <= since:
+                        candles = candle_tails.merge(exchange_name, symbol, timeframe, OHLCV.from_rows(ohlcv))
+                        print(f"Đã cập nhật {len(ohlcv)} nến {timeframe} từ {exchange_name}")
+                        return candles.tail(limit)
+                    # Thiếu nhiều hơn limit nến hoặc exchange không trả nến since: lấy lại đầy đủ
+                    since = None
+                
                 ohlcv = exchange.fetch_ohlcv(symbol, ccxt_timeframe, limit=limit)
                 
                 if not ohlcv:
                     raise Exception("Không có dữ liệu được trả về")
                 
-                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+                candles = candle_tails.merge(exchange_name, symbol, timeframe, OHLCV.from_rows(ohlcv), replace=True)
                 
-                print(f"Đã lấy được {len(df)} nến {timeframe} từ {exchange_name}")
-                return df
+                print(f"Đã lấy được {len(candles)} nến {timeframe} từ {exchange_name}")
+                return candles.tail(limit)
                 
             except Exception as e:
                 print(f"Lần thử {attempt + 1} thất bại: {e}")
@@ -65,9 +115,13 @@ def fetch_ohlcv(exchange_name, symbol, timeframe, limit):
     except Exception as e:
         print(f"Lỗi khi lấy dữ liệu từ {exchange_name} cho {symbol}: {e}")
         
+        # Khi record/replay không dùng dữ liệu giả, để lỗi hiện ra trong kết quả đo
+        if get_mode() != 'live':
+            return None
+        
         # Fallback: Tạo dữ liệu giả để test
         print("Tạo dữ liệu giả để test...")
-        return create_sample_data(limit, timeframe)
+        return OHLCV.from_frame(create_sample_data(limit, timeframe))
 
 
 # bỏ phần này
@@ -75,6 +129,7 @@ def create_sample_data(limit=200, timeframe='4h'):
     """Tạo dữ liệu giả để test với timeframe cụ thể"""
     import random
     from datetime import datetime, timedelta
+    import pandas as pd
     
     # Map timeframe to hours
     timeframe_hours = {
@@ -126,6 +181,7 @@ def create_sample_data(limit=200, timeframe='4h'):
 
 def calculate_rsi(prices, period=14):
     """Calculate RSI without TA-Lib"""
+    import pandas as pd
     if len(prices) < period:
         return pd.Series([np.nan] * len(prices))
     
@@ -151,25 +207,29 @@ def calculate_ema(prices, period):
 
 def calculate_indicators(df_display, df_calc):
     """Tính toán indicators không cần TA-Lib"""
+    import pandas as pd
     try:
         indicators = {}
         
         if len(df_calc) > 14:
+            # df_calc có thể là DataFrame hoặc OHLCV; bọc cột close thành Series không sao chép
+            close = pd.Series(df_calc['close'], copy=False)
+            
             # RSI
-            rsi_values = calculate_rsi(df_calc['close'])
+            rsi_values = calculate_rsi(close)
             indicators['rsi'] = float(rsi_values.iloc[-1]) if not pd.isna(rsi_values.iloc[-1]) else 50
             
             # Moving Averages
-            sma_20 = calculate_sma(df_calc['close'], 20)
-            indicators['sma_20'] = float(sma_20.iloc[-1]) if not pd.isna(sma_20.iloc[-1]) else float(df_calc['close'].iloc[-1])
+            sma_20 = calculate_sma(close, 20)
+            indicators['sma_20'] = float(sma_20.iloc[-1]) if not pd.isna(sma_20.iloc[-1]) else float(close.iloc[-1])
             
-            ema_20 = calculate_ema(df_calc['close'], 20)
-            indicators['ema_20'] = float(ema_20.iloc[-1]) if not pd.isna(ema_20.iloc[-1]) else float(df_calc['close'].iloc[-1])
+            ema_20 = calculate_ema(close, 20)
+            indicators['ema_20'] = float(ema_20.iloc[-1]) if not pd.isna(ema_20.iloc[-1]) else float(close.iloc[-1])
             
             # Price info
-            indicators['current_price'] = float(df_calc['close'].iloc[-1])
-            indicators['price_change'] = float(df_calc['close'].iloc[-1] - df_calc['close'].iloc[-2])
-            indicators['price_change_pct'] = float((indicators['price_change'] / df_calc['close'].iloc[-2]) * 100)
+            indicators['current_price'] = float(close.iloc[-1])
+            indicators['price_change'] = float(close.iloc[-1] - close.iloc[-2])
+            indicators['price_change_pct'] = float((indicators['price_change'] / close.iloc[-2]) * 100)
         
         return indicators
         
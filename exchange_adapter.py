@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tên exchange dùng trong API/bot -> tên class trong ccxt
+EXCHANGE_CLASS_NAMES = {
+    'gate.io': 'gateio',
+}
+
+EXCHANGE_MODES = ('live', 'record', 'replay')
+
+# Cấu hình adapter, đọc từ biến môi trường và có thể đổi lại bằng configure()
+_settings = {
+    'mode': os.getenv('SMC_EXCHANGE_MODE', 'live').lower(),
+    'directory': os.getenv('SMC_EXCHANGE_DIR', 'exchange_records'),
+    'latency': float(os.getenv('SMC_REPLAY_LATENCY_MS', '0')) / 1000,
+    'jitter': float(os.getenv('SMC_REPLAY_JITTER_MS', '0')) / 1000,
+    'error_rate': float(os.getenv('SMC_REPLAY_ERROR_RATE', '0')),
+    'seed': int(os.environ['SMC_REPLAY_SEED']) if os.getenv('SMC_REPLAY_SEED') else None,
+}
+_replay_exchanges = {}
+_replay_lock = threading.Lock()
+# Exchange dùng lại giữa các request (giữ markets đã load và session HTTP)
+_shared_exchanges = {}
+_shared_lock = threading.Lock()
+
+
+def exchange_id(exchange_name):
+    """Chuẩn hóa tên exchange sang id của ccxt"""
+    name = exchange_name.lower()
+    return EXCHANGE_CLASS_NAMES.get(name, name)
+
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9.-]', '_', str(value))
+
+
+def _markets_path(directory, exchange):
+    return os.path.join(directory, exchange, 'markets.json')
+
+
+def _ohlcv_dir(directory, exchange, symbol, timeframe):
+    return os.path.join(directory, exchange, 'ohlcv', _safe_name(symbol), timeframe)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def save_markets(directory, exchange_name, markets):
+    """Ghi markets theo định dạng ReplayExchange đọc được"""
+    _write_json(_markets_path(directory, exchange_id(exchange_name)), markets)
+
+
+def save_ohlcv(directory, exchange_name, symbol, timeframe, rows, file_name='latest_all.json'):
+    """Ghi nến dạng ccxt [[timestamp_ms, open, high, low, close, volume], ...] để ReplayExchange phát lại"""
+    _write_json(os.path.join(_ohlcv_dir(directory, exchange_id(exchange_name), symbol, timeframe), file_name), rows)
+
+
+class RecordingExchange:
+    """
+    Bọc một exchange ccxt thật và ghi lại response của load_markets/fetch_ohlcv
+    ra file để ReplayExchange phát lại sau này.
+    """
+
+    def __init__(self, exchange, directory):
+        self._exchange = exchange
+        self._directory = directory
+
+    def __getattr__(self, name):
+        return getattr(self._exchange, name)
+
+    def load_markets(self, reload=False, params={}):
+        markets = self._exchange.load_markets(reload, params)
+        save_markets(self._directory, self._exchange.id, markets)
+        return markets
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        rows = self._exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit, params=params)
+        if rows:
+            file_name = f"{since if since is not None else 'latest'}_{limit if limit else 'all'}.json"
+            save_ohlcv(self._directory, self._exchange.id, symbol, timeframe, rows, file_name)
+        return rows
+
+
+class ReplayExchange:
+    """
+    Exchange giả lập phát lại dữ liệu đã ghi bởi RecordingExchange, không cần mạng.
+    Có thể thêm độ trễ (latency + jitter, tính bằng giây) và lỗi ngẫu nhiên (error_rate)
+    với seed cố định để các lần chạy đo hiệu năng lặp lại được.
+    """
+
+    def __init__(self, exchange_name, directory, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.id = exchange_id(exchange_name)
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.has = {'fetchMarkets': True, 'fetchOHLCV': True}
+        self.markets = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ohlcv = {}
+
+    def _simulate(self, method):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            import ccxt
+            raise ccxt.NetworkError(f"{self.id} {method}: lỗi mạng giả lập (replay)")
+
+    def load_markets(self, reload=False, params={}):
+        self._simulate('load_markets')
+        if self.markets is None or reload:
+            path = _markets_path(self.directory, self.id)
+            if not os.path.exists(path):
+                import ccxt
+                raise ccxt.ExchangeNotAvailable(f"Không có dữ liệu markets đã ghi cho {self.id}: {path}")
+            with open(path) as f:
+                self.markets = json.load(f)
+        return self.markets
+
+    def _load_rows(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        with self._lock:
+            if key in self._ohlcv:
+                return self._ohlcv[key]
+
+        # Gộp tất cả các lần ghi của cặp này, nến trùng timestamp lấy bản ghi mới nhất
+        rows_by_time = {}
+        directory = _ohlcv_dir(self.directory, self.id, symbol, timeframe)
+        if os.path.isdir(directory):
+            files = sorted(os.listdir(directory), key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(directory, name)) as f:
+                    for row in json.load(f):
+                        rows_by_time[row[0]] = row
+        rows = [rows_by_time[ts] for ts in sorted(rows_by_time)]
+
+        with self._lock:
+            self._ohlcv[key] = rows
+        return rows
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        self._simulate('fetch_ohlcv')
+        rows = self._load_rows(symbol, timeframe)
+        if not rows:
+            import ccxt
+            raise ccxt.BadSymbol(f"Không có dữ liệu đã ghi cho {symbol} {timeframe} trên {self.id}")
+
+        if since is not None:
+            rows = [row for row in rows if row[0] >= since]
+            return [list(row) for row in (rows[:limit] if limit else rows)]
+        return [list(row) for row in (rows[-limit:] if limit else rows)]
+
+
+def configure(mode=None, directory=None, latency=None, jitter=None, error_rate=None, seed=None):
+    """Đổi cấu hình adapter lúc chạy (mode: live | record | replay)"""
+    if mode is not None:
+        mode = mode.lower()
+        if mode not in EXCHANGE_MODES:
+            raise ValueError(f"Chế độ exchange không hợp lệ: {mode}")
+        _settings['mode'] = mode
+    for name, value in (('directory', directory), ('latency', latency), ('jitter', jitter),
+                        ('error_rate', error_rate), ('seed', seed)):
+        if value is not None:
+            _settings[name] = value
+    with _replay_lock:
+        _replay_exchanges.clear()
+    with _shared_lock:
+        _shared_exchanges.clear()
+
+
+def get_mode():
+    """Chế độ hiện tại của adapter"""
+    return _settings['mode']
+
+
+def create_exchange(exchange_name, config=None):
+    """
+    Tạo exchange theo chế độ hiện tại:
+    live   -> exchange ccxt thật
+    record -> exchange ccxt thật, ghi lại response ra file
+    replay -> ReplayExchange đọc từ file (dùng chung một instance cho mỗi exchange)
+    """
+    name = exchange_id(exchange_name)
+    mode = _settings['mode']
+
+    if mode == 'replay':
+        with _replay_lock:
+            if name not in _replay_exchanges:
+                _replay_exchanges[name] = ReplayExchange(
+                    name, _settings['directory'],
+                    latency=_settings['latency'], jitter=_settings['jitter'],
+                    error_rate=_settings['error_rate'], seed=_settings['seed'],
+                )
+            return _replay_exchanges[name]
+
+    import ccxt
+    exchange = getattr(ccxt, name)(config or {})
+    if mode == 'record':
+        return RecordingExchange(exchange, _settings['directory'])
+    return exchange
+
+
+def get_exchange(exchange_name, config=None):
+    """
+    Exchange dùng chung trong process: chỉ khởi tạo (và load markets) một lần
+    thay vì tạo instance mới cho mỗi lần lấy dữ liệu.
+    """
+    name = exchange_id(exchange_name)
+    with _shared_lock:
+        exchange = _shared_exchanges.get(name)
+        if exchange is None:
+            exchange = create_exchange(name, config)
+            _shared_exchanges[name] = exchange
+        return exchange
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ghi dữ liệu exchange để replay offline")
+    parser.add_argument('exchange', help="Tên exchange, ví dụ binance")
+    parser.add_argument('symbols', nargs='+', help="Các cặp cần ghi, ví dụ BTC/USDT ETH/USDT")
+    parser.add_argument('--timeframes', default='15m,1h,4h,1d,3d,1w')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--directory', default=_settings['directory'])
+    args = parser.parse_args()
+
+    configure(mode='record', directory=args.directory)
+    exchange = create_exchange(args.exchange, {'enableRateLimit': True, 'timeout': 30000})
+    exchange.load_markets()
+    for symbol in args.symbols:
+        for timeframe in args.timeframes.split(','):
+            rows = exchange.fetch_ohlcv(symbol, timeframe, limit=args.limit)
+            print(f"Đã ghi {len(rows)} nến {symbol} {timeframe}")
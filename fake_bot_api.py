@@ -0,0 +1,243 @@
+# Telegram Bot API giả lập để chạy bot/outbound queue offline (test, đo tải)
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+
+import aiohttp
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """
+    Server HTTP trả lời các method Bot API mà bot dùng (getMe, sendMessage, editMessageText, ...).
+    Mô phỏng flood limit: vượt global_rate msg/s hoặc chat_rate msg/s mỗi chat thì trả 429 kèm retry_after.
+    Sau setWebhook, push_update() POST update tới webhook của bot (không thì xếp vào getUpdates)
+    và đo độ trễ từ lúc gửi update tới message trả lời đầu tiên của bot cho chat đó.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, latency=0.0):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.latency = latency
+        self.messages = []
+        self.rejected = 0
+        self.requests = Counter()
+        self.updates = asyncio.Queue()
+        self._recent = deque()
+        self._last_by_chat = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._runner = None
+        self._session = None
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.pushed = 0
+        self._awaiting_reply = {}  # chat_id -> deque thời điểm push các update chưa được trả lời
+        self.reply_latencies = []
+        self.listeners = []  # listener(chat_id, method, params) sau mỗi sendMessage/editMessageText thành công
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_get('/stats', self.handle_stats)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8081):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def push_update(self, update):
+        """Gửi update cho bot: POST tới webhook nếu đã setWebhook, ngược lại xếp vào getUpdates"""
+        chat_id = self.update_chat_id(update)
+        if chat_id is not None:
+            self._awaiting_reply.setdefault(chat_id, deque()).append(time.monotonic())
+        self.pushed += 1
+        if not self.webhook_url:
+            await self.updates.put(update)
+            return 200
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+        async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+            return response.status
+
+    @staticmethod
+    def update_chat_id(update):
+        if 'message' in update:
+            return update['message']['chat']['id']
+        if 'callback_query' in update:
+            return update['callback_query']['message']['chat']['id']
+        return None
+
+    def record_reply(self, chat_id):
+        waiting = self._awaiting_reply.get(chat_id)
+        if waiting:
+            self.reply_latencies.append(time.monotonic() - waiting.popleft())
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({'ok': True, 'result': result})
+
+    def too_many_requests(self, retry_after):
+        self.rejected += 1
+        return web.json_response({
+            'ok': False, 'error_code': 429,
+            'description': f"Too Many Requests: retry after {retry_after}",
+            'parameters': {'retry_after': retry_after},
+        }, status=429)
+
+    async def params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+        data = dict(await request.post())
+        for name, value in data.items():
+            # PTB gửi các giá trị phức tạp (reply_markup, ...) dưới dạng chuỗi JSON
+            if isinstance(value, str) and value[:1] in '{[':
+                try:
+                    data[name] = json.loads(value)
+                except ValueError:
+                    pass
+        return data
+
+    def rate_limited(self, chat_id):
+        """Số giây phải chờ nếu message này vượt flood limit, None nếu hợp lệ"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.global_rate:
+            return 1
+        last = self._last_by_chat.get(chat_id)
+        if last is not None and now - last < 1 / self.chat_rate:
+            return 1
+        self._recent.append(now)
+        self._last_by_chat[chat_id] = now
+        return None
+
+    def message(self, chat_id, text, message_id=None):
+        return {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        }
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self.params(request)
+        self.requests[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            return self.ok({'id': 1, 'is_bot': True, 'first_name': 'Fake SMC', 'username': 'fake_smc_bot',
+                            'can_join_groups': True, 'can_read_all_group_messages': False,
+                            'supports_inline_queries': False})
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            retry_after = self.rate_limited(chat_id)
+            if retry_after is not None:
+                return self.too_many_requests(retry_after)
+            message = self.message(chat_id, params.get('text', ''), params.get('message_id') and int(params['message_id']))
+            self.messages.append({'method': method, 'chat_id': chat_id, 'text': message['text'], 'at': time.time()})
+            self.record_reply(chat_id)
+            for listener in self.listeners:
+                listener(chat_id, method, params)
+            return self.ok(message)
+        if method == 'getUpdates':
+            timeout = float(params.get('timeout', 0) or 0)
+            updates = []
+            try:
+                updates.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01)))
+                while not self.updates.empty():
+                    updates.append(self.updates.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+            return self.ok(updates)
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url') or None
+            self.webhook_secret = params.get('secret_token')
+            return self.ok(True)
+        if method == 'deleteWebhook':
+            self.webhook_url = None
+            return self.ok(True)
+        if method in ('answerCallbackQuery', 'setMyCommands', 'close', 'logOut'):
+            return self.ok(True)
+        return web.json_response({'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'},
+                                 status=404)
+
+    async def handle_stats(self, request):
+        chats = Counter(message['chat_id'] for message in self.messages)
+        latencies = sorted(self.reply_latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else 0.0
+
+        return web.json_response({
+            'messages': len(self.messages),
+            'rejected_429': self.rejected,
+            'chats': len(chats),
+            'requests': dict(self.requests),
+            'updates_pushed': self.pushed,
+            'webhook': self.webhook_url,
+            'reply_latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)},
+        })
+
+    def text_update(self, chat_id, text, user_id=None):
+        """Tạo update message (dạng JSON Bot API) như khi user gửi text cho bot"""
+        return {
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': user_id or chat_id, 'is_bot': False, 'first_name': f'User {chat_id}'},
+                'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+                if text.startswith('/') else [],
+            },
+        }
+
+    def callback_update(self, chat_id, data, message_id=None, user_id=None):
+        """Tạo update callback_query như khi user bấm nút inline dưới message message_id của bot"""
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': {'id': user_id or chat_id, 'is_bot': False, 'first_name': f'User {chat_id}'},
+                'chat_instance': str(chat_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id or next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'Fake SMC'},
+                    'text': 'menu',
+                },
+            },
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Telegram Bot API giả lập")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--global-rate', type=int, default=30)
+    parser.add_argument('--chat-rate', type=float, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help="Độ trễ mỗi request (giây)")
+    args = parser.parse_args()
+
+    fake = FakeBotAPI(args.global_rate, args.chat_rate, args.latency)
+    print(f"Fake Bot API tại http://{args.host}:{args.port}/bot<token>/ (TELEGRAM_BASE_URL=http://{args.host}:{args.port}/bot)")
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
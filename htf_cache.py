@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+from craw_data import next_candle_close
+
+
+class HTFFeatureCache:
+    """
+    Giữ SMCFeatures đã phân tích của các timeframe cao (HTF) theo (symbol, timeframe).
+    Một entry dùng được cho tới khi nến HTF cuối cùng trong dữ liệu đã phân tích đóng lại, nên các
+    request MTF liên tục ở base timeframe thấp không fetch/phân tích lại 4h, 1d...
+    Nến HTF đang chạy không được cập nhật giữa chừng (đổi lấy chi phí CPU như single-timeframe).
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (symbol, timeframe) -> (expires_ms, features)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symbol, timeframe, now_ms=None):
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        key = (symbol, timeframe)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now_ms >= entry[0]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, symbol, timeframe, features, now_ms=None):
+        """
+        Hết hạn khi nến cuối của dữ liệu đã phân tích đóng (không theo giờ lúc put): dữ liệu lấy
+        trước giờ đóng nến HTF mà put sau đó thì không được cache tới lần đóng kế tiếp.
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        last_timestamp = features.candles.last_timestamp
+        expires_ms = next_candle_close(timeframe, now_ms if last_timestamp is None else last_timestamp)
+        if expires_ms <= now_ms:
+            return features  # Đã cũ ngay khi put
+        key = (symbol, timeframe)
+        with self._lock:
+            self._entries[key] = (expires_ms, features)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return features
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,122 @@
+import numpy as np
+
+from rangeq import RangeMax
+
+
+def average_true_range(high, low, close, period=14):
+    """ATR dạng trung bình trượt đơn giản của True Range (các nến đầu dùng trung bình tích lũy)"""
+    n = len(close)
+    if not n:
+        return np.zeros(0)
+    previous_close = np.concatenate(([close[0]], close[:-1]))
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - previous_close), np.abs(low - previous_close)))
+    cumulative = np.concatenate(([0.0], np.cumsum(true_range)))
+    counts = np.minimum(np.arange(1, n + 1), period)
+    return (cumulative[1:] - cumulative[np.arange(1, n + 1) - counts]) / counts
+
+
+def _side_pools(positions, prices, tolerance, extremes, range_max):
+    """
+    Gom các đỉnh (hoặc đáy đã đổi dấu) thành pool:
+    1. sắp theo giá (O(m log m)) rồi quét: điểm còn cách giá neo của nhóm <= tolerance của neo thì vào nhóm;
+    2. trong mỗi nhóm, theo thời gian: nếu giá đã vượt đỉnh pool giữa hai điểm liên tiếp
+       (thanh khoản đã bị quét) thì điểm sau mở pool mới.
+    """
+    pools = []
+    if not len(positions):
+        return pools
+
+    order = np.lexsort((positions, prices))
+    sorted_prices = prices[order].tolist()
+    sorted_tolerance = tolerance[order].tolist()
+    groups = []
+    anchor = 0
+    for i in range(1, len(order) + 1):
+        if i == len(order) or sorted_prices[i] - sorted_prices[anchor] > sorted_tolerance[anchor]:
+            groups.append(order[anchor:i])
+            anchor = i
+
+    # Max giá giữa mỗi cặp điểm liên tiếp (theo thời gian) trong nhóm, truy vấn một lượt cho mọi nhóm
+    members_by_group = [np.sort(positions[group]) for group in groups]
+    all_members = np.concatenate(members_by_group)
+    gap_max = range_max.query(all_members[:-1] + 1, all_members[1:] - 1).tolist()
+    member_prices = extremes[all_members].tolist()
+    all_members = all_members.tolist()
+
+    offset = 0
+    for members in members_by_group:
+        current = [all_members[offset]]
+        top = member_prices[offset]
+        for i in range(offset + 1, offset + len(members)):
+            if gap_max[i - 1] > top:
+                pools.append((current, top))
+                current, top = [all_members[i]], member_prices[i]
+            else:
+                current.append(all_members[i])
+                top = max(top, member_prices[i])
+        pools.append((current, top))
+        offset += len(members)
+    return pools
+
+
+def detect_liquidity_pools(timestamp, high, low, swing_high, swing_low, close=None,
+                           atr_mult=0.1, pct=None, atr_period=14):
+    """
+    Liquidity pool (equal highs / equal lows) từ các swing point.
+
+    Args:
+        timestamp, high, low, close: mảng nến (timestamp ms).
+        swing_high, swing_low: mảng bool đánh dấu swing point.
+        atr_mult: sai số gom nhóm = atr_mult * ATR tại swing point (mặc định).
+        pct: nếu có, sai số = pct * giá (ví dụ 0.001 = 0.1%) thay cho ATR.
+
+    Returns:
+        list[dict]: pool sắp theo thời gian chạm cuối, mỗi pool gồm type, price (mức thanh khoản:
+        đỉnh cao nhất / đáy thấp nhất), top, bottom, count, time/first_time (giây), span (giây),
+        swept, swept_time.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    if pct is None and close is None:
+        raise ValueError("Cần close để tính ATR, hoặc truyền pct")
+    atr = average_true_range(high, low, np.asarray(close, dtype=np.float64), atr_period) if pct is None else None
+
+    pools = []
+    # Sell-side xử lý như buy-side trên giá đổi dấu: đáy thấp nhất = đỉnh cao nhất của -low
+    for kind, flags, extremes in (('buy_side_liquidity', swing_high, high),
+                                  ('sell_side_liquidity', swing_low, -low)):
+        positions = np.flatnonzero(flags)
+        prices = extremes[positions]
+        if pct is not None:
+            tolerance = np.abs(prices) * pct
+        else:
+            tolerance = atr[positions] * atr_mult
+        range_max = RangeMax(extremes)
+
+        side_pools = _side_pools(positions, prices, tolerance, extremes, range_max)
+        if not side_pools:
+            continue
+        lasts = np.array([members[-1] for members, _ in side_pools], dtype=np.int64)
+        swept = range_max.first_above(lasts + 1, [top for _, top in side_pools]).tolist()
+
+        for (members, top), last, swept_at in zip(side_pools, lasts.tolist(), swept):
+            swept_at = swept_at if swept_at >= 0 else None
+            bottom = float(extremes[members].min())
+            level, other = (top, bottom) if kind == 'buy_side_liquidity' else (-top, -bottom)
+            first_time = int(timestamp[members[0]] // 1000)
+            last_time = int(timestamp[last] // 1000)
+            pools.append((last, {
+                'type': kind,
+                'price': float(level),
+                'top': max(float(level), other),
+                'bottom': min(float(level), other),
+                'count': len(members),
+                'time': last_time,
+                'first_time': first_time,
+                'span': last_time - first_time,
+                'swept': swept_at is not None,
+                'swept_time': int(timestamp[swept_at] // 1000) if swept_at is not None else None,
+            }))
+
+    pools.sort(key=lambda item: item[0])
+    return [pool for _, pool in pools]
@@ -0,0 +1,455 @@
+# Đo tải offline cho API (serve.py) và bot Telegram (qua fake_bot_api.py), xuất báo cáo JSON
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+import numpy as np
+
+from craw_data import candle_open_time, timeframe_to_ms
+from exchange_adapter import save_markets, save_ohlcv
+from fake_bot_api import FakeBotAPI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Endpoint HTTP có thể đưa vào mix: tên -> path ({symbol}, {timeframe} chọn ngẫu nhiên mỗi request)
+HTTP_ENDPOINTS = {
+    'smc-analysis': '/api/smc-analysis?symbol={symbol}&timeframe={timeframe}',
+    'chart-data': '/api/chart-data?symbol={symbol}&timeframe={timeframe}',
+    'tokens': '/api/tokens?exchange=binance',
+    'tokens-search': '/api/tokens/search?exchange=binance&q={query}',
+    'screener': '/api/screener?exchange=binance&timeframe={timeframe}',
+}
+
+# Nút inline có thể đưa vào mix của bot: tên -> callback_data
+BOT_ACTIONS = {
+    'analyze': 'tf_{symbol_encoded}_{timeframe}',
+    'menu': 'start',
+    'pairs': 'select_pair',
+    'help': 'help',
+}
+
+
+def parse_mix(text, choices):
+    """'smc-analysis=5,tokens=1' -> [(tên, trọng số)]; tên không có '=' có trọng số 1"""
+    mix = []
+    for item in text.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in choices:
+            raise ValueError(f"Không hỗ trợ '{name}', chọn trong: {', '.join(choices)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def split_list(text):
+    return [value.strip() for value in text.split(',') if value.strip()]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def generate_recording(directory, exchange_name, symbols, timeframes, candles=500, seed=1, now_ms=None):
+    """
+    Dữ liệu tổng hợp cho ReplayExchange (random walk), nến cuối là nến đang chạy tại now_ms
+    để cache theo nến của app/bot hoạt động như khi chạy thật.
+    """
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    rng = np.random.default_rng(seed)
+    save_markets(directory, exchange_name, {symbol: {'symbol': symbol, 'quote': symbol.split('/')[-1],
+                                                     'spot': True, 'active': True} for symbol in symbols})
+    for symbol in symbols:
+        base_price = float(rng.uniform(1, 50000))
+        for timeframe in timeframes:
+            tf_ms = timeframe_to_ms(timeframe)
+            timestamps = candle_open_time(timeframe, now_ms) - tf_ms * np.arange(candles - 1, -1, -1)
+            close = base_price * np.exp(np.cumsum(rng.normal(0, 0.01, candles)))
+            open_ = np.concatenate(([base_price], close[:-1]))
+            high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.005, candles))
+            low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.005, candles))
+            volume = rng.uniform(100, 1000, candles)
+            rows = np.column_stack([timestamps, open_, high, low, close, volume]).tolist()
+            save_ohlcv(directory, exchange_name, symbol, timeframe,
+                       [[int(row[0])] + row[1:] for row in rows])
+
+
+class LatencyRecorder:
+    """Độ trễ và lỗi theo từng loại request trong một mức tải"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, seconds, error=None):
+        self.latencies.setdefault(name, []).append(seconds)
+        if error is not None:
+            self.errors.setdefault(name, Counter())[error] += 1
+
+    @staticmethod
+    def summarize(latencies, errors, duration):
+        values = np.array(latencies) * 1000
+        failed = sum(errors.values())
+        summary = {
+            'requests': len(values),
+            'throughput_rps': round(len(values) / duration, 2),
+            'error_rate': round(failed / len(values), 4) if len(values) else 0.0,
+            'errors': dict(errors),
+        }
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary['latency_ms'] = {'p50': round(p50, 1), 'p95': round(p95, 1), 'p99': round(p99, 1),
+                                     'mean': round(values.mean(), 1), 'max': round(values.max(), 1)}
+        return summary
+
+    def report(self, duration):
+        endpoints = {name: self.summarize(values, self.errors.get(name, Counter()), duration)
+                     for name, values in sorted(self.latencies.items())}
+        all_errors = Counter()
+        for errors in self.errors.values():
+            all_errors.update(errors)
+        overall = self.summarize([value for values in self.latencies.values() for value in values],
+                                 all_errors, duration)
+        return overall, endpoints
+
+
+async def run_level(concurrency, duration, warmup, request_once, think_time=0.0):
+    """
+    Tải vòng kín: concurrency worker, mỗi worker gửi request kế tiếp sau khi request trước xong
+    think_time giây. Chỉ ghi nhận các request bắt đầu sau warmup giây.
+    """
+    recorder = LatencyRecorder()
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker(index):
+        while time.monotonic() < deadline:
+            request_started = time.monotonic()
+            name, error = await request_once(index)
+            if request_started >= measure_from:
+                recorder.record(name, time.monotonic() - request_started, error)
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    overall, endpoints = recorder.report(duration)
+    return {'concurrency': concurrency, 'duration_s': duration, 'think_time_s': think_time, **overall,
+            'endpoints': endpoints}
+
+
+def saturation(levels, slo_ms, max_error_rate):
+    """Mức tải có throughput cao nhất và mức cao nhất còn đạt SLO (p95 <= slo_ms, lỗi <= max_error_rate)"""
+    if not levels:
+        return {}
+    best = max(levels, key=lambda level: level['throughput_rps'])
+    within = [level for level in levels
+              if level['error_rate'] <= max_error_rate and level.get('latency_ms', {}).get('p95', np.inf) <= slo_ms]
+    return {
+        'peak_throughput_rps': best['throughput_rps'],
+        'peak_concurrency': best['concurrency'],
+        'slo': {'p95_ms': slo_ms, 'max_error_rate': max_error_rate},
+        'max_concurrency_within_slo': within[-1]['concurrency'] if within else None,
+        'throughput_within_slo_rps': within[-1]['throughput_rps'] if within else None,
+    }
+
+
+class Weighted:
+    """Chọn ngẫu nhiên theo trọng số từ mix, seed cố định để các lần đo lặp lại được"""
+
+    def __init__(self, mix, seed):
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.random = random.Random(seed)
+
+    def choice(self, values=None):
+        return self.random.choices(self.names, self.weights)[0] if values is None else self.random.choice(values)
+
+
+def offline_env(args, directory):
+    """Biến môi trường cho process con: exchange replay, không snapshot, không ghi file ngoài thư mục tạm"""
+    env = dict(os.environ)
+    env.update({
+        'SMC_EXCHANGE_MODE': 'replay',
+        'SMC_EXCHANGE_DIR': directory,
+        'SMC_REPLAY_LATENCY_MS': str(args.exchange_latency_ms),
+        'SMC_REPLAY_JITTER_MS': str(args.exchange_jitter_ms),
+        'SMC_REPLAY_ERROR_RATE': str(args.exchange_error_rate),
+        'SMC_REPLAY_SEED': str(args.seed),
+        'SMC_SNAPSHOT_PATH': '',
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+
+def start_process(script, env, workdir, log_dir=None):
+    """Chạy script của repo trong workdir, log ra <log_dir hoặc workdir>/<script>.log"""
+    log_dir = log_dir or workdir
+    os.makedirs(log_dir, exist_ok=True)
+    log = open(os.path.join(log_dir, f'{os.path.splitext(script)[0]}.log'), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, script)], cwd=workdir,
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+    return process
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.log.close()
+
+
+def log_tail(log_path, lines=20):
+    with open(log_path, errors='replace') as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+async def wait_ready(session, url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return True
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def run_http(args, workdir):
+    """Đo tải các endpoint của serve.py (process con trên exchange replay, hoặc server có sẵn qua --url)"""
+    mix = Weighted(parse_mix(args.mix, HTTP_ENDPOINTS), args.seed)
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        env = offline_env(args, args.exchange_dir or workdir)
+        env.update({'SMC_HOST': '127.0.0.1', 'PORT': str(port), 'SMC_HTTP_WORKERS': str(args.workers),
+                    'SMC_WARM_SYMBOLS': ','.join(args.symbols), 'SMC_WARM_TIMEFRAMES': ','.join(args.timeframes)})
+        server = start_process('serve.py', env, workdir, args.log_dir)
+        base_url = f'http://127.0.0.1:{port}'
+    base_url = base_url.rstrip('/')
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    levels = []
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            if not await wait_ready(session, f'{base_url}/api/ready', args.startup_timeout):
+                raise RuntimeError(f"Server không sẵn sàng sau {args.startup_timeout}s"
+                                   + (f":\n{log_tail(server.log.name)}" if server else ''))
+
+            async def request_once(_):
+                name = mix.choice()
+                path = HTTP_ENDPOINTS[name].format(symbol=mix.choice(args.symbols), timeframe=mix.choice(args.timeframes),
+                                                   query=mix.choice(args.symbols).split('/')[0][:2])
+                try:
+                    async with session.get(base_url + path) as response:
+                        body = await response.read()
+                        if response.status >= 400:
+                            return name, f'http_{response.status}'
+                        # API trả lỗi nghiệp vụ với status 200: {"error": ...}
+                        if body.startswith(b'{"error"'):
+                            return name, 'app_error'
+                        return name, None
+                except asyncio.TimeoutError:
+                    return name, 'timeout'
+                except aiohttp.ClientError as e:
+                    return name, type(e).__name__
+
+            for concurrency in args.concurrency:
+                level = await run_level(concurrency, args.duration, args.warmup, request_once, args.think_time)
+                levels.append(level)
+                print_level(level)
+    finally:
+        if server is not None:
+            stop_process(server)
+
+    return {
+        'target': 'http',
+        'url': args.url,
+        'workers': args.workers if args.url is None else None,
+        'mix': dict(zip(mix.names, mix.weights)),
+        'levels': levels,
+        'saturation': saturation(levels, args.slo_ms, args.max_error_rate),
+    }
+
+
+async def run_bot(args, workdir):
+    """
+    Đo số lần bấm nút/giây TradingBot xử lý được: bot chạy ở process con, nói chuyện với FakeBotAPI
+    trong process này. Mỗi worker là một chat, bấm nút rồi chờ message kết quả (có keyboard,
+    hoặc báo lỗi '❌') trước khi bấm tiếp; độ trễ tính từ lúc gửi update tới message kết quả đó.
+    """
+    mix = Weighted(parse_mix(args.mix, BOT_ACTIONS), args.seed)
+    fake = FakeBotAPI(global_rate=args.telegram_global_rate, chat_rate=args.telegram_chat_rate)
+    api_port = free_port()
+    await fake.start(port=api_port)
+
+    waiting = {}  # chat_id -> future chờ message kết quả
+
+    def on_message(chat_id, method, params):
+        future = waiting.get(chat_id)
+        if future is None or future.done():
+            return
+        text = params.get('text', '')
+        if text.startswith('❌'):
+            future.set_result('bot_error')
+        elif params.get('reply_markup'):
+            future.set_result(None)
+
+    fake.listeners.append(on_message)
+
+    env = offline_env(args, args.exchange_dir or workdir)
+    env.update({
+        'TELEGRAM_BASE_URL': f'http://127.0.0.1:{api_port}/bot',
+        'SMC_BOT_MODE': args.bot_mode,
+        'SMC_TELEGRAM_GLOBAL_RATE': str(args.telegram_global_rate),
+        'SMC_TELEGRAM_CHAT_RATE': str(args.telegram_chat_rate),
+        'SMC_ALERTS_FILE': os.path.join(workdir, 'alerts.json'),
+    })
+    if args.bot_mode == 'webhook':
+        webhook_port = free_port()
+        env.update({'SMC_WEBHOOK_LISTEN': '127.0.0.1', 'SMC_WEBHOOK_PORT': str(webhook_port),
+                    'SMC_WEBHOOK_URL': f'http://127.0.0.1:{webhook_port}', 'SMC_WEBHOOK_PATH': '/telegram'})
+    bot = start_process('telegram_bot.py', env, workdir, args.log_dir)
+
+    levels = []
+    try:
+        # Bot sẵn sàng: đã setWebhook (webhook) hoặc đã bắt đầu getUpdates (polling)
+        deadline = time.monotonic() + args.startup_timeout
+        while not (fake.webhook_url if args.bot_mode == 'webhook' else fake.requests['getUpdates']):
+            if time.monotonic() > deadline or bot.poll() is not None:
+                raise RuntimeError(f"Bot không sẵn sàng:\n{log_tail(bot.log.name)}")
+            await asyncio.sleep(0.2)
+
+        chat_offset = 0
+        for concurrency in args.concurrency:
+            # Chat mới cho mỗi mức tải: không lẫn message trễ của mức trước
+            base_chat = chat_offset + 1000
+            chat_offset += concurrency
+
+            async def request_once(index):
+                name = mix.choice()
+                symbol = mix.choice(args.symbols)
+                data = BOT_ACTIONS[name].format(symbol_encoded=symbol.replace('/', '_'),
+                                                timeframe=mix.choice(args.timeframes))
+                chat_id = base_chat + index
+                future = asyncio.get_running_loop().create_future()
+                waiting[chat_id] = future
+                try:
+                    status = await fake.push_update(fake.callback_update(chat_id, data, message_id=chat_id))
+                    if status != 200:
+                        return name, f'http_{status}'
+                    return name, await asyncio.wait_for(future, args.timeout)
+                except asyncio.TimeoutError:
+                    return name, 'timeout'
+                except aiohttp.ClientError as e:
+                    return name, type(e).__name__
+                finally:
+                    waiting.pop(chat_id, None)
+
+            rejected = fake.rejected
+            level = await run_level(concurrency, args.duration, args.warmup, request_once, args.think_time)
+            level['telegram_429'] = fake.rejected - rejected
+            levels.append(level)
+            print_level(level)
+    finally:
+        stop_process(bot)
+        await fake.stop()
+
+    return {
+        'target': 'bot',
+        'bot_mode': args.bot_mode,
+        'mix': dict(zip(mix.names, mix.weights)),
+        'levels': levels,
+        'saturation': saturation(levels, args.slo_ms, args.max_error_rate),
+    }
+
+
+def print_level(level):
+    latency = level.get('latency_ms', {})
+    print(f"concurrency={level['concurrency']:<4} {level['throughput_rps']:>8.1f} req/s  "
+          f"p50={latency.get('p50', 0):.0f}ms p95={latency.get('p95', 0):.0f}ms p99={latency.get('p99', 0):.0f}ms  "
+          f"lỗi={level['error_rate']:.2%}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo tải offline API/bot SMC, xuất báo cáo JSON")
+    parser.add_argument('target', choices=('http', 'bot'))
+    parser.add_argument('--mix', help="Tỉ lệ request, ví dụ smc-analysis=5,chart-data=3,tokens=2 "
+                                      "(bot: analyze=8,menu=1,help=1)")
+    parser.add_argument('--concurrency', default='1,4,16,64',
+                        help="Các mức tải (số worker đồng thời; bot: số chat)")
+    parser.add_argument('--duration', type=float, default=10, help="Thời gian đo mỗi mức (giây)")
+    parser.add_argument('--warmup', type=float, default=2, help="Thời gian chạy trước khi đo mỗi mức (giây)")
+    parser.add_argument('--timeout', type=float, default=30, help="Timeout mỗi request (giây)")
+    parser.add_argument('--think-time', type=float,
+                        help="Nghỉ giữa hai request của một worker (giây); mặc định http 0, bot 1 (user bấm mỗi giây)")
+    parser.add_argument('--symbols', default='BTC/USDT,ETH/USDT,BNB/USDT,SOL/USDT')
+    parser.add_argument('--timeframes', default='15m,1h,4h,1d')
+    parser.add_argument('--url', help="http: đo server có sẵn thay vì chạy serve.py trên exchange replay")
+    parser.add_argument('--workers', type=int, default=64, help="SMC_HTTP_WORKERS của serve.py (cỡ deployment)")
+    parser.add_argument('--bot-mode', choices=('webhook', 'polling'), default='webhook')
+    parser.add_argument('--telegram-global-rate', type=float, default=1000,
+                        help="Flood limit của Bot API giả lập (msg/s), Telegram thật khoảng 30")
+    parser.add_argument('--telegram-chat-rate', type=float, default=100, help="Flood limit mỗi chat (msg/s)")
+    parser.add_argument('--exchange-dir', help="Dữ liệu đã ghi (SMC_EXCHANGE_MODE=record); mặc định sinh dữ liệu tổng hợp")
+    parser.add_argument('--candles', type=int, default=500, help="Số nến tổng hợp mỗi symbol/timeframe")
+    parser.add_argument('--exchange-latency-ms', type=float, default=0)
+    parser.add_argument('--exchange-jitter-ms', type=float, default=0)
+    parser.add_argument('--exchange-error-rate', type=float, default=0)
+    parser.add_argument('--slo-ms', type=float, default=1000, help="p95 tối đa để tính là còn đạt SLO")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-dir', help="Giữ log của serve.py/telegram_bot.py ở đây (mặc định thư mục tạm)")
+    parser.add_argument('--output', default='-', help="File báo cáo JSON ('-': stdout)")
+    args = parser.parse_args(argv)
+
+    args.mix = args.mix or ('smc-analysis=5,chart-data=3,tokens=2' if args.target == 'http'
+                            else 'analyze=8,menu=1,help=1')
+    if args.think_time is None:
+        args.think_time = 0.0 if args.target == 'http' else 1.0
+    args.concurrency = [int(value) for value in split_list(args.concurrency)]
+    args.symbols = split_list(args.symbols)
+    args.timeframes = split_list(args.timeframes)
+
+    with tempfile.TemporaryDirectory(prefix='smc-loadtest-') as workdir:
+        if args.exchange_dir is None and (args.target == 'bot' or args.url is None):
+            generate_recording(workdir, 'binance', args.symbols, args.timeframes, args.candles, args.seed)
+        started = time.time()
+        runner = run_http if args.target == 'http' else run_bot
+        report = asyncio.run(runner(args, workdir))
+
+    report.update({
+        'started_at': started,
+        'config': {'duration_s': args.duration, 'warmup_s': args.warmup, 'timeout_s': args.timeout,
+                   'symbols': args.symbols, 'timeframes': args.timeframes, 'seed': args.seed,
+                   'exchange': {'dir': args.exchange_dir, 'latency_ms': args.exchange_latency_ms,
+                                'jitter_ms': args.exchange_jitter_ms, 'error_rate': args.exchange_error_rate}},
+    })
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"Đã ghi báo cáo {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
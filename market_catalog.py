@@ -0,0 +1,222 @@
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khóa trong process
+    fcntl = None
+
+from exchange_adapter import get_exchange
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXCHANGES = ['binance', 'bitget', 'bybit', 'mexc', 'kucoin', 'okx', 'gate.io', 'huobi']
+
+POPULAR_PAIRS = [
+    'BTC/USDT', 'ETH/USDT', 'BNB/USDT', 'SOL/USDT', 'XRP/USDT',
+    'DOGE/USDT', 'ADA/USDT', 'AVAX/USDT', 'DOT/USDT', 'MATIC/USDT'
+]
+
+# Trả về khi chưa có snapshot nào (cold start lần đầu, chưa có file cache)
+FALLBACK_PAIRS = ['BTC/USDT', 'ETH/USDT', 'BNB/USDT']
+
+
+def filter_usdt_pairs(markets):
+    """Lọc các cặp USDT spot đang hoạt động; cặp phổ biến lên đầu, còn lại theo alphabet"""
+    usdt_pairs = sorted(
+        symbol for symbol, market in markets.items()
+        if (market.get('quote') or '').upper() == 'USDT'
+        and market.get('active', True)
+        and market.get('spot', False)  # Đảm bảo là cặp spot
+        and ':' not in symbol  # Loại bỏ các cặp futures/swap nếu có
+    )
+    available = set(usdt_pairs)
+    popular = set(POPULAR_PAIRS)
+    final_pairs = [pair for pair in POPULAR_PAIRS if pair in available]
+    final_pairs.extend(pair for pair in usdt_pairs if pair not in popular)
+    return final_pairs
+
+
+def _search_key(symbol):
+    return symbol.upper().replace('/', '')
+
+
+class MarketSnapshot:
+    """Danh sách cặp của một exchange tại một thời điểm, kèm index prefix và trigram"""
+
+    def __init__(self, symbols, updated_at):
+        self.symbols = symbols
+        self.updated_at = updated_at
+        self.rank = {symbol: i for i, symbol in enumerate(symbols)}
+
+        # Index prefix: danh sách key đã sắp xếp để tìm bằng bisect
+        keyed = sorted((_search_key(symbol), symbol) for symbol in symbols)
+        self._sorted_keys = [key for key, _ in keyed]
+        self._sorted_symbols = [symbol for _, symbol in keyed]
+
+        # Index chuỗi con: trigram -> tập vị trí trong danh sách đã sắp xếp
+        self._trigrams = {}
+        for position, key in enumerate(self._sorted_keys):
+            for i in range(len(key) - 2):
+                self._trigrams.setdefault(key[i:i + 3], set()).add(position)
+
+    def prefix_matches(self, query):
+        start = bisect.bisect_left(self._sorted_keys, query)
+        end = bisect.bisect_left(self._sorted_keys, query + '\uffff')
+        return self._sorted_symbols[start:end]
+
+    def substring_matches(self, query):
+        if len(query) < 3:
+            return [symbol for key, symbol in zip(self._sorted_keys, self._sorted_symbols) if query in key]
+        postings = [self._trigrams.get(query[i:i + 3], set()) for i in range(len(query) - 2)]
+        candidates = set.intersection(*sorted(postings, key=len))
+        return [self._sorted_symbols[p] for p in sorted(candidates) if query in self._sorted_keys[p]]
+
+    def search(self, query, limit=20):
+        """Khớp prefix trước (ưu tiên cặp phổ biến), sau đó khớp chuỗi con"""
+        query = _search_key(query.strip())
+        if not query:
+            return self.symbols[:limit]
+        prefix = sorted(self.prefix_matches(query), key=self.rank.get)
+        results = prefix[:limit]
+        if len(results) < limit:
+            seen = set(results)
+            others = sorted((s for s in self.substring_matches(query) if s not in seen), key=self.rank.get)
+            results.extend(others[:limit - len(results)])
+        return results
+
+
+class MarketCatalog:
+    """
+    Danh mục cặp USDT spot của các exchange được hỗ trợ.
+    - Luôn trả về snapshot hiện có ngay lập tức; snapshot cũ hơn ttl được refresh nền
+      (stale-while-revalidate), không bắt caller chờ load_markets.
+    - Snapshot được lưu ra file để khởi động lại không phải chờ exchange.
+    """
+
+    def __init__(self, exchanges=None, ttl=300, cache_path=None):
+        self.exchanges = list(exchanges or SUPPORTED_EXCHANGES)
+        self.ttl = ttl
+        self.cache_path = cache_path if cache_path is not None else os.getenv('SMC_MARKET_CATALOG', 'market_catalog.json')
+        self._snapshots = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Một lần ghi file mỗi lúc trong process
+        self.load()
+
+    def load(self):
+        """Nạp snapshot đã lưu trên đĩa (nếu có)"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+            with self._lock:
+                for exchange_name, entry in data.items():
+                    if exchange_name in self.exchanges and exchange_name not in self._snapshots:
+                        self._snapshots[exchange_name] = MarketSnapshot(entry['symbols'], entry['updated_at'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Không thể đọc market catalog {self.cache_path}: {e}")
+
+    def save(self):
+        """
+        Ghi snapshot ra file dùng chung giữa các process (API, bot): đọc lại file dưới file lock,
+        giữ bản mới hơn của từng exchange rồi ghi qua file tạm riêng + os.replace,
+        để process chỉ giữ một vài exchange không xóa snapshot của process khác.
+        """
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {name: {'symbols': snap.symbols, 'updated_at': snap.updated_at}
+                    for name, snap in self._snapshots.items()}
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        tmp_path = None
+        try:
+            with self._save_lock, open(f"{self.cache_path}.lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(self.cache_path) as f:
+                        on_disk = json.load(f)
+                except (OSError, ValueError):
+                    on_disk = {}
+                for name, entry in on_disk.items():
+                    if isinstance(entry, dict) and entry.get('updated_at', 0) > data.get(name, {}).get('updated_at', -1):
+                        data[name] = entry
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.cache_path)}.")
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.cache_path)
+                tmp_path = None
+        except OSError as e:
+            logger.warning(f"Không thể lưu market catalog {self.cache_path}: {e}")
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def refresh(self, exchange_name):
+        """Load markets từ exchange (blocking) và thay snapshot; lỗi thì giữ snapshot cũ"""
+        exchange_name = exchange_name.lower()
+        try:
+            exchange = get_exchange(exchange_name)
+            if not exchange or not exchange.has['fetchMarkets']:
+                return self._current(exchange_name)
+            markets = exchange.load_markets(True)
+            snapshot = MarketSnapshot(filter_usdt_pairs(markets), time.time())
+            with self._lock:
+                self._snapshots[exchange_name] = snapshot
+            print(f"Tìm thấy {len(snapshot.symbols)} cặp USDT spot trên {exchange_name}")
+            self.save()
+            return snapshot
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách tokens từ {exchange_name}: {e}")
+            return self._current(exchange_name)
+        finally:
+            with self._lock:
+                self._refreshing.discard(exchange_name)
+
+    def refresh_async(self, exchange_name):
+        """Refresh nền; bỏ qua nếu exchange này đang được refresh"""
+        with self._lock:
+            if exchange_name in self._refreshing:
+                return
+            self._refreshing.add(exchange_name)
+        threading.Thread(target=self.refresh, args=(exchange_name,), name=f'catalog-{exchange_name}', daemon=True).start()
+
+    def _current(self, exchange_name):
+        with self._lock:
+            return self._snapshots.get(exchange_name)
+
+    def snapshot(self, exchange_name):
+        """Snapshot hiện tại (có thể đã cũ), tự lên lịch refresh khi thiếu hoặc hết hạn"""
+        exchange_name = exchange_name.lower()
+        if exchange_name not in self.exchanges:
+            return None
+        snapshot = self._current(exchange_name)
+        if snapshot is None or time.time() - snapshot.updated_at > self.ttl:
+            self.refresh_async(exchange_name)
+        return snapshot
+
+    def symbols(self, exchange_name):
+        """Danh sách cặp, không bao giờ chờ exchange"""
+        if exchange_name.lower() not in self.exchanges:
+            return []
+        snapshot = self.snapshot(exchange_name)
+        return snapshot.symbols if snapshot is not None else list(FALLBACK_PAIRS)
+
+    def search(self, exchange_name, query, limit=20):
+        """Tìm cặp theo prefix/chuỗi con cho autocomplete"""
+        snapshot = self.snapshot(exchange_name)
+        if snapshot is None:
+            query = _search_key(query)
+            return [pair for pair in FALLBACK_PAIRS if query in _search_key(pair)][:limit]
+        return snapshot.search(query, limit)
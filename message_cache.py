@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from craw_data import timeframe_to_ms
+
+
+class RenderedMessage:
+    """Message Telegram đã render sẵn (text + inline keyboard)"""
+    __slots__ = ('text', 'reply_markup', 'parse_mode', 'candle_time')
+
+    def __init__(self, text, reply_markup=None, parse_mode=None, candle_time=None):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.candle_time = candle_time
+
+
+class RenderedMessageCache:
+    """
+    Cache message phân tích đã render, dùng chung cho mọi chat.
+    Key: (symbol, timeframe, thời điểm mở nến cuối, variant). Entry chỉ được trả về
+    khi nến đó chưa đóng, nên mỗi cặp chỉ render một lần cho mỗi nến.
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._latest = {}  # (symbol, timeframe) -> thời điểm mở nến (ms) của lần render gần nhất
+        self._counts = {}  # (symbol, timeframe) -> số entry đang giữ; về 0 thì bỏ khỏi _latest
+        self._lock = threading.Lock()
+
+    def get(self, symbol, timeframe, variant='markdown', now_ms=None):
+        """Message đã render cho nến đang chạy, None nếu chưa có hoặc nến đã đóng"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with self._lock:
+            candle_time = self._latest.get((symbol, timeframe))
+            entry = None
+            if candle_time is not None and now_ms < candle_time + timeframe_to_ms(timeframe):
+                key = (symbol, timeframe, candle_time, variant)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def contains(self, symbol, timeframe, variant='markdown', now_ms=None):
+        """Như get() nhưng không tính vào hits/misses"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with self._lock:
+            candle_time = self._latest.get((symbol, timeframe))
+            return (candle_time is not None and now_ms < candle_time + timeframe_to_ms(timeframe)
+                    and (symbol, timeframe, candle_time, variant) in self._entries)
+
+    def put(self, symbol, timeframe, variant, message):
+        """Lưu message render từ dữ liệu có nến cuối mở lúc message.candle_time (ms)"""
+        candle_time = message.candle_time
+        with self._lock:
+            latest = self._latest.get((symbol, timeframe))
+            if latest is None or candle_time >= latest:
+                self._latest[(symbol, timeframe)] = candle_time
+            key = (symbol, timeframe, candle_time, variant)
+            if key not in self._entries:
+                self._counts[(symbol, timeframe)] = self._counts.get((symbol, timeframe), 0) + 1
+            self._entries[key] = message
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                (old_symbol, old_timeframe, _, _), _ = self._entries.popitem(last=False)
+                pair = (old_symbol, old_timeframe)
+                self._counts[pair] -= 1
+                if not self._counts[pair]:
+                    del self._counts[pair]
+                    del self._latest[pair]
+        return message
+
+    def dump(self, encode_markup=None, now_ms=None):
+        """Các message còn dùng được (nến chưa đóng) dạng JSON cho snapshot"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with self._lock:
+            return [[symbol, timeframe, variant, message.text,
+                     encode_markup(message.reply_markup) if encode_markup and message.reply_markup else None,
+                     message.parse_mode, candle_time]
+                    for (symbol, timeframe, candle_time, variant), message in self._entries.items()
+                    if candle_time == self._latest.get((symbol, timeframe))
+                    and now_ms < candle_time + timeframe_to_ms(timeframe)]
+
+    def restore(self, entries, decode_markup=None):
+        for symbol, timeframe, variant, text, markup, parse_mode, candle_time in entries:
+            if markup is not None and decode_markup is not None:
+                markup = decode_markup(markup)
+            self.put(symbol, timeframe, variant, RenderedMessage(text, markup, parse_mode, candle_time))
@@ -0,0 +1,102 @@
+import numpy as np
+
+OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class OHLCV:
+    """
+    Container nến bất biến dùng chung cho toàn bộ luồng fetch -> phân tích -> trả API.
+    - timestamp: mảng int64 (mili giây)
+    - values: khối float64 shape (5, n) theo thứ tự open, high, low, close, volume;
+      mỗi cột là một vùng nhớ liền kề.
+    Cắt theo slice (tail, [a:b]) trả về view, không sao chép dữ liệu.
+    """
+
+    __slots__ = ('timestamp', 'values')
+
+    def __init__(self, timestamp, values):
+        timestamp = np.asarray(timestamp, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if timestamp.ndim != 1 or values.shape != (len(OHLCV_COLUMNS), len(timestamp)):
+            raise ValueError(f"Dữ liệu OHLCV không hợp lệ: timestamp {timestamp.shape}, values {values.shape}")
+
+        # Đánh dấu chỉ đọc trên view để không ai sửa được dữ liệu dùng chung
+        timestamp = timestamp.view()
+        values = values.view()
+        timestamp.flags.writeable = False
+        values.flags.writeable = False
+        self.timestamp = timestamp
+        self.values = values
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Tạo từ danh sách nến dạng ccxt [timestamp_ms, open, high, low, close, volume]"""
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS) + 1)
+        return cls(data[:, 0].astype(np.int64), np.ascontiguousarray(data[:, 1:].T))
+
+    @classmethod
+    def from_frame(cls, df):
+        """Tạo từ DataFrame có cột timestamp (datetime hoặc ms) và các cột OHLCV"""
+        timestamp = df['timestamp'].to_numpy()
+        if np.issubdtype(timestamp.dtype, np.datetime64):
+            timestamp = timestamp.astype('datetime64[ms]').astype(np.int64)
+        values = np.empty((len(OHLCV_COLUMNS), len(df)), dtype=np.float64)
+        for i, column in enumerate(OHLCV_COLUMNS):
+            values[i] = df[column].to_numpy(dtype=np.float64)
+        return cls(timestamp, values)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key == 'timestamp':
+                return self.timestamp
+            return self.values[OHLCV_COLUMNS.index(key)]
+        if isinstance(key, slice) and key.step in (None, 1):
+            return OHLCV(self.timestamp[key], self.values[:, key])
+        raise TypeError(f"OHLCV chỉ hỗ trợ tên cột hoặc slice liên tục, không hỗ trợ {key!r}")
+
+    @property
+    def open(self):
+        return self.values[0]
+
+    @property
+    def high(self):
+        return self.values[1]
+
+    @property
+    def low(self):
+        return self.values[2]
+
+    @property
+    def close(self):
+        return self.values[3]
+
+    @property
+    def volume(self):
+        return self.values[4]
+
+    @property
+    def last_timestamp(self):
+        """Timestamp (ms) của nến cuối cùng, None nếu rỗng"""
+        return int(self.timestamp[-1]) if len(self) else None
+
+    def tail(self, n):
+        """View của n nến cuối"""
+        return self[max(len(self) - n, 0):]
+
+    def to_rows(self):
+        """Chuyển về danh sách nến dạng ccxt"""
+        rows = self.values.T.tolist()
+        for row, timestamp in zip(rows, self.timestamp.tolist()):
+            row.insert(0, timestamp)
+        return rows
+
+    def to_frame(self):
+        """DataFrame bọc trực tiếp các mảng (không sao chép) cho code cũ còn dùng pandas"""
+        import pandas as pd
+        columns = {'timestamp': self.timestamp.view('datetime64[ms]')}
+        for i, column in enumerate(OHLCV_COLUMNS):
+            columns[column] = self.values[i]
+        return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn của Telegram Bot API
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Token bucket tính theo thời gian monotonic; reserve() trả về thời điểm được phép gửi"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available_at(self, now):
+        self._refill(now)
+        return now if self._tokens >= 1 else now + (1 - self._tokens) / self.rate
+
+    def reserve(self, now):
+        """Lấy một token (có thể nợ), trả về thời điểm token đó hợp lệ"""
+        self._refill(now)
+        self._tokens -= 1
+        return now if self._tokens >= 0 else now - self._tokens / self.rate
+
+
+class OutboundMessage:
+    __slots__ = ('chat_id', 'text', 'parse_mode', 'reply_markup', 'message_id', 'enqueued_at', 'attempts')
+
+    def __init__(self, chat_id, text, parse_mode=None, reply_markup=None, message_id=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+        self.message_id = message_id  # Có giá trị: edit message thay vì gửi mới
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundQueue:
+    """
+    Hàng đợi gửi message Telegram:
+    - token bucket toàn cục (mặc định 28 msg/s, chừa khoảng cho giới hạn ~30 msg/s) và mỗi chat (~1 msg/s)
+    - RetryAfter: dừng gửi đúng retry_after giây rồi gửi lại; lỗi mạng: backoff lũy thừa
+    - nhiều message đang chờ cho cùng chat được gộp thành một (edit cùng message: giữ bản mới nhất)
+    - đo độ trễ từ lúc xếp hàng tới lúc gửi xong
+    """
+
+    def __init__(self, bot, global_rate=28, chat_rate=1, chat_burst=3, concurrency=16,
+                 max_retries=5, max_backoff=30):
+        self.bot = bot
+        # Không cho burst toàn cục: giới hạn của Telegram tính trên cửa sổ trượt 1 giây
+        self.global_bucket = TokenBucket(global_rate, 1)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._chat_buckets = {}
+        self._pending = {}  # chat_id -> deque[OutboundMessage]
+        self._scheduled = set()  # chat đang trong heap hoặc đang gửi
+        self._heap = []  # (thời điểm chat được gửi tiếp, seq, chat_id)
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._paused_until = 0.0  # RetryAfter: tạm dừng toàn bộ việc gửi tới thời điểm này
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self._lags = deque(maxlen=1000)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        self._enqueue(OutboundMessage(chat_id, text, parse_mode, reply_markup))
+
+    def edit_message_text(self, chat_id, message_id, text, parse_mode=None, reply_markup=None):
+        self._enqueue(OutboundMessage(chat_id, text, parse_mode, reply_markup, message_id))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _enqueue(self, message):
+        self._pending.setdefault(message.chat_id, deque()).append(message)
+        if message.chat_id not in self._scheduled:
+            self._schedule(message.chat_id, self._chat_bucket(message.chat_id).available_at(time.monotonic()))
+
+    def _schedule(self, chat_id, at):
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._heap, (at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    def _take(self, chat_id):
+        """Lấy message kế tiếp của chat, gộp các message đang chờ có thể gộp"""
+        pending = self._pending[chat_id]
+        message = pending.popleft()
+        if message.message_id is not None:
+            # Nhiều edit cùng message: chỉ gửi bản mới nhất
+            while pending and pending[0].message_id == message.message_id:
+                latest = pending.popleft()
+                latest.enqueued_at = min(latest.enqueued_at, message.enqueued_at)
+                message = latest
+                self.coalesced += 1
+            return message
+
+        while (pending and pending[0].message_id is None and pending[0].parse_mode == message.parse_mode
+               and message.reply_markup is None and pending[0].reply_markup is None
+               and len(message.text) + len(pending[0].text) + 2 <= MAX_MESSAGE_LENGTH):
+            following = pending.popleft()
+            message.text = f"{message.text}\n\n{following.text}"
+            self.coalesced += 1
+        return message
+
+    async def _dispatch(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            ready_at, _, chat_id = self._heap[0]
+            ready_at = max(ready_at, self._paused_until)
+            now = time.monotonic()
+            if ready_at > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=ready_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            if not self._pending.get(chat_id):
+                self._scheduled.discard(chat_id)
+                continue
+
+            # Token của chat và token toàn cục
+            self._chat_bucket(chat_id).reserve(now)
+            send_at = self.global_bucket.reserve(now)
+            if send_at > now:
+                await asyncio.sleep(send_at - now)
+
+            message = self._take(chat_id)
+            await self._slots.acquire()
+            asyncio.get_running_loop().create_task(self._deliver(message))
+
+    async def _deliver(self, message):
+        chat_id = message.chat_id
+        retry_at = None
+        try:
+            message.attempts += 1
+            await self._send(message)
+            self.delivered += 1
+            self._lags.append(time.monotonic() - message.enqueued_at)
+            if self.delivered % 100 == 0:
+                logger.info(f"Outbound stats: {self.stats()}")
+        except RetryAfter as e:
+            self.retries += 1
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            retry_at = time.monotonic() + float(retry_after)
+            self._paused_until = max(self._paused_until, retry_at)
+        except ChatMigrated as e:
+            # Group đã lên supergroup: chuyển message này và các message đang chờ sang chat id mới
+            logger.warning(f"Chat {chat_id} đã chuyển sang {e.new_chat_id}")
+            self._migrate(chat_id, e.new_chat_id, message)
+        except BadRequest as e:
+            if message.parse_mode and 'parse' in str(e).lower():
+                # Markdown lỗi: gửi lại dạng text thường
+                message.text = message.text.replace('*', '').replace('_', '')
+                message.parse_mode = None
+                retry_at = time.monotonic()
+            elif 'not modified' not in str(e).lower():
+                self.failed += 1
+                logger.warning(f"Bỏ message tới {chat_id}: {e}")
+        except Forbidden as e:
+            self.failed += 1
+            logger.warning(f"Bỏ message tới {chat_id} (bot bị chặn): {e}")
+        except NetworkError as e:
+            if message.attempts >= self.max_retries:
+                self.failed += 1
+                logger.warning(f"Bỏ message tới {chat_id} sau {message.attempts} lần: {e}")
+            else:
+                self.retries += 1
+                retry_at = time.monotonic() + min(self.max_backoff, 2 ** (message.attempts - 1))
+        except Exception as e:
+            # TelegramError khác hoặc lỗi không lường trước: bỏ message, chat vẫn được gửi tiếp
+            self.failed += 1
+            logger.exception(f"Bỏ message tới {chat_id}: {e}")
+        finally:
+            self._slots.release()
+            # Luôn lên lịch lại chat (còn message) hoặc bỏ khỏi _scheduled, kể cả khi bị cancel
+            if retry_at is not None:
+                self._pending.setdefault(chat_id, deque()).appendleft(message)
+            if self._pending.get(chat_id):
+                self._schedule(chat_id, max(retry_at or 0, self._chat_bucket(chat_id).available_at(time.monotonic())))
+            else:
+                self._pending.pop(chat_id, None)
+                self._scheduled.discard(chat_id)
+
+    def _migrate(self, chat_id, new_chat_id, message):
+        """Xếp message (và các message còn chờ của chat cũ) vào hàng đợi của new_chat_id"""
+        moved = [message] + list(self._pending.pop(chat_id, ()))
+        for item in moved:
+            item.chat_id = new_chat_id
+            # message_id thuộc chat cũ: ở chat mới chỉ gửi được message mới
+            item.message_id = None
+            self._enqueue(item)
+
+    async def _send(self, message):
+        if message.message_id is not None:
+            await self.bot.edit_message_text(message.text, chat_id=message.chat_id, message_id=message.message_id,
+                                             parse_mode=message.parse_mode, reply_markup=message.reply_markup)
+        else:
+            await self.bot.send_message(message.chat_id, message.text, parse_mode=message.parse_mode,
+                                        reply_markup=message.reply_markup)
+
+    def stats(self):
+        lags = sorted(self._lags)
+
+        def percentile(p):
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 1) if lags else 0.0
+
+        return {
+            'queued': sum(len(pending) for pending in self._pending.values()),
+            'chats_waiting': len(self._scheduled),
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'retries': self.retries,
+            'coalesced': self.coalesced,
+            'lag_p50_ms': percentile(0.5),
+            'lag_p95_ms': percentile(0.95),
+            'lag_max_ms': round(lags[-1] * 1000, 1) if lags else 0.0,
+        }
@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự timeframe trên keyboard phân tích của bot
+TIMEFRAMES = ('15m', '1h', '4h', '1d', '3d', '1w')
+
+
+class AnalysisPrefetcher:
+    """
+    Phân tích trước các timeframe kề với timeframe user vừa mở và lưu message đã render
+    vào RenderedMessageCache, để lần bấm tiếp theo trả về ngay.
+    Chạy trên pool riêng với số prefetch đồng thời giới hạn (budget): hết budget thì bỏ qua,
+    không bao giờ chiếm worker của request tương tác.
+    """
+
+    def __init__(self, render, cache, variant, timeframes=TIMEFRAMES, budget=2, neighbours=1, max_tracked=2000):
+        self.render = render  # render(symbol, timeframe) -> RenderedMessage | None (blocking)
+        self.cache = cache
+        self.variant = variant
+        self.timeframes = list(timeframes)
+        self.neighbours = neighbours
+        self._budget = threading.BoundedSemaphore(budget)
+        self._executor = ThreadPoolExecutor(max_workers=budget, thread_name_prefix='smc-prefetch')
+        self._in_flight = set()
+        # (symbol, timeframe) đã prefetch, chưa được user mở; chỉ giữ max_tracked key gần nhất
+        self._prefetched = OrderedDict()
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.skipped = 0
+        self.completed = 0
+        self.used = 0
+        self.requests = 0
+
+    def adjacent(self, timeframe):
+        """Các timeframe kề (gần nhất trước) trên keyboard"""
+        if timeframe not in self.timeframes:
+            return []
+        i = self.timeframes.index(timeframe)
+        result = []
+        for distance in range(1, self.neighbours + 1):
+            result += [self.timeframes[j] for j in (i + distance, i - distance) if 0 <= j < len(self.timeframes)]
+        return result
+
+    def prefetch_adjacent(self, symbol, timeframe):
+        for next_timeframe in self.adjacent(timeframe):
+            self.prefetch(symbol, next_timeframe)
+
+    def prefetch(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        with self._lock:
+            if key in self._in_flight or self.cache.contains(symbol, timeframe, self.variant):
+                return
+            if not self._budget.acquire(blocking=False):
+                self.skipped += 1
+                return
+            self._in_flight.add(key)
+            self.scheduled += 1
+        self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        try:
+            rendered = self.render(*key)
+            if rendered is not None:
+                self.cache.put(key[0], key[1], self.variant, rendered)
+                with self._lock:
+                    self._prefetched[key] = None
+                    self._prefetched.move_to_end(key)
+                    while len(self._prefetched) > self.max_tracked:
+                        self._prefetched.popitem(last=False)
+                    self.completed += 1
+        except Exception as e:
+            logger.warning(f"Prefetch {key[0]} {key[1]} thất bại: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+            self._budget.release()
+
+    def record_request(self, symbol, timeframe, cache_hit):
+        """Gọi mỗi khi user mở một phân tích, để đo tỉ lệ prefetch được dùng"""
+        with self._lock:
+            key = (symbol, timeframe)
+            self.requests += 1
+            if key in self._prefetched:
+                del self._prefetched[key]
+                if cache_hit:
+                    self.used += 1
+            report = self.requests % 100 == 0
+        if report:
+            logger.info(f"Prefetch stats: {self.stats()}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'scheduled': self.scheduled,
+                'skipped': self.skipped,
+                'completed': self.completed,
+                'used': self.used,
+                'hit_rate': self.used / self.completed if self.completed else 0.0,
+            }
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class RangeMax:
+    """
+    Sparse table cho truy vấn max trên đoạn [left, right] (gồm cả hai đầu) trong O(1),
+    dựng một lần trong O(n log n). Các tầng được giữ trong một mảng 2 chiều để truy vấn theo lô.
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        levels = max(1, int(n).bit_length())
+        table = np.full((levels, n), -np.inf)
+        if n:
+            table[0] = values
+        for k in range(1, levels):
+            width = 1 << (k - 1)
+            table[k, :n - 2 * width + 1] = np.maximum(table[k - 1, :n - 2 * width + 1],
+                                                      table[k - 1, width:n - width + 1])
+        self.table = table
+        self.n = n
+
+    def query(self, left, right):
+        """Max trên [left, right]; left, right có thể là số hoặc mảng; đoạn rỗng trả -inf"""
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        length = np.maximum(right - left + 1, 1)
+        k = np.floor(np.log2(length)).astype(np.int64)
+        last = max(self.n - 1, 0)
+        safe_left = np.minimum(np.maximum(left, 0), last)
+        safe_right = np.minimum(np.maximum(right - (1 << k) + 1, 0), last)
+        result = np.maximum(self.table[k, safe_left], self.table[k, safe_right])
+        return np.where(right >= left, result, -np.inf)
+
+    def first_above(self, start, threshold):
+        """
+        Với từng cặp (start, threshold): vị trí đầu tiên >= start có giá trị > threshold, -1 nếu không có.
+        Tìm nhị phân trên bảng cho cả lô cùng lúc (O(log n) lượt truy vấn vector).
+        """
+        start = np.asarray(start, dtype=np.int64)
+        threshold = np.asarray(threshold, dtype=np.float64)
+        found = self.query(start, np.full_like(start, self.n - 1)) > threshold
+        low = np.where(found, start, 0)
+        high = np.where(found, self.n - 1, 0)
+        while np.any(low < high):
+            middle = (low + high) // 2
+            above = self.query(start, middle) > threshold
+            high = np.where(above, middle, high)
+            low = np.where(above, low, middle + 1)
+        return np.where(found, low, -1)
@@ -0,0 +1,209 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from AdvancedSMC import AdvancedSMC
+
+logger = logging.getLogger(__name__)
+
+# Cùng chuỗi và thứ tự điều kiện với AdvancedSMC.get_recommendation
+RECOMMENDATIONS = ("🚀 STRONG BUY", "📈 BUY", "🔴 STRONG SELL", "📉 SELL", "⏸️ HOLD/WAIT")
+RECOMMENDATION_CODES = {'strong_buy': 0, 'buy': 1, 'strong_sell': 2, 'sell': 3, 'hold': 4}
+TREND_CODES = {'bearish': -1, 'neutral': 0, 'bullish': 1}
+TREND_NAMES = {code: name for name, code in TREND_CODES.items()}
+# Timeframe được phép quét (mỗi timeframe một UniverseScreener)
+SCREENER_TIMEFRAMES = ('15m', '1h', '4h', '1d', '3d', '1w')
+
+
+def signal_strength(bos_count, fvg_count, ob_count, rsi):
+    """AdvancedSMC.calculate_signal_strength trên mảng (mỗi phần tử một cặp)"""
+    strength = bos_count * 0.3 + fvg_count * 0.2 + ob_count * 0.1
+    strength = strength + np.where((rsi > 70) | (rsi < 30), 0.5, 0.0)
+    return np.minimum(strength, 10)
+
+
+def recommendation_codes(strength, rsi):
+    """AdvancedSMC.get_recommendation trên mảng, trả về chỉ số trong RECOMMENDATIONS"""
+    return np.select(
+        [(strength > 7) & (rsi < 30), (strength > 5) & (rsi < 40),
+         (strength > 7) & (rsi > 70), (strength > 5) & (rsi > 60)],
+        [0, 1, 2, 3], default=4,
+    )
+
+
+class UniverseScreener:
+    """
+    Xếp hạng toàn bộ cặp USDT của một exchange/timeframe theo độ mạnh signal.
+    Kết quả phân tích từng cặp được giữ trong các mảng cột; refresh chạy nền
+    (stale-while-revalidate), còn screen() chỉ tính điểm vector hóa trên trạng thái
+    đã có rồi chọn top-k bằng heap.
+    Nếu có correlation (ReturnCorrelation), nến của mỗi lần quét được đưa vào ma trận tương quan
+    để screen() bỏ bớt các setup cùng chạy theo một cặp khác (dedupe).
+    """
+
+    def __init__(self, catalog, exchange_name='binance', timeframe='4h', analyzer=None,
+                 ttl=900, workers=8, max_symbols=500, correlation=None):
+        self.catalog = catalog
+        self.exchange_name = exchange_name
+        self.timeframe = timeframe
+        self.analyzer = analyzer or AdvancedSMC(exchange_name=exchange_name)
+        self.ttl = ttl
+        self.workers = workers
+        self.max_symbols = max_symbols
+        self.correlation = correlation
+        self.refreshed_at = 0.0
+        self._symbols = []
+        self._index = {}
+        self._allocate(max_symbols)
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _allocate(self, capacity):
+        self._counts = np.zeros((capacity, 3), dtype=np.int32)  # BOS, FVG, OB
+        self._rsi = np.full(capacity, 50.0)
+        self._trend = np.zeros(capacity, dtype=np.int8)
+        self._price = np.zeros(capacity)
+        self._change_pct = np.zeros(capacity)
+        self._updated_at = np.zeros(capacity)  # 0: chưa phân tích
+
+    def _columns(self):
+        return self._counts, self._rsi, self._trend, self._price, self._change_pct, self._updated_at
+
+    def _row(self, symbol):
+        """Dòng của symbol trong các mảng (gọi khi đang giữ _lock)"""
+        row = self._index.get(symbol)
+        if row is None:
+            row = len(self._symbols)
+            if row == len(self._rsi):
+                # Hết chỗ (universe đổi giữa các lần refresh): tăng gấp đôi
+                old = self._columns()
+                self._allocate(2 * row)
+                for new_array, old_array in zip(self._columns(), old):
+                    new_array[:row] = old_array
+            self._symbols.append(symbol)
+            self._index[symbol] = row
+        return row
+
+    def update(self, symbol, result):
+        """Ghi kết quả get_trading_signals của một cặp vào trạng thái"""
+        smc = result['smc_analysis']
+        indicators = result['indicators']
+        trend = TREND_CODES[self.analyzer.determine_trend(smc)]
+        with self._lock:
+            row = self._row(symbol)
+            self._counts[row] = (len(smc['break_of_structure']), len(smc['fair_value_gaps']), len(smc['order_blocks']))
+            self._rsi[row] = indicators.get('rsi', 50)
+            self._trend[row] = trend
+            self._price[row] = result['current_price']
+            self._change_pct[row] = indicators.get('price_change_pct', 0)
+            self._updated_at[row] = time.time()
+
+    def _analyze(self, symbol):
+        try:
+            candles = self.analyzer.get_market_data(symbol, self.timeframe)
+            if candles is None:
+                return
+            result = self.analyzer.get_trading_signals(symbol, self.timeframe, candles=candles)
+            if result is not None:
+                self.update(symbol, result)
+            if self.correlation is not None:
+                self.correlation.update(symbol, candles)
+        except Exception as e:
+            logger.warning(f"Screener {symbol} {self.timeframe}: {e}")
+
+    def refresh(self):
+        """Phân tích lại toàn bộ universe (blocking)"""
+        started = time.time()
+        universe = self.catalog.symbols(self.exchange_name)[:self.max_symbols]
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='smc-screener') as executor:
+                list(executor.map(self._analyze, universe))
+            if self.correlation is not None:
+                self.correlation.advance()
+            self.refreshed_at = time.time()
+            print(f"Screener {self.exchange_name} {self.timeframe}: quét {len(universe)} cặp sau {self.refreshed_at - started:.1f}s")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name=f'screener-{self.exchange_name}-{self.timeframe}', daemon=True).start()
+
+    def screen(self, k=20, trend=None, rsi_min=None, rsi_max=None, recommendation=None, min_strength=None,
+               dedupe=None):
+        """
+        Top-k cặp theo độ mạnh signal từ trạng thái đã cache, lọc theo
+        trend (bullish/bearish/neutral), khoảng RSI và khuyến nghị (strong_buy, buy, sell, strong_sell, hold).
+        dedupe: bỏ cặp có tương quan return >= dedupe với một cặp xếp trên nó (cần correlation).
+        """
+        if time.time() - self.refreshed_at > self.ttl:
+            self.refresh_async()
+
+        with self._lock:
+            n = len(self._symbols)
+            symbols = list(self._symbols)
+            counts, rsi, trends, price, change_pct, updated_at = (column[:n].copy() for column in self._columns())
+        strength = signal_strength(counts[:, 0], counts[:, 1], counts[:, 2], rsi)
+        recommendation_code = recommendation_codes(strength, rsi)
+
+        mask = updated_at > 0
+        if trend is not None:
+            mask &= trends == TREND_CODES[trend]
+        if rsi_min is not None:
+            mask &= rsi >= rsi_min
+        if rsi_max is not None:
+            mask &= rsi <= rsi_max
+        if recommendation is not None:
+            mask &= recommendation_code == RECOMMENDATION_CODES[recommendation]
+        if min_strength is not None:
+            mask &= strength >= min_strength
+
+        correlated_with = {}
+        if dedupe is not None and self.correlation is not None:
+            top = self._dedupe(symbols, np.flatnonzero(mask), strength, k, dedupe, correlated_with)
+        else:
+            top = heapq.nlargest(k, np.flatnonzero(mask).tolist(), key=strength.__getitem__)
+        return {
+            'exchange': self.exchange_name,
+            'timeframe': self.timeframe,
+            'universe': n,
+            'scored': int(np.count_nonzero(updated_at)),
+            'matched': int(np.count_nonzero(mask)),
+            'refreshed_at': self.refreshed_at or None,
+            'results': [{
+                'symbol': symbols[i],
+                'signal_strength': float(strength[i]),
+                'trend': TREND_NAMES[int(trends[i])],
+                'rsi': float(rsi[i]),
+                'recommendation': RECOMMENDATIONS[recommendation_code[i]],
+                'current_price': float(price[i]),
+                'price_change_pct': float(change_pct[i]),
+                **({'correlated': correlated_with[i]} if i in correlated_with else {}),
+            } for i in top],
+        }
+
+    def _dedupe(self, symbols, candidates, strength, k, threshold, correlated_with):
+        """
+        Duyệt theo độ mạnh giảm dần, giữ cặp chưa tương quan >= threshold với cặp đã giữ;
+        cặp bị bỏ được ghi vào correlated_with[dòng cặp giữ lại].
+        """
+        ranked = candidates[np.argsort(-strength[candidates], kind='stable')]
+        _, correlation = self.correlation.matrix([symbols[i] for i in ranked.tolist()])
+        similar = correlation >= threshold
+        kept = []
+        for position, row in enumerate(ranked.tolist()):
+            leaders = [j for j in kept if similar[position, j]]
+            if leaders:
+                correlated_with.setdefault(int(ranked[leaders[0]]), []).append(symbols[row])
+                continue
+            if len(kept) < k:
+                kept.append(position)
+        return ranked[kept].tolist()
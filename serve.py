@@ -0,0 +1,108 @@
+# Production entry point cho app.py
+from startup import startup_report  # import đầu tiên: mốc 0 của báo cáo khởi động
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+with startup_report.phase('import app'):
+    import app as backend
+from exchange_adapter import get_mode
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    """Mỗi kết nối một request (HTTP/1.0) để kết nối idle không giữ worker; timeout socket cố định"""
+    protocol_version = 'HTTP/1.0'
+    timeout = float(os.getenv('SMC_SOCKET_TIMEOUT', '30'))
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server với số worker cố định thay cho dev server của Flask.
+    Khi tất cả worker bận và hàng đợi đầy, vòng accept dừng lại và kết nối mới
+    chờ trong backlog của kernel thay vì sinh thêm thread.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, wsgi_app, workers=64, queue_size=256, backlog=1024):
+        self.request_queue_size = backlog
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='smc-http')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        super().__init__(host, port, wsgi_app, handler=PooledRequestHandler)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        if hasattr(self, '_pool'):
+            self._pool.shutdown(wait=False)
+
+
+def split_env(name, default):
+    return tuple(value.strip() for value in os.getenv(name, default).split(',') if value.strip())
+
+
+def main():
+    host = os.getenv('SMC_HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', '5000'))
+    workers = int(os.getenv('SMC_HTTP_WORKERS', '64'))
+    if backend.MAX_STREAMS >= workers:
+        print(f"⚠️ SMC_MAX_STREAMS={backend.MAX_STREAMS} >= {workers} worker: stream có thể chiếm hết worker")
+
+    # Nạp snapshot lần chạy trước: kết quả/nến đã lưu dùng được ngay, warm-up chỉ lấy thêm nến mới
+    with startup_report.phase('load snapshot'):
+        backend.warm_state.load()
+    backend.warm_state.start()
+
+    # Chỉ báo ready sau khi warm-up xong; trong lúc đó /api/ready trả 503
+    backend.ready.clear()
+    with startup_report.phase('bind server'):
+        server = PooledWSGIServer(host, port, backend.app, workers=workers,
+                                  queue_size=int(os.getenv('SMC_HTTP_QUEUE', '256')))
+
+    def warm_up():
+        # Module nặng chỉ dùng khi phân tích/lấy dữ liệu: import nền sau khi đã nhận request
+        startup_report.timed_import('pandas')
+        if get_mode() != 'replay':
+            startup_report.timed_import('ccxt')
+        with startup_report.phase('warm-up'):
+            backend.warm_up(
+                exchanges=split_env('SMC_WARM_EXCHANGES', 'binance'),
+                symbols=split_env('SMC_WARM_SYMBOLS', 'BTC/USDT,ETH/USDT'),
+                timeframes=split_env('SMC_WARM_TIMEFRAMES', '4h'),
+            )
+        backend.ready.set()
+        startup_report.mark('ready')
+        startup_report.log()
+
+    threading.Thread(target=warm_up, name='smc-warm-up', daemon=True).start()
+    print(f"Server chạy tại http://{host}:{server.port} với {workers} worker")
+    startup_report.mark('serving')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import logging
+import os
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ohlcv import OHLCV, OHLCV_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SMCCNDL1'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('slots', '<i8'), ('capacity', '<i8')])
+# Bảng chỉ mục: key -> offset/length/version của vùng nến đang active
+INDEX_DTYPE = np.dtype([
+    ('key', 'S64'),
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    ('version', '<i8'),  # Lẻ: writer đang cập nhật; chẵn: ổn định
+    ('updated_at', '<i8'),  # ms
+])
+ROW_BYTES = 8 * (1 + len(OHLCV_COLUMNS))  # timestamp int64 + 5 cột float64
+
+
+def candle_key(exchange_name, symbol, timeframe):
+    return f"{exchange_name}|{symbol}|{timeframe}".encode()
+
+
+class SharedCandleStore:
+    """
+    Vùng nhớ nến dùng chung giữa các process (Flask workers, Telegram bot).
+    Một writer cập nhật, nhiều reader attach và đọc trực tiếp (zero-copy) qua OHLCV view
+    hoặc đọc bản sao (copy=True) khi kết quả được giữ lại trong cache.
+
+    Mỗi slot có 2 buffer: writer ghi vào buffer không active rồi mới đổi offset,
+    nên view reader đang giữ vẫn hợp lệ cho tới lần ghi thứ hai sau đó
+    (kiểm tra bằng version nếu cần giữ lâu).
+    """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self._owner = owner
+        self._header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)[0]
+        if bytes(self._header['magic']) != MAGIC:
+            raise ValueError(f"Shared memory {shm.name} không phải vùng nến SMC")
+        self.slots = int(self._header['slots'])
+        self.capacity = int(self._header['capacity'])
+        self._index = np.ndarray((self.slots,), dtype=INDEX_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+        self._data_offset = HEADER_DTYPE.itemsize + INDEX_DTYPE.itemsize * self.slots
+        self._buffer_bytes = ROW_BYTES * self.capacity
+        self._slot_cache = {}
+
+    @classmethod
+    def create(cls, name, slots=128, capacity=1000):
+        """Tạo vùng nhớ mới (process writer)"""
+        size = HEADER_DTYPE.itemsize + INDEX_DTYPE.itemsize * slots + 2 * slots * ROW_BYTES * capacity
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[0] = (MAGIC, slots, capacity)
+        index = np.ndarray((slots,), dtype=INDEX_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+        index[:] = np.zeros(slots, dtype=INDEX_DTYPE)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach vào vùng nhớ đã có (process reader)"""
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # Reader không sở hữu vùng nhớ: tránh resource_tracker xóa nó khi process thoát
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return cls(shm)
+
+    @classmethod
+    def attach_from_env(cls):
+        """Attach theo biến môi trường SMC_SHARED_CANDLES (None nếu không cấu hình hoặc chưa có writer)"""
+        name = os.getenv('SMC_SHARED_CANDLES')
+        if not name:
+            return None
+        try:
+            return cls.attach(name)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"Không thể attach vùng nến dùng chung {name}: {e}")
+            return None
+
+    def _find_slot(self, key):
+        slot = self._slot_cache.get(key)
+        if slot is not None:
+            return slot
+        matches = np.flatnonzero(self._index['key'] == key)
+        if len(matches):
+            slot = int(matches[0])
+            self._slot_cache[key] = slot  # Slot không bao giờ đổi chỗ sau khi cấp
+        return slot
+
+    def _buffer(self, offset, length):
+        timestamp = np.ndarray((length,), dtype='<i8', buffer=self._shm.buf, offset=offset)
+        values = np.ndarray((len(OHLCV_COLUMNS), self.capacity), dtype='<f8', buffer=self._shm.buf,
+                            offset=offset + 8 * self.capacity)
+        return timestamp, values[:, :length]
+
+    def write(self, exchange_name, symbol, timeframe, candles):
+        """Ghi (thay thế) nến của một cặp; chỉ giữ `capacity` nến cuối"""
+        key = candle_key(exchange_name, symbol, timeframe)
+        slot = self._find_slot(key)
+        if slot is None:
+            free = np.flatnonzero(self._index['key'] == b'')
+            if not len(free):
+                raise MemoryError("Vùng nến dùng chung đã hết slot")
+            slot = int(free[0])
+            self._index[slot]['offset'] = 0
+            self._index[slot]['key'] = key
+            self._slot_cache[key] = slot
+
+        candles = candles.tail(self.capacity)
+        entry = self._index[slot]
+        first_buffer = self._data_offset + 2 * slot * self._buffer_bytes
+        # Ghi vào buffer đang không active
+        offset = first_buffer + self._buffer_bytes if int(entry['offset']) == first_buffer else first_buffer
+        timestamp, values = self._buffer(offset, len(candles))
+        timestamp[:] = candles.timestamp
+        values[:] = candles.values
+
+        entry['version'] += 1
+        entry['offset'] = offset
+        entry['length'] = len(candles)
+        entry['updated_at'] = int(time.time() * 1000)
+        entry['version'] += 1
+
+    def read(self, exchange_name, symbol, timeframe, max_age=None, limit=None, copy=False):
+        """
+        Đọc nến của một cặp (chỉ `limit` nến cuối nếu có).
+        copy=False: OHLCV view trên vùng nhớ dùng chung, bị ghi đè sau hai lần ghi;
+        copy=True: bản sao riêng, đã kiểm tra version sau khi sao chép (dùng cho dữ liệu được cache).
+        Trả về None nếu chưa có hoặc dữ liệu cũ hơn max_age giây.
+        """
+        slot = self._find_slot(candle_key(exchange_name, symbol, timeframe))
+        if slot is None:
+            return None
+
+        entry = self._index[slot]
+        for _ in range(100):
+            version = int(entry['version'])
+            if version % 2:
+                continue  # Writer đang cập nhật bảng chỉ mục
+            offset, length, updated_at = int(entry['offset']), int(entry['length']), int(entry['updated_at'])
+            if int(entry['version']) != version:
+                continue
+            if length == 0 or (max_age is not None and time.time() * 1000 - updated_at > max_age * 1000):
+                return None
+            timestamp, values = self._buffer(offset, length)
+            if limit is not None:
+                timestamp, values = timestamp[-limit:], values[:, -limit:]
+            if not copy:
+                return OHLCV(timestamp, values)
+            candles = OHLCV(timestamp.copy(), values.copy())
+            # Lần ghi đầu sau đó dùng buffer kia; từ lần ghi thứ hai buffer này có thể đang bị ghi: đọc lại
+            if int(entry['version']) - version < 2:
+                return candles
+        return None
+
+    def version(self, exchange_name, symbol, timeframe):
+        """Version hiện tại của một cặp (tăng 2 mỗi lần ghi)"""
+        slot = self._find_slot(candle_key(exchange_name, symbol, timeframe))
+        return None if slot is None else int(self._index[slot]['version'])
+
+    def close(self):
+        self._header = self._index = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedCandleWriter:
+    """Nhận nến từ CandleFeed và ghi vào SharedCandleStore"""
+
+    def __init__(self, store, exchange_name, window=1000):
+        self.store = store
+        self.exchange_name = exchange_name
+        self.window = min(window, store.capacity)
+        self._candles = {}
+
+    def attach(self, feed, symbol, timeframe):
+        rows = self._candles.setdefault((symbol, timeframe), deque(maxlen=self.window))
+
+        def on_candles(event):
+            if event.closed:
+                rows.extend(event.candles)
+                window = list(rows)
+            else:
+                window = list(rows) + [candle for candle in event.candles if not rows or candle[0] > rows[-1][0]]
+            self.store.write(self.exchange_name, symbol, timeframe, OHLCV.from_rows(window))
+
+        return feed.subscribe(symbol, timeframe, on_candles, include_partial=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from candle_feed import CcxtCandleFeed
+
+    parser = argparse.ArgumentParser(description="Process writer cho vùng nến dùng chung")
+    parser.add_argument('--name', default=os.getenv('SMC_SHARED_CANDLES', 'smc_candles'))
+    parser.add_argument('--exchange', default='binance')
+    parser.add_argument('--symbols', default='BTC/USDT,ETH/USDT')
+    parser.add_argument('--timeframes', default='15m,1h,4h,1d,3d,1w')
+    parser.add_argument('--slots', type=int, default=128)
+    parser.add_argument('--capacity', type=int, default=1000)
+    args = parser.parse_args()
+
+    store = SharedCandleStore.create(args.name, slots=args.slots, capacity=args.capacity)
+    feed = CcxtCandleFeed(args.exchange, history=args.capacity)
+    writer = SharedCandleWriter(store, args.exchange, window=args.capacity)
+    for symbol in args.symbols.split(','):
+        for timeframe in args.timeframes.split(','):
+            writer.attach(feed, symbol, timeframe)
+
+    print(f"Đang ghi nến vào shared memory '{args.name}'...")
+    try:
+        feed.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Các danh sách trong kết quả phân tích được so sánh, mỗi phần tử nhận diện bằng (type, time)
+DIFF_SECTIONS = {
+    'smc_analysis': ('order_blocks', 'fair_value_gaps', 'break_of_structure', 'liquidity_zones'),
+    'trading_signals': ('entry_long', 'entry_short', 'exit_long', 'exit_short'),
+}
+
+
+def _item_key(item):
+    return item.get('type'), item.get('time'), item.get('tag')
+
+
+def diff_analysis(old, new):
+    """
+    So sánh hai kết quả get_trading_signals liên tiếp.
+    Trả về dict {section: {'added': [...], 'removed': [...], 'changed': [...]}} chỉ gồm các
+    danh sách có thay đổi (vd: OB/FVG mới, FVG đã fill, signal entry mới); rỗng nếu không đổi.
+    """
+    changes = {}
+    for group, sections in DIFF_SECTIONS.items():
+        old_group = (old or {}).get(group) or {}
+        new_group = new.get(group) or {}
+        for section in sections:
+            before = {_item_key(item): item for item in old_group.get(section, [])}
+            after = {_item_key(item): item for item in new_group.get(section, [])}
+            added = [item for key, item in after.items() if key not in before]
+            removed = [item for key, item in before.items() if key not in after]
+            changed = [item for key, item in after.items() if key in before and before[key] != item]
+            if added or removed or changed:
+                changes[section] = {'added': added, 'removed': removed, 'changed': changed}
+    return changes
+
+
+class SignalSubscriber:
+    """
+    Hàng đợi sự kiện của một client. Khi client đọc chậm và hàng đợi đầy, các diff cũ
+    bị bỏ và mỗi (symbol, timeframe) bị mất sự kiện nhận một 'resync' chứa kết quả đầy đủ mới nhất.
+    """
+
+    def __init__(self, keys, queue_size=100):
+        self.keys = list(keys)
+        self.dropped = 0
+        # Đủ chỗ cho một resync mỗi key sau khi tràn
+        self._queue = queue.Queue(maxsize=max(queue_size, len(self.keys)))
+        self._latest = {}  # (symbol, timeframe) -> kết quả đầy đủ mới nhất đã nhận
+        self._lock = threading.Lock()
+
+    def put(self, event, snapshot):
+        with self._lock:
+            key = (event['symbol'], event['timeframe'])
+            self._latest[key] = snapshot
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                pass
+            # Mọi key có sự kiện bị bỏ đều cần resync, không chỉ key đang put
+            stale = {}
+            while True:
+                try:
+                    dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.dropped += 1
+                stale[(dropped['symbol'], dropped['timeframe'])] = None
+            stale.pop(key, None)
+            stale[key] = None
+            for symbol, timeframe in stale:
+                self._queue.put_nowait({'event': 'resync', 'symbol': symbol, 'timeframe': timeframe,
+                                        'data': self._latest[(symbol, timeframe)]})
+
+    def get(self, timeout=None):
+        """Sự kiện tiếp theo, None nếu hết timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class SignalStreamHub:
+    """
+    Mỗi (symbol, timeframe) có đúng một producer thread chạy phân tích định kỳ,
+    dù có bao nhiêu client đang nghe; producer dừng khi client cuối cùng rời đi.
+    """
+
+    def __init__(self, analyze, interval=15, queue_size=100, max_keys=200):
+        self.analyze = analyze
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_keys = max_keys
+        self._producers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, keys):
+        """Đăng ký nhận sự kiện cho danh sách (symbol, timeframe); trả về SignalSubscriber"""
+        subscriber = SignalSubscriber(keys, self.queue_size)
+        with self._lock:
+            new_keys = [key for key in subscriber.keys if key not in self._producers]
+            if len(self._producers) + len(new_keys) > self.max_keys:
+                raise ValueError(f"Quá nhiều cặp đang được stream (tối đa {self.max_keys})")
+            for key in subscriber.keys:
+                producer = self._producers.get(key)
+                if producer is None:
+                    producer = self._producers[key] = {
+                        'subscribers': set(), 'latest': None, 'stop': threading.Event(),
+                    }
+                    threading.Thread(target=self._run, args=(key, producer),
+                                     name=f"signals-{key[0]}-{key[1]}", daemon=True).start()
+                producer['subscribers'].add(subscriber)
+                # Client mới nhận ngay kết quả đầy đủ gần nhất (nếu producer đã chạy)
+                if producer['latest'] is not None:
+                    subscriber.put(self._event('snapshot', key, producer['latest']), producer['latest'])
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for key in subscriber.keys:
+                producer = self._producers.get(key)
+                if producer is None:
+                    continue
+                producer['subscribers'].discard(subscriber)
+                if not producer['subscribers']:
+                    producer['stop'].set()
+                    del self._producers[key]
+
+    def stats(self):
+        with self._lock:
+            return {f"{symbol}|{timeframe}": len(producer['subscribers'])
+                    for (symbol, timeframe), producer in self._producers.items()}
+
+    @staticmethod
+    def _event(name, key, data):
+        return {'event': name, 'symbol': key[0], 'timeframe': key[1], 'data': data}
+
+    def _publish(self, producer, event, snapshot):
+        # Cập nhật latest cùng lúc lấy danh sách subscriber: client đăng ký sau đó nhận snapshot
+        # từ subscribe(), không bị nhận trùng
+        with self._lock:
+            producer['latest'] = snapshot
+            subscribers = list(producer['subscribers'])
+        for subscriber in subscribers:
+            subscriber.put(event, snapshot)
+
+    def _run(self, key, producer):
+        symbol, timeframe = key
+        stop = producer['stop']
+        while not stop.is_set():
+            started = time.time()
+            try:
+                result = self.analyze(symbol, timeframe)
+            except Exception as e:
+                logger.warning(f"Stream {symbol} {timeframe}: lỗi phân tích: {e}")
+                result = None
+
+            if result is not None:
+                previous = producer['latest']
+                if previous is None:
+                    self._publish(producer, self._event('snapshot', key, result), result)
+                else:
+                    changes = diff_analysis(previous, result)
+                    if not changes:
+                        with self._lock:
+                            producer['latest'] = result
+                    else:
+                        self._publish(producer, self._event('diff', key, {
+                            'timestamp': result.get('timestamp'),
+                            'current_price': result.get('current_price'),
+                            'changes': changes,
+                        }), result)
+
+            stop.wait(max(0.0, self.interval - (time.time() - started)))
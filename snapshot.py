@@ -0,0 +1,245 @@
+import atexit
+import io
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from ohlcv import OHLCV, OHLCV_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def merge_candles(old, new):
+    """
+    Nối nến mới vào đuôi nến cũ theo timestamp: nến cũ từ timestamp đầu tiên của new trở đi
+    (gồm nến đang chạy lúc lấy dữ liệu cũ) được thay bằng new.
+    """
+    if old is None or not len(old):
+        return new
+    if not len(new):
+        return old
+    cut = int(np.searchsorted(old.timestamp, new.timestamp[0], side='left'))
+    return OHLCV(np.concatenate([old.timestamp[:cut], new.timestamp]),
+                 np.concatenate([old.values[:, :cut], new.values], axis=1))
+
+
+class CandleTails:
+    """
+    Đuôi nến gần nhất theo (exchange, symbol, timeframe), để fetch_candles chỉ lấy
+    các nến từ nến cuối đã có thay vì cả `limit` nến mỗi lần (và sau restart khi nạp từ snapshot).
+    """
+
+    def __init__(self, keep=500, max_keys=2000):
+        self.keep = keep
+        self.max_keys = max_keys
+        self._tails = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, exchange_name, symbol, timeframe):
+        key = (exchange_name, symbol, timeframe)
+        with self._lock:
+            candles = self._tails.get(key)
+            if candles is not None:
+                self._tails.move_to_end(key)
+            return candles
+
+    def merge(self, exchange_name, symbol, timeframe, candles, replace=False):
+        """Gộp nến mới vào đuôi đã lưu (replace: thay hẳn), trả về đuôi sau khi gộp"""
+        key = (exchange_name, symbol, timeframe)
+        with self._lock:
+            old = None if replace else self._tails.get(key)
+            merged = merge_candles(old, candles).tail(self.keep)
+            self._tails[key] = merged
+            self._tails.move_to_end(key)
+            while len(self._tails) > self.max_keys:
+                self._tails.popitem(last=False)
+            return merged
+
+    def to_arrays(self):
+        """Tất cả đuôi nến ghép thành các mảng liền kề (keys, offsets, timestamp, values)"""
+        with self._lock:
+            items = list(self._tails.items())
+        offsets = np.zeros(len(items) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(candles) for _, candles in items])
+        if items:
+            timestamp = np.concatenate([candles.timestamp for _, candles in items])
+            values = np.concatenate([candles.values for _, candles in items], axis=1)
+        else:
+            timestamp = np.zeros(0, dtype=np.int64)
+            values = np.zeros((len(OHLCV_COLUMNS), 0), dtype=np.float64)
+        return [list(key) for key, _ in items], offsets, timestamp, values
+
+    def load_arrays(self, keys, offsets, timestamp, values):
+        with self._lock:
+            for i, key in enumerate(keys):
+                start, end = offsets[i], offsets[i + 1]
+                # Sao chép ra khỏi mảng chung để đuôi nến không giữ cả snapshot trong bộ nhớ
+                self._tails[tuple(key)] = OHLCV(timestamp[start:end].copy(), values[:, start:end].copy())
+            while len(self._tails) > self.max_keys:
+                self._tails.popitem(last=False)
+
+    def __len__(self):
+        return len(self._tails)
+
+
+class AnalysisResultStore:
+    """
+    Kết quả get_trading_signals gần nhất theo (symbol, timeframe).
+    Kết quả dùng được khi nến cuối của nó chưa đóng; quá max_age giây thì coi là cũ
+    (vẫn trả về ngay, caller tính lại nền - stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries=2000, max_age=30):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()  # (symbol, timeframe) -> (computed_at, result)
+        self._lock = threading.Lock()
+
+    def get(self, symbol, timeframe, now=None):
+        """(result, fresh) hoặc (None, False) nếu chưa có, nến đã đóng hoặc timeframe không hợp lệ"""
+        from craw_data import timeframe_to_ms
+
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get((symbol, timeframe))
+        if entry is None:
+            return None, False
+        computed_at, result = entry
+        try:
+            candle_ms = timeframe_to_ms(timeframe)
+        except ValueError:
+            return None, False
+        if now * 1000 >= result['timestamp'] * 1000 + candle_ms:
+            return None, False
+        return result, now - computed_at < self.max_age
+
+    def put(self, symbol, timeframe, result, computed_at=None):
+        """Lưu kết quả; timeframe không hợp lệ thì bỏ qua (get luôn coi là miss)"""
+        from craw_data import timeframe_to_ms
+
+        try:
+            timeframe_to_ms(timeframe)
+        except ValueError:
+            return result
+        key = (symbol, timeframe)
+        with self._lock:
+            self._entries[key] = (time.time() if computed_at is None else computed_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def dump(self):
+        with self._lock:
+            return [[symbol, timeframe, computed_at, result]
+                    for (symbol, timeframe), (computed_at, result) in self._entries.items()]
+
+    def restore(self, entries):
+        for symbol, timeframe, computed_at, result in entries:
+            self.put(symbol, timeframe, result, computed_at)
+
+
+class WarmState:
+    """
+    Snapshot trạng thái nóng của một process (đuôi nến + các section JSON như kết quả phân tích,
+    message đã render) ra một file .npz nén, ghi định kỳ và khi thoát, nạp lại lúc khởi động.
+    Sau restart, request đầu tiên dùng kết quả/nến đã lưu và chỉ lấy thêm các nến đóng sau snapshot.
+    """
+
+    def __init__(self, path, candle_tails, interval=60):
+        self.path = path
+        self.candle_tails = candle_tails
+        self.interval = interval
+        self._sections = {}  # tên -> (dump() -> JSON, restore(data))
+        self._thread = None
+        self._stop = threading.Event()
+        self.saved_at = None
+
+    def register(self, name, dump, restore):
+        self._sections[name] = (dump, restore)
+
+    def save(self):
+        if not self.path:
+            return False
+        started = time.time()
+        try:
+            keys, offsets, timestamp, values = self.candle_tails.to_arrays()
+            sections = {}
+            for name, (dump, _) in self._sections.items():
+                sections[name] = dump()
+            meta = {'version': SNAPSHOT_VERSION, 'saved_at': started, 'keys': keys}
+            buffer = io.BytesIO()
+            np.savez_compressed(
+                buffer, offsets=offsets, timestamp=timestamp, values=values,
+                meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+                sections=np.frombuffer(json.dumps(sections, default=str).encode(), dtype=np.uint8))
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Không thể lưu snapshot {self.path}: {e}")
+            return False
+        self.saved_at = started
+        logger.info(f"Đã lưu snapshot {self.path}: {len(keys)} chuỗi nến, "
+                    f"{buffer.tell() / 1024:.0f} KB trong {time.time() - started:.2f}s")
+        return True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        started = time.time()
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(data['meta'].tobytes())
+                if meta.get('version') != SNAPSHOT_VERSION:
+                    logger.warning(f"Bỏ qua snapshot {self.path}: version {meta.get('version')}")
+                    return False
+                self.candle_tails.load_arrays(meta['keys'], data['offsets'], data['timestamp'], data['values'])
+                sections = json.loads(data['sections'].tobytes())
+            for name, (_, restore) in self._sections.items():
+                if name in sections:
+                    restore(sections[name])
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            logger.warning(f"Không thể đọc snapshot {self.path}: {e}")
+            return False
+        logger.info(f"Đã nạp snapshot {self.path} (lưu {time.time() - meta['saved_at']:.0f}s trước): "
+                    f"{len(meta['keys'])} chuỗi nến trong {time.time() - started:.2f}s")
+        return True
+
+    def start(self):
+        """Ghi snapshot mỗi interval giây trên thread nền và một lần khi process thoát"""
+        if self._thread is not None or not self.path:
+            return
+        self._thread = threading.Thread(target=self._run, name='smc-snapshot', daemon=True)
+        self._thread.start()
+        atexit.register(self.save)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+
+# Đuôi nến dùng chung của process (craw_data.fetch_candles đọc/ghi)
+candle_tails = CandleTails(keep=int(os.getenv('SMC_CANDLE_TAIL', '500')))
+
+
+def warm_state_from_env(default_path):
+    """WarmState của process; SMC_SNAPSHOT_PATH rỗng để tắt snapshot"""
+    path = os.getenv('SMC_SNAPSHOT_PATH', default_path)
+    return WarmState(path, candle_tails, interval=float(os.getenv('SMC_SNAPSHOT_INTERVAL', '60')))
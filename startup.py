@@ -0,0 +1,61 @@
+import importlib
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Đo thời gian khởi động của process: thời gian từng bước import/khởi tạo (phase)
+    và các mốc tính từ lúc module này được import (mark), ví dụ 'serving', 'warm'.
+    Import module này đầu tiên trong entry point (serve.py, telegram_bot.py) để mốc 0 chính xác.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.marks = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - started))
+
+    def timed_import(self, module):
+        """Import module nặng (pandas, ccxt...) và ghi lại thời gian, bỏ qua nếu đã import"""
+        if module in sys.modules:
+            return sys.modules[module]
+        with self.phase(f'import {module}'):
+            return importlib.import_module(module)
+
+    def mark(self, name):
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            self.marks.append((name, elapsed))
+        logger.info(f"Startup: {name} sau {elapsed * 1000:.0f}ms")
+        return elapsed
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in self.phases},
+                'marks_ms': {name: round(seconds * 1000, 1) for name, seconds in self.marks},
+            }
+
+    def log(self):
+        report = self.as_dict()
+        lines = [f"  {name:<24} {ms:>8.1f}ms" for name, ms in report['phases_ms'].items()]
+        lines += [f"  @{name:<23} {ms:>8.1f}ms" for name, ms in report['marks_ms'].items()]
+        print("Startup report:\n" + "\n".join(lines))
+
+
+startup_report = StartupReport()
@@ -0,0 +1,129 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from rangeq import RangeMax
+
+
+def swing_pivots(high, low, lookbacks):
+    """
+    Swing high/low cho nhiều lookback, tính phân cấp: pivot ở lookback lớn chắc chắn là pivot
+    ở lookback nhỏ hơn, nên chỉ kiểm tra lại các pivot của scale nhỏ hơn ngay trước nó
+    bằng truy vấn max/min trên đoạn (sparse table), thay vì quét lại toàn bộ mảng.
+
+    Returns:
+        dict: lookback -> (swing_high, swing_low) mảng bool
+    """
+    n = len(high)
+    lookbacks = sorted(set(lookbacks))
+    pivots = {}
+    range_high = range_low = None
+    previous = None
+    for lookback in lookbacks:
+        swing_high = np.zeros(n, dtype=bool)
+        swing_low = np.zeros(n, dtype=bool)
+        window = lookback * 2 + 1
+        if n >= window:
+            if previous is None:
+                center = slice(lookback, n - lookback)
+                swing_high[center] = sliding_window_view(high, window).max(axis=1) == high[center]
+                swing_low[center] = sliding_window_view(low, window).min(axis=1) == low[center]
+            else:
+                if range_high is None:
+                    range_high, range_low = RangeMax(high), RangeMax(-low)
+                for candidates, values, ranges, out in ((previous[0], high, range_high, swing_high),
+                                                        (previous[1], -low, range_low, swing_low)):
+                    positions = np.flatnonzero(candidates)
+                    positions = positions[(positions >= lookback) & (positions < n - lookback)]
+                    out[positions] = ranges.query(positions - lookback, positions + lookback) == values[positions]
+        pivots[lookback] = (swing_high, swing_low)
+        previous = (swing_high, swing_low)
+    return pivots
+
+
+def _candidates(high, low, swing_high, swing_low):
+    """
+    Các nến có thể làm đổi trạng thái cấu trúc: nến pivot, hoặc nến vượt đỉnh/thủng đáy của
+    pivot gần nhất (mức swing đang theo dõi luôn là giá của pivot gần nhất hoặc đã bị reset),
+    nên các nến còn lại bỏ qua được mà kết quả không đổi.
+    """
+    positions = np.arange(len(high))
+    last_high = np.maximum.accumulate(np.where(swing_high, positions, -1))
+    last_low = np.maximum.accumulate(np.where(swing_low, positions, -1))
+    above = (last_high >= 0) & (high > high[np.maximum(last_high, 0)])
+    below = (last_low >= 0) & (low < low[np.maximum(last_low, 0)])
+    return np.flatnonzero(swing_high | swing_low | above | below).tolist()
+
+
+def structure_signals(high, low, pivots):
+    """
+    BOS/CHoCH cho mọi scale (cùng logic từng nến như compute_smc_features):
+    1 bullish BOS, -1 bearish BOS, 2 bullish CHoCH, -2 bearish CHoCH.
+    Mỗi scale chỉ duyệt các nến ứng viên (_candidates) thay vì toàn bộ mảng.
+
+    Args:
+        pivots: list (swing_high, swing_low) theo từng scale.
+
+    Returns:
+        list mảng int8 theo thứ tự của pivots.
+    """
+    n = len(high)
+    highs = high.tolist()
+    lows = low.tolist()
+    signals = []
+    for swing_high, swing_low in pivots:
+        signal = np.zeros(n, dtype=np.int8)
+        is_swing_high = swing_high.tolist()
+        is_swing_low = swing_low.tolist()
+        last_swing_high = None
+        last_swing_low = None
+        trend = 0  # 1 for bullish, -1 for bearish
+        positions = []
+        values = []
+
+        for i in _candidates(high, low, swing_high, swing_low):
+            current_high = highs[i]
+            current_low = lows[i]
+            if is_swing_high[i]:
+                last_swing_high = current_high
+            if is_swing_low[i]:
+                last_swing_low = current_low
+
+            if trend == 1 and last_swing_low is not None and current_low < last_swing_low:
+                value = -2  # Bearish CHoCH
+                trend = -1
+                last_swing_high = None  # Reset
+            elif trend == -1 and last_swing_high is not None and current_high > last_swing_high:
+                value = 2  # Bullish CHoCH
+                trend = 1
+                last_swing_low = None  # Reset
+            elif last_swing_high is not None and current_high > last_swing_high:
+                value = 1  # Bullish BOS
+                trend = 1
+                last_swing_low = None  # Reset
+            elif last_swing_low is not None and current_low < last_swing_low:
+                value = -1  # Bearish BOS
+                trend = -1
+                last_swing_high = None  # Reset
+            else:
+                continue
+            positions.append(i)
+            values.append(value)
+
+        signal[positions] = values
+        signals.append(signal)
+    return signals
+
+
+def compute_structure(high, low, lookbacks):
+    """
+    Cấu trúc thị trường ở nhiều scale (ví dụ internal 5, external 20) trong một lần tính.
+
+    Returns:
+        dict: lookback -> {'swing_high', 'swing_low', 'bos_choch_signal'}
+    """
+    lookbacks = sorted(set(lookbacks))
+    pivots = swing_pivots(high, low, lookbacks)
+    signals = structure_signals(high, low, [pivots[lookback] for lookback in lookbacks])
+    return {lookback: {'swing_high': pivots[lookback][0], 'swing_low': pivots[lookback][1],
+                       'bos_choch_signal': signal}
+            for lookback, signal in zip(lookbacks, signals)}
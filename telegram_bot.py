@@ -1,8 +1,19 @@
+from startup import startup_report  # import đầu tiên: mốc 0 của báo cáo khởi động
 import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from AdvancedSMC import AdvancedSMC
+from market_catalog import MarketCatalog
+from message_cache import RenderedMessage, RenderedMessageCache
+from prefetch import AnalysisPrefetcher
+from alerts import AlertScheduler, AlertStore
+from outbound import OutboundQueue
+from bot_webhook import PerChatUpdateProcessor, serve_webhook
+from screener import SCREENER_TIMEFRAMES, TREND_CODES, UniverseScreener
+from snapshot import warm_state_from_env
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 import time
@@ -11,10 +22,47 @@ import time
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Số thread phân tích (fetch + pandas) và số update Telegram xử lý đồng thời
+BOT_WORKERS = int(os.getenv('SMC_BOT_WORKERS', '8'))
+BOT_CONCURRENT_UPDATES = int(os.getenv('SMC_BOT_CONCURRENT_UPDATES', '256'))
+# Số phân tích prefetch chạy đồng thời tối đa (pool riêng, không dùng worker tương tác)
+PREFETCH_BUDGET = int(os.getenv('SMC_PREFETCH_BUDGET', '2'))
+
+# Chế độ nhận update: polling (mặc định) hoặc webhook
+BOT_MODE = os.getenv('SMC_BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('SMC_WEBHOOK_URL')  # URL public để setWebhook, ví dụ https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('SMC_WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('SMC_WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('SMC_WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('SMC_WEBHOOK_SECRET')
+
+# Variant của message phân tích trong RenderedMessageCache (ngôn ngữ/định dạng hiện tại)
+MESSAGE_VARIANT = 'vi_markdown'
+
+class AnalysisSuperseded(Exception):
+    """Phân tích bị thay thế bởi yêu cầu mới hơn trên cùng message"""
+
 class TradingBot:
     def __init__(self, token):
         self.token = token
         self.smc_analyzer = AdvancedSMC()
+        self.market_catalog = MarketCatalog(exchanges=[self.smc_analyzer.exchange_name])
+        self.screeners = {}
+        self.executor = ThreadPoolExecutor(max_workers=BOT_WORKERS, thread_name_prefix='smc-bot')
+        self._pending = {}  # (chat_id, message_id) -> future phân tích đang chờ
+        self.message_cache = RenderedMessageCache(max_entries=int(os.getenv('SMC_MESSAGE_CACHE_SIZE', '2000')))
+        self.prefetcher = AnalysisPrefetcher(self.render_prefetch, self.message_cache, MESSAGE_VARIANT,
+                                             budget=PREFETCH_BUDGET, max_tracked=self.message_cache.max_entries)
+        # Warm restart: message đã render + đuôi nến ghi định kỳ ra snapshot, nạp lại trong run()
+        self.warm_state = warm_state_from_env('snapshots/bot.npz')
+        self.warm_state.register(
+            'messages',
+            lambda: self.message_cache.dump(encode_markup=lambda markup: markup.to_dict()),
+            lambda entries: self.message_cache.restore(
+                entries, decode_markup=lambda data: InlineKeyboardMarkup.de_json(data, None)))
+        self.alert_store = AlertStore(os.getenv('SMC_ALERTS_FILE', 'alerts.json'))
+        self.alert_scheduler = AlertScheduler(self.alert_store, self.analyze, self.send_alert)
+        self.outbound = None  # OutboundQueue, tạo trong post_init khi đã có event loop
         self.application = None
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -61,50 +109,121 @@ Chọn một tùy chọn bên dưới để bắt đầu:
                 timeframe = parts[-1]
                 await self.send_analysis(query, symbol, timeframe)
 
+    async def analyze(self, symbol, timeframe, key=None):
+        """
+        Chạy get_trading_signals trên worker pool để event loop không bị chặn.
+        Yêu cầu mới cùng key (cùng message) hủy yêu cầu cũ nếu nó còn xếp hàng,
+        hoặc bỏ kết quả của nó nếu đã chạy (AnalysisSuperseded).
+        """
+        future = self.executor.submit(self.smc_analyzer.get_trading_signals, symbol, timeframe)
+        if key is not None:
+            self.cancel_analysis(key)
+            self._pending[key] = future
+        
+        superseded = False
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                raise AnalysisSuperseded()
+            raise
+        finally:
+            # Không còn là yêu cầu hiện hành của message (bị thay hoặc bị hủy): bỏ kết quả
+            superseded = key is not None and self._pending.get(key) is not future
+            if key is not None and not superseded:
+                del self._pending[key]
+        
+        if superseded:
+            raise AnalysisSuperseded()
+        return result
+    
+    def cancel_analysis(self, key):
+        """Hủy phân tích đang chờ của message để kết quả cũ không ghi đè nội dung mới hơn"""
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+    
+    def build_analysis_keyboard(self, symbol, timeframe):
+        """Keyboard chọn timeframe/Refresh dưới message phân tích"""
+        symbol_encoded = symbol.replace('/', '_')  # BTC/USDT -> BTC_USDT for callback
+        keyboard = [
+            [InlineKeyboardButton("📊 15m", callback_data=f'tf_{symbol_encoded}_15m'),
+             InlineKeyboardButton("📊 1h", callback_data=f'tf_{symbol_encoded}_1h'),
+             InlineKeyboardButton("📊 4h", callback_data=f'tf_{symbol_encoded}_4h')],
+            [InlineKeyboardButton("📊 1d", callback_data=f'tf_{symbol_encoded}_1d'),
+             InlineKeyboardButton("📊 3d", callback_data=f'tf_{symbol_encoded}_3d'),
+             InlineKeyboardButton("📊 1w", callback_data=f'tf_{symbol_encoded}_1w')],
+            [InlineKeyboardButton("🔄 Refresh", callback_data=f'tf_{symbol_encoded}_{timeframe}'),
+             InlineKeyboardButton("🏠 Menu", callback_data='start')]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    def render_analysis(self, symbol, timeframe, result, message=None):
+        """RenderedMessage (Markdown + keyboard) từ kết quả get_trading_signals"""
+        if message is None:
+            message = self.format_analysis_message(result)
+        return RenderedMessage(message, self.build_analysis_keyboard(symbol, timeframe), 'Markdown',
+                               result['timestamp'] * 1000)
+    
+    def render_prefetch(self, symbol, timeframe):
+        """Phân tích + render (blocking), chạy trên pool của prefetcher"""
+        result = self.smc_analyzer.get_trading_signals(symbol, timeframe)
+        return None if result is None else self.render_analysis(symbol, timeframe, result)
+    
     async def send_analysis(self, query, symbol, timeframe='4h'):
         """Gửi phân tích SMC cho symbol với timeframe cụ thể"""
-        await query.edit_message_text("🔄 Đang phân tích... Vui lòng đợi...")
+        # Message đã render cho nến đang chạy: dùng lại, không phân tích/format lại
+        rendered = self.message_cache.get(symbol, timeframe, MESSAGE_VARIANT)
+        self.prefetcher.record_request(symbol, timeframe, rendered is not None)
         
+        message_key = (query.message.chat_id, query.message.message_id)
         try:
-            # Lấy phân tích từ SMC
-            result = self.smc_analyzer.get_trading_signals(symbol, timeframe)
-            
-            if result is None:
-                await query.edit_message_text("❌ Không thể lấy dữ liệu. Vui lòng thử lại sau.")
-                return
-            
-            # Format message với error handling
-            try:
-                message = self.format_analysis_message(result)
-            except Exception as e:
-                logger.error(f"Error formatting message: {e}")
-                message = f"❌ Lỗi khi format message cho {symbol}\nVui lòng thử lại sau."
-                await query.edit_message_text(message)
-                return
+            if rendered is None:
+                await query.edit_message_text("🔄 Đang phân tích... Vui lòng đợi...")
+                
+                # Lấy phân tích từ SMC (bấm timeframe/Refresh mới trên cùng message sẽ thay thế yêu cầu này)
+                result = await self.analyze(symbol, timeframe, key=message_key)
+                
+                if result is None:
+                    await query.edit_message_text("❌ Không thể lấy dữ liệu. Vui lòng thử lại sau.")
+                    return
+                
+                # Format message với error handling
+                try:
+                    message = self.format_analysis_message(result)
+                except Exception as e:
+                    logger.error(f"Error formatting message: {e}")
+                    message = f"❌ Lỗi khi format message cho {symbol}\nVui lòng thử lại sau."
+                    await query.edit_message_text(message)
+                    return
+                
+                rendered = self.message_cache.put(symbol, timeframe, MESSAGE_VARIANT,
+                                                  self.render_analysis(symbol, timeframe, result, message))
+            else:
+                # Cache/prefetch hit: phân tích cũ hơn trên cùng message không được ghi đè timeframe này
+                self.cancel_analysis(message_key)
             
-            # Tạo keyboard với nhiều timeframe hơn
-            symbol_encoded = symbol.replace('/', '_')  # BTC/USDT -> BTC_USDT for callback
-            keyboard = [
-                [InlineKeyboardButton("📊 15m", callback_data=f'tf_{symbol_encoded}_15m'),
-                 InlineKeyboardButton("📊 1h", callback_data=f'tf_{symbol_encoded}_1h'),
-                 InlineKeyboardButton("📊 4h", callback_data=f'tf_{symbol_encoded}_4h')],
-                [InlineKeyboardButton("📊 1d", callback_data=f'tf_{symbol_encoded}_1d'),
-                 InlineKeyboardButton("📊 3d", callback_data=f'tf_{symbol_encoded}_3d'),
-                 InlineKeyboardButton("📊 1w", callback_data=f'tf_{symbol_encoded}_1w')],
-                [InlineKeyboardButton("🔄 Refresh", callback_data=f'tf_{symbol_encoded}_{timeframe}'),
-                 InlineKeyboardButton("🏠 Menu", callback_data='start')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # User thường bấm timeframe kề tiếp theo: phân tích sẵn trong nền
+            self.prefetcher.prefetch_adjacent(symbol, timeframe)
             
             # Gửi message với error handling cho markdown
             try:
-                await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-            except Exception as e:
+                await query.edit_message_text(rendered.text, reply_markup=rendered.reply_markup,
+                                              parse_mode=rendered.parse_mode)
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    return  # Refresh trong cùng nến: nội dung không đổi
+                if rendered.parse_mode is None:
+                    raise
                 logger.error(f"Markdown parse error: {e}")
-                # Fallback: gửi message không có markdown
-                plain_message = message.replace('*', '').replace('_', '')
-                await query.edit_message_text(plain_message, reply_markup=reply_markup)
+                # Fallback: gửi message không có markdown, lưu lại bản plain để lần sau không thử Markdown nữa
+                plain_message = rendered.text.replace('*', '').replace('_', '')
+                rendered = self.message_cache.put(symbol, timeframe, MESSAGE_VARIANT, RenderedMessage(
+                    plain_message, rendered.reply_markup, None, rendered.candle_time))
+                await query.edit_message_text(rendered.text, reply_markup=rendered.reply_markup)
         
+        except AnalysisSuperseded:
+            return
         except Exception as e:
             logger.error(f"Error in analysis: {e}")
             error_msg = f"❌ Lỗi khi phân tích {symbol}:\n{str(e)[:100]}..."
@@ -198,6 +317,9 @@ Chọn một tùy chọn bên dưới để bắt đầu:
                 lz_type = latest_lz['type'].replace('_', ' ').title()
                 message += f"   {lz_emoji} Gần nhất: {lz_type}\n"
                 message += f"   📍 Level: ${latest_lz['price']:,.2f}\n"
+                if 'count' in latest_lz:
+                    lz_status = "đã bị quét" if latest_lz['swept'] else "chưa bị quét"
+                    message += f"   👥 {latest_lz['count']} đỉnh/đáy, {lz_status}\n"
             except (KeyError, TypeError, IndexError):
                 print("Dữ liệu LZ không đầy đủ")
 
@@ -399,33 +521,169 @@ Chọn cặp để phân tích:
             symbol = context.args[0].upper()
             timeframe = context.args[1] if len(context.args) > 1 else '4h'
             
-            await update.message.reply_text(f"🔄 Đang phân tích {symbol} {timeframe}...")
+            rendered = self.message_cache.get(symbol, timeframe, MESSAGE_VARIANT)
+            if rendered is None:
+                await update.message.reply_text(f"🔄 Đang phân tích {symbol} {timeframe}...")
+                
+                result = await self.analyze(symbol, timeframe)
+                if not result:
+                    await update.message.reply_text("❌ Không thể phân tích cặp này.")
+                    return
+                rendered = self.message_cache.put(symbol, timeframe, MESSAGE_VARIANT,
+                                                  self.render_analysis(symbol, timeframe, result))
             
-            result = self.smc_analyzer.get_trading_signals(symbol, timeframe)
-            if result:
-                message = self.format_analysis_message(result)
-                await update.message.reply_text(message, parse_mode='Markdown')
-            else:
-                await update.message.reply_text("❌ Không thể phân tích cặp này.")
+            await update.message.reply_text(rendered.text, parse_mode=rendered.parse_mode)
         else:
             await update.message.reply_text("Cách sử dụng: /analysis BTC/USDT 4h")
     
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /search: tìm cặp theo tên, chọn để phân tích"""
+        if not context.args:
+            await update.message.reply_text("Cách sử dụng: /search PEPE")
+            return
+        
+        query = ' '.join(context.args)
+        pairs = self.market_catalog.search(self.smc_analyzer.exchange_name, query, limit=10)
+        if not pairs:
+            await update.message.reply_text(f"❌ Không tìm thấy cặp nào khớp '{query}'.")
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton(pair, callback_data=f'pair_{pair}') for pair in pairs[i:i + 2]]
+            for i in range(0, len(pairs), 2)
+        ]
+        keyboard.append([InlineKeyboardButton("🏠 Menu", callback_data='start')])
+        await update.message.reply_text(f"🔍 Kết quả cho '{query}':", reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def screen_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /screen: top cặp theo độ mạnh signal, vd /screen 4h bullish"""
+        args = [arg.lower() for arg in context.args]
+        trend = next((arg for arg in args if arg in TREND_CODES), None)
+        timeframe = next((arg for arg in args if arg not in TREND_CODES), '4h')
+        if timeframe not in SCREENER_TIMEFRAMES:
+            await update.message.reply_text(f"❌ Timeframe không hỗ trợ: {timeframe}\n"
+                                            f"Chọn một trong: {', '.join(SCREENER_TIMEFRAMES)}")
+            return
+        
+        # Chỉ timeframe hợp lệ mới tạo screener: tối đa len(SCREENER_TIMEFRAMES) screener
+        screener = self.screeners.get(timeframe)
+        if screener is None:
+            screener = self.screeners[timeframe] = UniverseScreener(
+                self.market_catalog, self.smc_analyzer.exchange_name, timeframe, analyzer=self.smc_analyzer)
+        result = screener.screen(k=10, trend=trend)
+        
+        if not result['scored']:
+            await update.message.reply_text("🔄 Đang quét thị trường lần đầu... Vui lòng thử lại sau vài phút.")
+            return
+        if not result['results']:
+            await update.message.reply_text("⏸️ Không có cặp nào khớp bộ lọc.")
+            return
+        
+        message = f"🏆 Top {len(result['results'])} cặp {timeframe}" + (f" ({trend})" if trend else "") + "\n"
+        message += f"Đã quét {result['scored']}/{result['universe']} cặp\n\n"
+        for i, item in enumerate(result['results'], 1):
+            message += (f"{i}. {item['symbol']}: {item['signal_strength']:.1f} - {item['recommendation']} "
+                        f"(RSI {item['rsi']:.0f}, {item['price_change_pct']:+.2f}%)\n")
+        
+        keyboard = [
+            [InlineKeyboardButton(item['symbol'], callback_data=f"tf_{item['symbol'].replace('/', '_')}_{timeframe}")
+             for item in result['results'][i:i + 2]]
+            for i in range(0, len(result['results']), 2)
+        ]
+        await update.message.reply_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /subscribe: nhận alert entry/exit khi nến đóng"""
+        if not context.args:
+            await update.message.reply_text("Cách sử dụng: /subscribe BTC/USDT 4h")
+            return
+        
+        symbol = context.args[0].upper()
+        timeframe = context.args[1] if len(context.args) > 1 else '4h'
+        try:
+            added = self.alert_store.subscribe(update.effective_chat.id, symbol, timeframe)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        await self.alert_store.flush()
+        
+        self.alert_scheduler.changed()
+        if added:
+            await update.message.reply_text(f"🔔 Đã đăng ký alert {symbol} {timeframe}. Bot sẽ báo khi có signal lúc đóng nến.")
+        else:
+            await update.message.reply_text(f"ℹ️ Bạn đã đăng ký alert {symbol} {timeframe} rồi.")
+    
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /unsubscribe [SYMBOL [TIMEFRAME]]"""
+        symbol = context.args[0].upper() if context.args else None
+        timeframe = context.args[1] if len(context.args) > 1 else None
+        removed = self.alert_store.unsubscribe(update.effective_chat.id, symbol, timeframe)
+        await self.alert_store.flush()
+        await update.message.reply_text(f"🔕 Đã hủy {removed} alert." if removed else "ℹ️ Không có alert nào khớp.")
+    
+    async def alerts_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /alerts: liệt kê alert đã đăng ký"""
+        subscriptions = self.alert_store.for_chat(update.effective_chat.id)
+        if not subscriptions:
+            await update.message.reply_text("Chưa có alert nào. Dùng /subscribe BTC/USDT 4h")
+            return
+        lines = [f"• {symbol} {timeframe}" for symbol, timeframe in subscriptions]
+        await update.message.reply_text("🔔 Alert đang đăng ký:\n" + "\n".join(lines))
+    
+    async def send_alert(self, chat_id, message):
+        """Xếp alert vào hàng đợi gửi (gọi từ AlertScheduler), không chờ Telegram"""
+        self.outbound.send_message(chat_id, message, parse_mode='Markdown')
+    
+    async def post_init(self, application):
+        """Khởi động hàng đợi gửi và scheduler alert trong event loop của bot"""
+        self.outbound = OutboundQueue(
+            application.bot,
+            global_rate=float(os.getenv('SMC_TELEGRAM_GLOBAL_RATE', '28')),
+            chat_rate=float(os.getenv('SMC_TELEGRAM_CHAT_RATE', '1')),
+        )
+        self.outbound.start()
+        application.create_task(self.alert_scheduler.run())
+        startup_report.mark('serving')
+        startup_report.log()
+    
     def run(self):
         """Chạy bot"""
+        with startup_report.phase('load snapshot'):
+            self.warm_state.load()
+        self.warm_state.start()
+        
         # Tạo application
-        self.application = Application.builder().token(self.token).build()
+        # Xử lý update đồng thời (tối đa BOT_CONCURRENT_UPDATES), tuần tự trong từng chat:
+        # phân tích chạy trên worker pool nên một user chờ không chặn user khác
+        builder = Application.builder().token(self.token).concurrent_updates(
+            PerChatUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        if os.getenv('TELEGRAM_BASE_URL'):
+            # Ví dụ fake_bot_api.py: http://127.0.0.1:8081/bot
+            builder = builder.base_url(os.getenv('TELEGRAM_BASE_URL'))
+        with startup_report.phase('build application'):
+            self.application = builder.post_init(self.post_init).build()
         
         # Thêm handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("analysis", self.analysis_command))
+        self.application.add_handler(CommandHandler("search", self.search_command))
+        self.application.add_handler(CommandHandler("screen", self.screen_command))
+        self.application.add_handler(CommandHandler("subscribe", self.subscribe_command))
+        self.application.add_handler(CommandHandler("unsubscribe", self.unsubscribe_command))
+        self.application.add_handler(CommandHandler("alerts", self.alerts_command))
         self.application.add_handler(CallbackQueryHandler(self.button_handler))
         
         # Chạy bot
+        if BOT_MODE == 'webhook':
+            asyncio.run(serve_webhook(self.application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                                      WEBHOOK_URL, WEBHOOK_SECRET))
+            return
         print("🤖 Bot đang chạy...")
         self.application.run_polling()
 
 if __name__ == "__main__":
     # Thay YOUR_BOT_TOKEN bằng token thực của bot
     BOT_TOKEN = "8213040530:AAH8oDArhEH75ORttMobEaz6L6lR9CbR53s"
+    startup_report.mark('imports')
     bot = TradingBot(BOT_TOKEN)
     bot.run()
@@ -0,0 +1,34 @@
+import numpy as np
+
+import app
+from ohlcv import OHLCV
+
+
+def fake_market_data(symbol, timeframe, limit):
+    timestamp = 1_600_000_000_000 + np.arange(3, dtype=np.int64) * 3_600_000
+    return OHLCV(timestamp, np.full((5, 3), float(len(symbol))))
+
+
+def test_chart_cache_size_stays_capped(monkeypatch):
+    monkeypatch.setattr(app.smc_analyzer, 'get_market_data', fake_market_data)
+    monkeypatch.setattr(app, 'CHART_CACHE_MAX_ENTRIES', 5)
+    monkeypatch.setattr(app, 'chart_cache', app.OrderedDict())
+
+    for i in range(50):
+        candles, etag = app.get_chart_candles(f'FAKE{i}/USDT', '1h')
+        assert candles is not None and etag
+        assert len(app.chart_cache) <= 5
+    assert list(app.chart_cache) == [(f'FAKE{i}/USDT', '1h') for i in range(45, 50)]
+
+
+def test_expired_chart_entries_are_evicted(monkeypatch):
+    monkeypatch.setattr(app.smc_analyzer, 'get_market_data', fake_market_data)
+    monkeypatch.setattr(app, 'chart_cache', app.OrderedDict())
+    clock = [1000.0]
+    monkeypatch.setattr(app.time, 'time', lambda: clock[0])
+
+    app.get_chart_candles('A/USDT', '1h')
+    app.get_chart_candles('B/USDT', '1h')
+    clock[0] += app.CHART_CACHE_TTL + 1
+    app.get_chart_candles('C/USDT', '1h')
+    assert list(app.chart_cache) == [('C/USDT', '1h')]
@@ -0,0 +1,99 @@
+import numpy as np
+
+from correlation import ReturnCorrelation
+from ohlcv import OHLCV
+
+TF_MS = 900_000
+WINDOW = 100
+MIN_PERIODS = 30
+
+
+def make_universe(n=24, length=320, seed=1):
+    """Giá log-return theo một yếu tố thị trường chung; vài cặp niêm yết muộn, ~2% nến bị thiếu"""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.01, length)
+    returns = market[:, None] * rng.uniform(0, 1.5, n) + rng.normal(0, 0.01, (length, n))
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    start = np.zeros(n, dtype=int)
+    start[:4] = rng.integers(150, 260, 4)
+    missing = rng.random((length, n)) < 0.02
+    timestamp = np.arange(length, dtype=np.int64) * TF_MS + 10 ** 12
+    return prices, start, missing, timestamp
+
+
+def candles_until(prices, start, missing, timestamp, column, last):
+    rows = np.arange(start[column], last + 1)
+    rows = rows[~missing[rows, column]]
+    close = prices[rows, column]
+    return OHLCV(timestamp[rows], np.vstack([close, close, close, close, np.ones(len(rows))]))
+
+
+def brute_force_matrix(prices, start, missing, last):
+    """Pearson pairwise-complete trên WINDOW return cuối (return chỉ có khi cả hai nến liền nhau đều có)"""
+    n = prices.shape[1]
+    rows = np.arange(last - WINDOW + 1, last + 1)
+    present = (rows[:, None] >= start[None, :]) & ~missing[rows]
+    previous = (rows[:, None] - 1 >= start[None, :]) & ~missing[rows - 1]
+    valid = present & previous
+    returns = np.where(valid, np.log(prices[rows] / prices[rows - 1]), 0.0)
+
+    matrix = np.full((n, n), np.nan)
+    for i in range(n):
+        for j in range(n):
+            both = valid[:, i] & valid[:, j]
+            if both.sum() < MIN_PERIODS:
+                continue
+            x, y = returns[both, i], returns[both, j]
+            if x.std() > 0 and y.std() > 0:
+                matrix[i, j] = np.corrcoef(x, y)[0, 1]
+    return matrix
+
+
+def test_matrix_matches_pairwise_complete_pearson():
+    prices, start, missing, timestamp = make_universe()
+    n, length = prices.shape[1], prices.shape[0]
+    symbols = [f'S{j}' for j in range(n)]
+    laggard = 7  # Cặp cập nhật chậm: bỏ lỡ một số vòng, bù lại ở vòng sau
+    correlation = ReturnCorrelation('15m', window=WINDOW, min_periods=MIN_PERIODS, capacity=8)
+
+    checked = 0
+    for last in range(120, length - 1):
+        # Nến `last` vừa đóng, nến last + 1 đang chạy
+        now_ms = int(timestamp[last]) + TF_MS + 1000
+        for column in range(n):
+            if last < start[column] or (column == laggard and last % 17 == 0):
+                continue
+            candles = candles_until(prices, start, missing, timestamp, column, last + 1)
+            correlation.update(symbols[column], candles, now_ms=now_ms)
+        correlation.advance()
+
+        if last % 29 == 0 or last == length - 2:
+            assert correlation.grid_end == timestamp[last]
+            _, matrix = correlation.matrix(symbols)
+            expected = brute_force_matrix(prices, start, missing, last)
+            np.testing.assert_array_equal(np.isnan(matrix), np.isnan(expected))
+            np.testing.assert_allclose(np.nan_to_num(matrix), np.nan_to_num(expected), atol=1e-9)
+            checked += 1
+    assert checked >= 5
+
+
+def test_top_pairs_and_clusters_follow_matrix():
+    prices, start, missing, timestamp = make_universe(n=10, length=200, seed=3)
+    symbols = [f'S{j}' for j in range(10)]
+    correlation = ReturnCorrelation('15m', window=WINDOW, min_periods=MIN_PERIODS)
+    last = prices.shape[0] - 2
+    for column in range(10):
+        if last >= start[column]:
+            correlation.update(symbols[column], candles_until(prices, start, missing, timestamp, column, last + 1),
+                               now_ms=int(timestamp[last]) + TF_MS + 1000)
+    correlation.advance()
+
+    names, matrix = correlation.matrix(symbols)
+    pairs = correlation.top_pairs(k=5)
+    values = [pair['correlation'] for pair in pairs]
+    assert values == sorted(values, reverse=True)
+    best = np.nanmax(np.where(np.eye(len(names), dtype=bool), np.nan, matrix))
+    assert np.isclose(values[0], best)
+
+    for cluster in correlation.clusters(threshold=0.6):
+        assert cluster['size'] >= 2
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from AdvancedSMC import SMC_FEATURE_COLUMNS, AdvancedSMC, analyze_smc_features, compute_smc_features
+from ohlcv import OHLCV
+
+
+def reference_smc_features(df, swing_lookback=20):
+    """analyze_smc_features bản pandas gốc (trước khi chuyển sang numpy), giữ nguyên logic để so sánh"""
+    df['swing_high'] = df['high'].rolling(window=swing_lookback*2+1, center=True).max() == df['high']
+    df['swing_low'] = df['low'].rolling(window=swing_lookback*2+1, center=True).min() == df['low']
+
+    last_swing_high = np.nan
+    last_swing_low = np.nan
+    trend = 0
+    bos_choch = []
+    for i in range(len(df)):
+        current_high = df['high'].iloc[i]
+        current_low = df['low'].iloc[i]
+        signal = 0
+        if df['swing_high'].iloc[i]:
+            last_swing_high = current_high
+        if df['swing_low'].iloc[i]:
+            last_swing_low = current_low
+
+        if trend == 1 and not np.isnan(last_swing_low) and current_low < last_swing_low:
+            signal, trend, last_swing_high = -2, -1, np.nan
+        elif trend == -1 and not np.isnan(last_swing_high) and current_high > last_swing_high:
+            signal, trend, last_swing_low = 2, 1, np.nan
+        elif not np.isnan(last_swing_high) and current_high > last_swing_high:
+            signal, trend, last_swing_low = 1, 1, np.nan
+        elif not np.isnan(last_swing_low) and current_low < last_swing_low:
+            signal, trend, last_swing_high = -1, -1, np.nan
+        bos_choch.append(signal)
+
+    df['bos_choch_signal'] = bos_choch
+    df['BOS'] = df['bos_choch_signal'].apply(lambda x: 1 if x == 1 else (-1 if x == -1 else 0))
+    df['CHOCH'] = df['bos_choch_signal'].apply(lambda x: 1 if x == 2 else (-1 if x == -2 else 0))
+
+    df['OB'] = 0
+    df['Top_OB'] = np.nan
+    df['Bottom_OB'] = np.nan
+    for i in range(1, len(df)):
+        if df['bos_choch_signal'].iloc[i] in [1, 2]:
+            for j in range(i - 1, max(0, i - 10), -1):
+                if df['close'].iloc[j] < df['open'].iloc[j]:
+                    df.loc[df.index[j], ['OB', 'Top_OB', 'Bottom_OB']] = [1, df['high'].iloc[j], df['low'].iloc[j]]
+                    break
+        elif df['bos_choch_signal'].iloc[i] in [-1, -2]:
+            for j in range(i - 1, max(0, i - 10), -1):
+                if df['close'].iloc[j] > df['open'].iloc[j]:
+                    df.loc[df.index[j], ['OB', 'Top_OB', 'Bottom_OB']] = [-1, df['high'].iloc[j], df['low'].iloc[j]]
+                    break
+
+    df['FVG'] = 0
+    df['Top_FVG'] = np.nan
+    df['Bottom_FVG'] = np.nan
+    for i in range(2, len(df)):
+        if df['low'].iloc[i-2] > df['high'].iloc[i]:
+            df.loc[df.index[i-1], ['FVG', 'Top_FVG', 'Bottom_FVG']] = [1, df['low'].iloc[i-2], df['high'].iloc[i]]
+        elif df['high'].iloc[i-2] < df['low'].iloc[i]:
+            df.loc[df.index[i-1], ['FVG', 'Top_FVG', 'Bottom_FVG']] = [-1, df['high'].iloc[i-2], df['low'].iloc[i]]
+
+    df['Swept'] = 0
+    recent_high = df['high'].rolling(5).max().shift(1)
+    recent_low = df['low'].rolling(5).min().shift(1)
+    df.loc[(df['high'] > recent_high) & (df['close'] < recent_high), 'Swept'] = -1
+    df.loc[(df['low'] < recent_low) & (df['close'] > recent_low), 'Swept'] = 1
+    return df
+
+
+def reference_signals(df):
+    """populate_entry_trend_simple + populate_exit_trend + extract_* bản pandas gốc"""
+    in_ob = (df['low'] <= df['Top_OB']) & (df['high'] >= df['Bottom_OB'])
+    in_fvg = (df['low'] <= df['Top_FVG']) & (df['high'] >= df['Bottom_FVG'])
+    long = (df['BOS'] == 1) & (df['Swept'] == 1) & ((in_ob & (df['OB'] == 1)) | (in_fvg & (df['FVG'] == 1)))
+    short = (df['BOS'] == -1) & (df['Swept'] == -1) & ((in_ob & (df['OB'] == -1)) | (in_fvg & (df['FVG'] == -1)))
+    df['enter_long'] = long.astype(int)
+    df['enter_short'] = short.astype(int)
+    df['enter_tag'] = ''
+    df.loc[long, 'enter_tag'] = 'long_smc_simple'
+    df.loc[short, 'enter_tag'] = 'short_smc_simple'
+    df['exit_long'] = (df['CHOCH'] == -1).astype(int)
+    df['exit_short'] = (df['CHOCH'] == 1).astype(int)
+
+    times = [int(ts.timestamp()) for ts in df['timestamp']]
+    rows = list(zip(times, df.itertuples(index=False)))
+    order_blocks = [{'type': 'bullish_ob' if row.OB == 1 else 'bearish_ob', 'high': row.Top_OB,
+                     'low': row.Bottom_OB, 'time': time, 'strength': 'high'}
+                    for time, row in rows if row.OB != 0][-10:]
+    fair_value_gaps = [{'type': 'bullish_fvg' if row.FVG == 1 else 'bearish_fvg', 'top': row.Top_FVG,
+                        'bottom': row.Bottom_FVG, 'time': time, 'filled': False}
+                       for time, row in rows if row.FVG != 0][-20:]
+    break_of_structure = [{'type': 'bullish_bos' if row.BOS == 1 else 'bearish_bos', 'price': row.close,
+                           'time': time, 'strength': 'confirmed'}
+                          for time, row in rows if row.BOS != 0][-10:]
+    trading_signals = {
+        'entry_long': [{'time': time, 'price': row.close, 'tag': row.enter_tag}
+                       for time, row in rows[-50:] if row.enter_long == 1],
+        'entry_short': [{'time': time, 'price': row.close, 'tag': row.enter_tag}
+                        for time, row in rows[-50:] if row.enter_short == 1],
+        'exit_long': [{'time': time, 'price': row.close} for time, row in rows[-50:] if row.exit_long == 1],
+        'exit_short': [{'time': time, 'price': row.close} for time, row in rows[-50:] if row.exit_short == 1],
+    }
+    return {'order_blocks': order_blocks, 'fair_value_gaps': fair_value_gaps,
+            'break_of_structure': break_of_structure, 'trading_signals': trading_signals}
+
+
+def make_candles(n, seed):
+    """Random walk làm tròn tới 0.5 để có nhiều đỉnh/đáy bằng nhau (trường hợp rolling max hòa)"""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 1, n)) * 2) / 2
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) + np.round(rng.exponential(0.6, n) * 2) / 2
+    low = np.minimum(open_, close) - np.round(rng.exponential(0.6, n) * 2) / 2
+    timestamp = 1_600_000_000_000 + np.arange(n, dtype=np.int64) * 3_600_000
+    return OHLCV(timestamp, np.vstack([open_, high, low, close, rng.uniform(1, 10, n)]))
+
+
+def reference_frame(candles, swing_lookback):
+    return reference_smc_features(candles.to_frame().copy(), swing_lookback)
+
+
+def assert_columns_equal(features, df, columns, suffix=''):
+    for column in columns:
+        actual = np.asarray(features[f'{column}{suffix}'], dtype=np.float64)
+        expected = df[column].to_numpy(dtype=np.float64)
+        np.testing.assert_array_equal(actual, expected, err_msg=f'{column}{suffix}')
+
+
+@pytest.mark.parametrize('swing_lookback', [20, 5, 3])
+@pytest.mark.parametrize('n,seed', [(400, 1), (400, 2), (60, 3), (41, 4), (7, 5), (2, 6)])
+def test_features_match_pandas_reference(swing_lookback, n, seed):
+    candles = make_candles(n, seed)
+    features = compute_smc_features(candles, swing_lookback)
+    assert_columns_equal(features, reference_frame(candles, swing_lookback), SMC_FEATURE_COLUMNS)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_multi_scale_columns_match_single_scale(seed):
+    candles = make_candles(300, seed)
+    features = compute_smc_features(candles, 20, structure_lookbacks=(5, 3))
+    assert_columns_equal(features, reference_frame(candles, 20), SMC_FEATURE_COLUMNS)
+    for lookback in (5, 3):
+        expected = reference_frame(candles, lookback)
+        assert_columns_equal(features, expected, ('swing_high', 'swing_low', 'bos_choch_signal', 'BOS', 'CHOCH'),
+                             suffix=f'_{lookback}')
+
+
+# 14, 31, 47: có entry long; 37, 61: có entry short trong 50 nến cuối
+@pytest.mark.parametrize('seed', [10, 11, 12, 14, 31, 37, 47, 61])
+def test_structure_outputs_match_pandas_reference(seed):
+    candles = make_candles(400, seed)
+    expected = reference_signals(reference_frame(candles, 20))
+    actual = AdvancedSMC().analyze_smc_structure(candles)
+    for section in ('order_blocks', 'fair_value_gaps', 'break_of_structure', 'trading_signals'):
+        assert actual[section] == expected[section], section
+
+
+def test_pandas_entry_point_matches():
+    candles = make_candles(300, 21)
+    df = analyze_smc_features(candles.to_frame().copy())
+    pd.testing.assert_frame_equal(df[list(SMC_FEATURE_COLUMNS)].astype(float),
+                                  reference_frame(candles, 20)[list(SMC_FEATURE_COLUMNS)].astype(float))
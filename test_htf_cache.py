@@ -0,0 +1,35 @@
+import numpy as np
+
+from craw_data import timeframe_to_ms
+from htf_cache import HTFFeatureCache
+from ohlcv import OHLCV
+
+H4_MS = timeframe_to_ms('4h')
+CLOSE_MS = 1_600_000_000_000 // H4_MS * H4_MS + 10 * H4_MS  # Một mốc đóng nến 4h
+
+
+class Features:
+    def __init__(self, last_open_ms, n=5):
+        timestamp = last_open_ms - np.arange(n - 1, -1, -1, dtype=np.int64) * H4_MS
+        self.candles = OHLCV(timestamp, np.ones((5, n)))
+
+
+def test_entry_expires_at_close_of_last_analysed_candle():
+    cache = HTFFeatureCache()
+    features = Features(CLOSE_MS - H4_MS)  # Nến đang chạy đóng tại CLOSE_MS
+    cache.put('BTC/USDT', '4h', features, now_ms=CLOSE_MS - 60_000)
+    assert cache.get('BTC/USDT', '4h', now_ms=CLOSE_MS - 1) is features
+    assert cache.get('BTC/USDT', '4h', now_ms=CLOSE_MS) is None
+
+
+def test_data_from_before_close_is_not_cached_past_it():
+    # Fetch bắt đầu trước giờ đóng nến, put ngay sau đó: không được giữ tới lần đóng kế tiếp
+    cache = HTFFeatureCache()
+    features = Features(CLOSE_MS - H4_MS)
+    assert cache.put('BTC/USDT', '4h', features, now_ms=CLOSE_MS + 500) is features
+    assert cache.get('BTC/USDT', '4h', now_ms=CLOSE_MS + 1000) is None
+    assert cache.stats()['entries'] == 0
+
+    fresh = Features(CLOSE_MS)
+    cache.put('BTC/USDT', '4h', fresh, now_ms=CLOSE_MS + 2000)
+    assert cache.get('BTC/USDT', '4h', now_ms=CLOSE_MS + H4_MS - 1) is fresh
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from liquidity import average_true_range, detect_liquidity_pools
+from rangeq import RangeMax
+
+HOUR_MS = 3_600_000
+
+
+def brute_force_pools(timestamp, high, low, swing_high, swing_low, close=None, atr_mult=0.1, pct=None):
+    """Gom pool bằng vòng lặp trực tiếp: cùng quy tắc với detect_liquidity_pools, không dùng RangeMax"""
+    atr = average_true_range(high, low, close) if pct is None else None
+    pools = []
+    for kind, flags, extremes in (('buy_side_liquidity', swing_high, high),
+                                  ('sell_side_liquidity', swing_low, -low)):
+        points = sorted((extremes[i], i) for i in np.flatnonzero(flags))
+        groups = []
+        for price, position in points:
+            if groups:
+                anchor_price, anchor_position = groups[-1][0]
+                limit = abs(anchor_price) * pct if pct is not None else atr[anchor_position] * atr_mult
+                if price - anchor_price <= limit:
+                    groups[-1].append((price, position))
+                    continue
+            groups.append([(price, position)])
+
+        for group in groups:
+            members = sorted(position for _, position in group)
+            current, top = [members[0]], extremes[members[0]]
+            for previous, position in zip(members, members[1:]):
+                # Giá vượt đỉnh pool giữa hai lần chạm: pool cũ đã bị quét, lần chạm sau mở pool mới
+                if any(extremes[k] > top for k in range(previous + 1, position)):
+                    pools.append((kind, current, top, extremes))
+                    current, top = [position], extremes[position]
+                else:
+                    current.append(position)
+                    top = max(top, extremes[position])
+            pools.append((kind, current, top, extremes))
+
+    result = []
+    for kind, members, top, extremes in pools:
+        last = members[-1]
+        swept_at = next((k for k in range(last + 1, len(extremes)) if extremes[k] > top), None)
+        bottom = min(extremes[k] for k in members)
+        level, other = (top, bottom) if kind == 'buy_side_liquidity' else (-top, -bottom)
+        result.append((last, {
+            'type': kind,
+            'price': float(level),
+            'top': float(max(level, other)),
+            'bottom': float(min(level, other)),
+            'count': len(members),
+            'time': int(timestamp[last] // 1000),
+            'first_time': int(timestamp[members[0]] // 1000),
+            'span': int(timestamp[last] // 1000) - int(timestamp[members[0]] // 1000),
+            'swept': swept_at is not None,
+            'swept_time': int(timestamp[swept_at] // 1000) if swept_at is not None else None,
+        }))
+    result.sort(key=lambda item: item[0])
+    return [pool for _, pool in result]
+
+
+def make_series(n, seed, swing_rate=0.2):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    high = close + rng.exponential(0.5, n)
+    low = close - rng.exponential(0.5, n)
+    # Làm tròn để có nhiều đỉnh/đáy bằng nhau hoặc sát nhau
+    high, low = np.round(high * 4) / 4, np.round(low * 4) / 4
+    timestamp = 1_600_000_000_000 + np.arange(n, dtype=np.int64) * HOUR_MS
+    return timestamp, high, low, close, rng.random(n) < swing_rate, rng.random(n) < swing_rate
+
+
+def candles_from_highs(highs, lows=None):
+    high = np.asarray(highs, dtype=np.float64)
+    low = np.asarray(lows, dtype=np.float64) if lows is not None else high - 1
+    timestamp = 1_600_000_000_000 + np.arange(len(high), dtype=np.int64) * HOUR_MS
+    return timestamp, high, low
+
+
+def test_range_max_matches_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=57)
+    range_max = RangeMax(values)
+    left, right = rng.integers(0, 57, 500), rng.integers(0, 57, 500)
+    expected = [values[a:b + 1].max() if b >= a else -np.inf for a, b in zip(left, right)]
+    np.testing.assert_array_equal(range_max.query(left, right), expected)
+
+    start, threshold = rng.integers(0, 57, 300), rng.normal(size=300)
+    expected = [next((k for k in range(a, 57) if values[k] > t), -1) for a, t in zip(start, threshold)]
+    np.testing.assert_array_equal(range_max.first_above(start, threshold), expected)
+
+
+@pytest.mark.parametrize('seed', range(8))
+@pytest.mark.parametrize('pct', [None, 0.002, 0.01])
+def test_pools_match_brute_force(seed, pct):
+    timestamp, high, low, close, swing_high, swing_low = make_series(300, seed)
+    actual = detect_liquidity_pools(timestamp, high, low, swing_high, swing_low, close=close, pct=pct)
+    expected = brute_force_pools(timestamp, high, low, swing_high, swing_low, close=close, pct=pct)
+    assert actual == expected
+
+
+def test_equal_highs_within_tolerance_form_one_pool():
+    timestamp, high, low = candles_from_highs([100, 95, 100.05, 94, 99.98, 93, 101.5])
+    swing_high = np.array([True, False, True, False, True, False, False])
+    pools = detect_liquidity_pools(timestamp, high, low, swing_high, np.zeros(7, bool), pct=0.001)
+
+    assert len(pools) == 1
+    pool = pools[0]
+    assert pool['type'] == 'buy_side_liquidity'
+    assert pool['count'] == 3
+    assert pool['price'] == 100.05 and pool['top'] == 100.05 and pool['bottom'] == 99.98
+    assert pool['first_time'] == timestamp[0] // 1000 and pool['time'] == timestamp[4] // 1000
+    # Nến cuối vượt đỉnh pool: thanh khoản đã bị quét
+    assert pool['swept'] and pool['swept_time'] == timestamp[6] // 1000
+
+
+def test_highs_outside_tolerance_stay_separate():
+    timestamp, high, low = candles_from_highs([100, 95, 100.5, 94])
+    swing_high = np.array([True, False, True, False])
+    pools = detect_liquidity_pools(timestamp, high, low, swing_high, np.zeros(4, bool), pct=0.001)
+    assert [pool['count'] for pool in pools] == [1, 1]
+    # Đỉnh 100.5 quét đỉnh 100 trước đó
+    assert pools[0]['price'] == 100 and pools[0]['swept']
+    assert pools[1]['price'] == 100.5 and not pools[1]['swept']
+
+
+def test_sweep_between_touches_invalidates_pool():
+    # Hai đỉnh 100 bằng nhau nhưng nến giữa vượt lên 100.4: pool đầu đã bị quét, lần chạm sau mở pool mới
+    timestamp, high, low = candles_from_highs([100, 95, 100.4, 96, 100, 97])
+    swing_high = np.array([True, False, False, False, True, False])
+    pools = detect_liquidity_pools(timestamp, high, low, swing_high, np.zeros(6, bool), pct=0.001)
+    assert [pool['count'] for pool in pools] == [1, 1]
+    assert pools[0]['swept'] and pools[0]['swept_time'] == timestamp[2] // 1000
+    assert not pools[1]['swept']
+
+
+def test_equal_lows_mirror_highs():
+    lows = [90, 95, 90.05, 96, 89.5]
+    timestamp, high, low = candles_from_highs(np.array(lows) + 1, lows)
+    swing_low = np.array([True, False, True, False, False])
+    pools = detect_liquidity_pools(timestamp, high, low, np.zeros(5, bool), swing_low, pct=0.001)
+    assert len(pools) == 1
+    pool = pools[0]
+    assert pool['type'] == 'sell_side_liquidity'
+    assert pool['count'] == 2
+    assert pool['price'] == 90 and pool['bottom'] == 90 and pool['top'] == 90.05
+    assert pool['swept'] and pool['swept_time'] == timestamp[4] // 1000
+
+
+def test_no_swings_and_missing_close():
+    timestamp, high, low = candles_from_highs([1, 2, 3])
+    assert detect_liquidity_pools(timestamp, high, low, np.zeros(3, bool), np.zeros(3, bool), pct=0.01) == []
+    with pytest.raises(ValueError):
+        detect_liquidity_pools(timestamp, high, low, np.zeros(3, bool), np.zeros(3, bool))
@@ -0,0 +1,20 @@
+from snapshot import AnalysisResultStore
+
+NOW = 1_600_000_000  # giây
+
+
+def test_unknown_timeframe_is_a_miss():
+    store = AnalysisResultStore()
+    assert store.get('BTC/USDT', '7x', now=NOW) == (None, False)
+    store.put('BTC/USDT', '7x', {'timestamp': NOW}, computed_at=NOW)
+    assert store.get('BTC/USDT', '7x', now=NOW) == (None, False)
+    assert store.dump() == []
+
+
+def test_result_expires_when_candle_closes():
+    store = AnalysisResultStore(max_age=30)
+    result = {'timestamp': NOW}
+    store.put('BTC/USDT', '1h', result, computed_at=NOW)
+    assert store.get('BTC/USDT', '1h', now=NOW + 10) == (result, True)
+    assert store.get('BTC/USDT', '1h', now=NOW + 60) == (result, False)
+    assert store.get('BTC/USDT', '1h', now=NOW + 3600) == (None, False)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from AdvancedSMC import AdvancedSMC
+from ohlcv import OHLCV
+from structure import compute_structure, swing_pivots
+
+NAMES = {1: 'bullish_bos', -1: 'bearish_bos', 2: 'bullish_choch', -2: 'bearish_choch'}
+
+
+def reference_structure(high, low, lookback):
+    """Một scale, duyệt từng nến: pivot = max/min của cửa sổ đối xứng 2*lookback+1 (như rolling center)"""
+    n = len(high)
+    swing_high = np.zeros(n, dtype=bool)
+    swing_low = np.zeros(n, dtype=bool)
+    for i in range(lookback, n - lookback):
+        swing_high[i] = high[i - lookback:i + lookback + 1].max() == high[i]
+        swing_low[i] = low[i - lookback:i + lookback + 1].min() == low[i]
+
+    signal = np.zeros(n, dtype=np.int8)
+    last_high = last_low = None
+    trend = 0
+    for i in range(n):
+        if swing_high[i]:
+            last_high = high[i]
+        if swing_low[i]:
+            last_low = low[i]
+        if trend == 1 and last_low is not None and low[i] < last_low:
+            signal[i], trend, last_high = -2, -1, None
+        elif trend == -1 and last_high is not None and high[i] > last_high:
+            signal[i], trend, last_low = 2, 1, None
+        elif last_high is not None and high[i] > last_high:
+            signal[i], trend, last_low = 1, 1, None
+        elif last_low is not None and low[i] < last_low:
+            signal[i], trend, last_high = -1, -1, None
+    return swing_high, swing_low, signal
+
+
+def make_prices(n, seed):
+    """Random walk làm tròn tới 0.25: nhiều đỉnh/đáy bằng nhau (pivot hòa ở mọi scale)"""
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    high = np.round((close + rng.exponential(0.5, n)) * 4) / 4
+    low = np.round((close - rng.exponential(0.5, n)) * 4) / 4
+    return high, low
+
+
+@pytest.mark.parametrize('lookbacks', [(20,), (5, 20), (3, 5, 20), (2, 3, 5, 8, 13, 20)])
+@pytest.mark.parametrize('n,seed', [(500, 1), (500, 2), (120, 3), (41, 4), (11, 5), (3, 6), (0, 7)])
+def test_multi_scale_matches_single_scale_reference(lookbacks, n, seed):
+    high, low = make_prices(n, seed)
+    structure = compute_structure(high, low, lookbacks)
+    assert sorted(structure) == sorted(lookbacks)
+    for lookback in lookbacks:
+        swing_high, swing_low, signal = reference_structure(high, low, lookback)
+        np.testing.assert_array_equal(structure[lookback]['swing_high'], swing_high, err_msg=f'{lookback}')
+        np.testing.assert_array_equal(structure[lookback]['swing_low'], swing_low, err_msg=f'{lookback}')
+        np.testing.assert_array_equal(structure[lookback]['bos_choch_signal'], signal, err_msg=f'{lookback}')
+
+
+def test_hierarchical_pivots_match_independent_scales():
+    high, low = make_prices(800, 11)
+    combined = swing_pivots(high, low, (3, 5, 20))
+    for lookback in (3, 5, 20):
+        alone = swing_pivots(high, low, (lookback,))[lookback]
+        np.testing.assert_array_equal(combined[lookback][0], alone[0])
+        np.testing.assert_array_equal(combined[lookback][1], alone[1])
+
+
+def test_internal_and_external_structure_in_analysis():
+    high, low = make_prices(300, 12)
+    close = (high + low) / 2
+    timestamp = 1_600_000_000_000 + np.arange(300, dtype=np.int64) * 3_600_000
+    candles = OHLCV(timestamp, np.vstack([close, high, low, close, np.ones(300)]))
+
+    analyzer = AdvancedSMC()
+    analyzer.structure_lookbacks = (5,)
+    result = analyzer.analyze_smc_structure(candles)
+
+    _, _, internal = reference_structure(high, low, 5)
+    expected = [{'type': NAMES[int(internal[i])], 'price': float(close[i]), 'time': int(timestamp[i] // 1000),
+                 'lookback': 5} for i in np.flatnonzero(internal)[-10:]]
+    assert len(expected) == 10
+    assert result['internal_structure'] == expected
+
+    _, _, external = reference_structure(high, low, 20)
+    bos = np.flatnonzero(np.abs(external) == 1)[-10:]
+    assert [item['time'] for item in result['break_of_structure']] == [int(timestamp[i] // 1000) for i in bos]